@@ -0,0 +1,89 @@
+"""
+Compares the two ways of converting a cached stockholm file to classic HSSP:
+
+ * subprocess: decompress the file into memory, write it to a temporary file,
+   run hsspconv on it and capture its output (the old _stockholm_to_hssp).
+ * streaming: let hsspconv read the cached file and stream its output to
+   a bzip2 compressed file in chunks (_stream_stockholm_to_hssp), as the
+   stockholm cache derives its HSSP files.
+
+Both return the sha256 of the output, so that they can be compared without
+keeping the streamed output in memory.
+
+Requires hsspconv on the PATH.
+
+Example:
+
+    python benchmarks/hsspconv.py /srv/hssp3/<md5>.sto.bz2 -n 5
+"""
+
+import argparse
+import bz2
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xssp_api.tasks import _stream_stockholm_to_hssp  # noqa: E402
+
+
+def convert_subprocess(stockholm_path):
+    with bz2.open(stockholm_path, 'rt') as f:
+        stockholm_content = f.read()
+
+    tmp_file, tmp_path = tempfile.mkstemp(suffix='.hssp')
+    os.close(tmp_file)
+    try:
+        with open(tmp_path, 'wt') as f:
+            f.write(stockholm_content)
+
+        p = subprocess.run(['hsspconv', '-i', tmp_path], capture_output=True,
+                           text=True, check=True)
+        return hashlib.sha256(p.stdout.encode('utf-8')).hexdigest()
+    finally:
+        os.remove(tmp_path)
+
+
+def convert_streaming(stockholm_path):
+    h = hashlib.sha256()
+    with tempfile.TemporaryFile() as tmp, bz2.open(tmp, 'wt') as f:
+        for chunk in _stream_stockholm_to_hssp(stockholm_path):
+            f.write(chunk)
+            h.update(chunk.encode('utf-8'))
+    return h.hexdigest()
+
+
+def measure(convert, stockholm_path, n):
+    times = []
+    peaks = []
+    for _ in range(n):
+        tracemalloc.start()
+        start = time.perf_counter()
+        output = convert(stockholm_path)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return output, min(times), max(peaks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark hsspconv calls')
+    parser.add_argument('stockholm_path')
+    parser.add_argument('-n', type=int, default=5)
+    args = parser.parse_args()
+
+    outputs = []
+    for name, convert in [('subprocess', convert_subprocess),
+                          ('streaming', convert_streaming)]:
+        output, best, peak = measure(convert, args.stockholm_path, args.n)
+        outputs.append(output)
+        print("{:<12} best {:8.3f} s   peak python memory {:8.1f} MB".format(
+            name, best, peak / 1024.0 / 1024.0))
+
+    print("identical output: {}".format(outputs[0] == outputs[1]))
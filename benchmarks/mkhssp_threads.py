@@ -0,0 +1,99 @@
+"""
+Simulates a mkhssp node under the 'fixed' and the 'adaptive' thread
+policies (MKHSSP_THREAD_POLICY) and reports throughput and latency.
+
+Jobs arrive at random, at a rate that keeps the given fraction of the
+node's cores busy with single-threaded jobs. A job's single-threaded
+runtime is drawn from a lognormal distribution, and its runtime with n
+threads follows Amdahl's law with the given serial fraction. The node runs
+at most --workers jobs at a time (celery's -c) and shares --budget threads
+between them (MKHSSP_THREAD_BUDGET).
+
+Example:
+
+    python benchmarks/mkhssp_threads.py --load 0.3 0.7 0.95
+"""
+
+import argparse
+import heapq
+import math
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xssp_api.controllers.threads import choose_threads  # noqa: E402
+
+
+def simulate(policy, load, args):
+    rng = random.Random(args.seed)
+    arrival_rate = load * args.budget / args.mean_runtime
+
+    # Lognormal runtimes with the given mean.
+    sigma = 1.0
+    mu = math.log(args.mean_runtime) - sigma ** 2 / 2
+
+    jobs = []
+    t = 0.0
+    for _ in range(args.jobs):
+        t += rng.expovariate(arrival_rate)
+        jobs.append((t, rng.lognormvariate(mu, sigma)))
+
+    queue = []
+    running = []  # heap of (finish time, threads)
+    used = 0
+    latencies = []
+    next_job = 0
+    now = 0.0
+    while next_job < len(jobs) or queue or running:
+        next_arrival = jobs[next_job][0] if next_job < len(jobs) else None
+        next_finish = running[0][0] if running else None
+        if next_finish is not None and \
+                (next_arrival is None or next_finish <= next_arrival):
+            now, threads = heapq.heappop(running)
+            used -= threads
+        else:
+            now = next_arrival
+            queue.append(jobs[next_job])
+            next_job += 1
+
+        while queue and len(running) < args.workers:
+            arrival, runtime = queue.pop(0)
+            free = args.budget - used
+            threads = choose_threads(policy, len(queue), free,
+                                     args.max_threads)
+            threads = max(1, min(threads, free))
+            used += threads
+
+            duration = runtime * (args.serial_fraction +
+                                  (1 - args.serial_fraction) / threads)
+            heapq.heappush(running, (now + duration, threads))
+            latencies.append(now + duration - arrival)
+
+    return {'throughput': len(jobs) / now * 3600,
+            'mean': statistics.mean(latencies),
+            'p95': sorted(latencies)[int(len(latencies) * 0.95)]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulate mkhssp threads')
+    parser.add_argument('--load', type=float, nargs='+', default=[0.3, 0.9])
+    parser.add_argument('--jobs', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=20)
+    parser.add_argument('--budget', type=int, default=20)
+    parser.add_argument('--max-threads', type=int, default=8)
+    parser.add_argument('--mean-runtime', type=float, default=600.0,
+                        help='mean single-threaded runtime in seconds')
+    parser.add_argument('--serial-fraction', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print("{:>6} {:<10} {:>14} {:>14} {:>14}".format(
+        'load', 'policy', 'jobs/hour', 'mean latency', 'p95 latency'))
+    for load in args.load:
+        for policy in ['fixed', 'adaptive']:
+            r = simulate(policy, load, args)
+            print("{:>6.2f} {:<10} {:>14.1f} {:>13.0f}s {:>13.0f}s".format(
+                load, policy, r['throughput'], r['mean'], r['p95']))
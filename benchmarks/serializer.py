@@ -0,0 +1,96 @@
+"""
+Compares the celery result serializers on real DSSP/HSSP outputs:
+
+ * pickle: the old CELERY_RESULT_SERIALIZER.
+ * xssp-msgpack: msgpack with zlib compression (xssp_api.serialization).
+
+For every file, the result meta celery stores for a successful task is
+encoded and decoded, and its size reported. With --redis, the payloads are
+also stored in redis and the memory it reports for them is compared.
+
+Files ending in .bz2 are decompressed first.
+
+Example:
+
+    python benchmarks/serializer.py /mnt/chelonium/dssp/1crn.dssp \\
+        /mnt/chelonium/hssp/1crn.hssp.bz2 -n 20 --redis redis://localhost/15
+"""
+
+import argparse
+import bz2
+import datetime
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xssp_api import serialization  # noqa: E402
+
+
+SERIALIZERS = [
+    ('pickle', lambda obj: pickle.dumps(obj, protocol=4), pickle.loads),
+    ('xssp-msgpack', serialization.dumps, serialization.loads),
+]
+
+
+def read(path):
+    if path.endswith('.bz2'):
+        with bz2.open(path, 'rt') as f:
+            return f.read()
+    with open(path, 'rt') as f:
+        return f.read()
+
+
+def result_meta(content):
+    return {'status': 'SUCCESS', 'result': content, 'traceback': None,
+            'children': [], 'task_id': 'e7f3ac8a-0b1c-4a8e-9b1c-3b0f9d1e2a4c',
+            'date_done': datetime.datetime.utcnow().isoformat()}
+
+
+def best_time(f, arg, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        f(arg)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def redis_memory(client, key, payload):
+    client.set(key, payload)
+    try:
+        return client.memory_usage(key)
+    finally:
+        client.delete(key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark serializers')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('-n', type=int, default=10)
+    parser.add_argument('--redis', help='url of a scratch redis database')
+    args = parser.parse_args()
+
+    client = None
+    if args.redis:
+        import redis
+        client = redis.Redis.from_url(args.redis)
+
+    print("{:<24} {:<14} {:>12} {:>10} {:>10} {:>12}".format(
+        'file', 'serializer', 'size', 'dumps ms', 'loads ms', 'redis'))
+    for path in args.paths:
+        meta = result_meta(read(path))
+        for name, dumps, loads in SERIALIZERS:
+            payload = dumps(meta)
+            assert loads(payload) == meta
+
+            memory = '-'
+            if client is not None:
+                memory = redis_memory(client, 'benchmark:' + name, payload)
+
+            print("{:<24} {:<14} {:>12} {:>10.3f} {:>10.3f} {:>12}".format(
+                os.path.basename(path)[:24], name, len(payload),
+                best_time(dumps, meta, args.n) * 1000,
+                best_time(loads, payload, args.n) * 1000, memory))
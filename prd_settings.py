@@ -11,3 +11,7 @@ MAIL_SERVER = "smtp.umcn.nl"
 MAIL_SMTP_PORT = 25
 MAIL_FROM = "xssp-api@cmbi.umcn.nl"
 MAIL_TO = ["Coos.Baakman@radboudumc.nl"]
+
+# The mkhssp workers in docker-compose.yml run on one host, in containers with
+# hostnames of their own, so they share the thread budget by name.
+MKHSSP_NODE = "xssp"
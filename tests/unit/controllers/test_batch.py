@@ -0,0 +1,22 @@
+from nose.tools import eq_
+
+from xssp_api.controllers.batch import split_fasta, split_ids
+
+
+def test_split_fasta():
+    entries = split_fasta(">1crn_A crambin\nTTCCPSIVAR\nSNFNVCRLPG\r\n"
+                          ">\nTPEAICATYT\n\n>2crn\nGCIIIPGATC\n")
+    eq_(entries, [('1crn_A', ">1crn_A crambin\nTTCCPSIVAR\nSNFNVCRLPG\n"),
+                  ('sequence_2', ">\nTPEAICATYT\n"),
+                  ('2crn', ">2crn\nGCIIIPGATC\n")])
+
+
+def test_split_fasta_without_description():
+    eq_(split_fasta("TTCCPSIVAR\n"), [('sequence_1', "TTCCPSIVAR\n")])
+
+
+def test_split_ids():
+    eq_(split_ids(" 1CRN, 2crn;3crn\n4crn "),
+        [('1crn', '1crn'), ('2crn', '2crn'), ('3crn', '3crn'),
+         ('4crn', '4crn')])
+    eq_(split_ids(""), [])
@@ -0,0 +1,242 @@
+import bz2
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import time
+
+from mock import patch
+from nose.tools import eq_, ok_, raises
+
+from xssp_api.controllers.blast import (blast_queries, create_databank,
+                                        find_exact_sequence,
+                                        get_query_sequence,
+                                        get_stockholm_sequences,
+                                        iter_blast_hits, parse_blast_hits)
+
+
+OUTPUT = ("1\t1\t5\tACDEF\t3\t7\tACDEW\t/hg-hssp/1abc.sto.bz2:A\n"
+          "1\t2\t4\tCDE\t1\t3\tCDE\t/hg-hssp/with space.sto.bz2:B\n")
+
+
+def _fake_blastp(script):
+    f = tempfile.NamedTemporaryFile('wt', suffix='.sh', delete=False)
+    with f:
+        f.write('#!/bin/sh\n' + script)
+    os.chmod(f.name, stat.S_IRWXU)
+    return f.name
+
+
+def test_parse_blast_hits():
+    hits = list(parse_blast_hits(OUTPUT.splitlines(True)))
+
+    eq_(len(hits), 2)
+    query_id, title, alignment = hits[0]
+    eq_(query_id, '1')
+    eq_(title, '/hg-hssp/1abc.sto.bz2:A')
+    eq_((alignment.query_start, alignment.query_end), (1, 5))
+    eq_(alignment.query_alignment, 'ACDEF')
+    eq_((alignment.subj_start, alignment.subj_end), (3, 7))
+    eq_(alignment.subj_alignment, 'ACDEW')
+    eq_(hits[1][1], '/hg-hssp/with space.sto.bz2:B')
+
+
+def test_iter_blast_hits():
+    blastp = _fake_blastp("printf '{}'\n".format(
+        OUTPUT.replace('\t', '\\t').replace('\n', '\\n')))
+    try:
+        with patch('xssp_api.controllers.blast.settings.BLASTP', blastp):
+            hits = list(iter_blast_hits('ACDEF', '/db'))
+    finally:
+        os.remove(blastp)
+
+    eq_([title for title, _ in hits],
+        ['/hg-hssp/1abc.sto.bz2:A', '/hg-hssp/with space.sto.bz2:B'])
+
+
+def test_iter_blast_hits_early_exit():
+    blastp = _fake_blastp("printf '{}'\nsleep 10\n".format(
+        OUTPUT.replace('\t', '\\t').replace('\n', '\\n')))
+    try:
+        with patch('xssp_api.controllers.blast.settings.BLASTP', blastp):
+            start = time.monotonic()
+            hits = iter_blast_hits('ACDEF', '/db')
+            title, _ = next(hits)
+            hits.close()
+            ok_(time.monotonic() - start < 5)
+    finally:
+        os.remove(blastp)
+
+    eq_(title, '/hg-hssp/1abc.sto.bz2:A')
+
+
+@raises(RuntimeError)
+def test_iter_blast_hits_error():
+    blastp = _fake_blastp("echo error >&2\nexit 1\n")
+    try:
+        with patch('xssp_api.controllers.blast.settings.BLASTP', blastp):
+            list(iter_blast_hits('ACDEF', '/db'))
+    finally:
+        os.remove(blastp)
+
+
+def test_blast_queries():
+    output = ("a\t1\t5\tACDEF\t3\t7\tACDEW\t/hg-hssp/1abc.sto.bz2:A\n"
+              "b\t2\t4\tCDE\t1\t3\tCDE\t/hg-hssp/2abc.sto.bz2:B\n"
+              "a\t2\t4\tCDE\t1\t3\tCDE\t/hg-hssp/3abc.sto.bz2:C\n")
+    blastp = _fake_blastp("printf '{}'\n".format(
+        output.replace('\t', '\\t').replace('\n', '\\n')))
+    try:
+        with patch('xssp_api.controllers.blast.settings.BLASTP', blastp):
+            hits = blast_queries({'a': 'ACDEF', 'b': 'CDE', 'c': 'GHI'},
+                                 '/db')
+    finally:
+        os.remove(blastp)
+
+    eq_({id_: [title for title, _ in h] for id_, h in hits.items()},
+        {'a': ['/hg-hssp/1abc.sto.bz2:A', '/hg-hssp/3abc.sto.bz2:C'],
+         'b': ['/hg-hssp/2abc.sto.bz2:B'],
+         'c': []})
+
+
+def test_blast_queries_fasta_description():
+    # Echo the query ids back, as blastp would.
+    blastp = _fake_blastp(
+        "grep '^>' \"$2\" | cut -c2- | while read id; do\n"
+        "    printf '%s\\t1\\t3\\tACD\\t1\\t3\\tACD\\t/hg-hssp/1abc.sto.bz2:A\\n'"
+        " \"$id\"\n"
+        "done\n")
+    try:
+        with patch('xssp_api.controllers.blast.settings.BLASTP', blastp):
+            hits = blast_queries({'aaa': 'ACD',
+                                  'bbb': '>sp|P1 human\nAC D1*'}, '/db')
+    finally:
+        os.remove(blastp)
+
+    eq_({id_: len(h) for id_, h in hits.items()}, {'aaa': 1, 'bbb': 1})
+
+
+def test_blast_queries_unknown_query():
+    output = "x\t1\t5\tACDEF\t3\t7\tACDEW\t/hg-hssp/1abc.sto.bz2:A\n"
+    blastp = _fake_blastp("printf '{}'\n".format(
+        output.replace('\t', '\\t').replace('\n', '\\n')))
+    try:
+        with patch('xssp_api.controllers.blast.settings.BLASTP', blastp):
+            hits = blast_queries({'a': 'ACDEF'}, '/db')
+    finally:
+        os.remove(blastp)
+
+    eq_(hits, {'a': []})
+
+
+def test_get_query_sequence():
+    eq_(get_query_sequence('>sp|P1 human\nac d\n1 ef*\n'), 'ACDEF')
+    eq_(get_query_sequence('\nACDEF'), 'ACDEF')
+
+
+def _write_stockholm(path, chains):
+    with bz2.open(path, 'wt') as f:
+        for chain, sequence in chains.items():
+            for aa in sequence:
+                f.write('#=GF RI' + ' ' * 13 + chain + ' ' + aa + '\n')
+
+
+def test_find_exact_sequence():
+    root = tempfile.mkdtemp()
+    try:
+        hssp_dir = os.path.join(root, 'hssp')
+        os.mkdir(hssp_dir)
+        _write_stockholm(os.path.join(hssp_dir, '1abc.sto.bz2'),
+                         {'A': 'ACDEF', 'B': 'GHIKL'})
+        _write_stockholm(os.path.join(hssp_dir, '2abc.sto.bz2'),
+                         {'A': 'ACDEF'})
+        databank_path = os.path.join(root, 'db')
+
+        with patch('xssp_api.controllers.blast.settings.MAKEBLASTDB', 'true'):
+            create_databank(hssp_dir, databank_path)
+
+        eq_(sorted(find_exact_sequence('>query\nacd\nef\n', databank_path)),
+            [(os.path.join(hssp_dir, '1abc.sto.bz2'), 'A'),
+             (os.path.join(hssp_dir, '2abc.sto.bz2'), 'A')])
+        eq_(find_exact_sequence('GHIKL', databank_path),
+            [(os.path.join(hssp_dir, '1abc.sto.bz2'), 'B')])
+        eq_(find_exact_sequence('GHIK', databank_path), [])
+        eq_(sorted(os.listdir(root)), ['db.built', 'db.kmer.chains',
+                                       'db.kmer.offsets', 'db.kmer.postings',
+                                       'db.manifest', 'db.seqidx', 'hssp'])
+    finally:
+        shutil.rmtree(root)
+
+
+def test_find_exact_sequence_without_index():
+    eq_(find_exact_sequence('ACDEF', '/nonexistent/db'), [])
+
+
+def test_create_databank_failed():
+    root = tempfile.mkdtemp()
+    try:
+        hssp_dir = os.path.join(root, 'hssp')
+        os.mkdir(hssp_dir)
+        _write_stockholm(os.path.join(hssp_dir, '1abc.sto.bz2'),
+                         {'A': 'ACDEF'})
+        databank_path = os.path.join(root, 'db')
+        makeblastdb = _fake_blastp('touch "$6.psq"\nexit 1\n')
+
+        with patch('xssp_api.controllers.blast.settings.MAKEBLASTDB',
+                   makeblastdb):
+            try:
+                create_databank(hssp_dir, databank_path)
+                ok_(False, "makeblastdb didn't fail")
+            except subprocess.CalledProcessError:
+                pass
+        eq_(find_exact_sequence('ACDEF', databank_path), [])
+
+        # The manifest is up to date, but the databank isn't.
+        with open(makeblastdb, 'wt') as f:
+            f.write('#!/bin/sh\ntouch "$6.psq"\n')
+        with patch('xssp_api.controllers.blast.settings.MAKEBLASTDB',
+                   makeblastdb):
+            create_databank(hssp_dir, databank_path)
+        eq_(find_exact_sequence('ACDEF', databank_path),
+            [(os.path.join(hssp_dir, '1abc.sto.bz2'), 'A')])
+    finally:
+        os.remove(makeblastdb)
+        shutil.rmtree(root)
+
+
+def test_create_databank_incremental():
+    root = tempfile.mkdtemp()
+    try:
+        hssp_dir = os.path.join(root, 'hssp')
+        os.mkdir(hssp_dir)
+        _write_stockholm(os.path.join(hssp_dir, '1abc.sto.bz2'),
+                         {'A': 'ACDEF'})
+        _write_stockholm(os.path.join(hssp_dir, '2abc.sto.bz2'),
+                         {'A': 'GHIKL'})
+        databank_path = os.path.join(root, 'db')
+        makeblastdb = _fake_blastp('touch "$6.psq"\n')
+
+        def create(parsed):
+            with patch('xssp_api.controllers.blast.settings.MAKEBLASTDB',
+                       makeblastdb), \
+                    patch('xssp_api.controllers.blast.get_stockholm_sequences',
+                          side_effect=get_stockholm_sequences) as mock_parse:
+                create_databank(hssp_dir, databank_path)
+            eq_(sorted(os.path.basename(c[0][0])
+                       for c in mock_parse.call_args_list), parsed)
+
+        create(['1abc.sto.bz2', '2abc.sto.bz2'])
+        create([])
+
+        _write_stockholm(os.path.join(hssp_dir, '2abc.sto.bz2'),
+                         {'A': 'MNPQRS'})
+        os.remove(os.path.join(hssp_dir, '1abc.sto.bz2'))
+        create(['2abc.sto.bz2'])
+
+        eq_(find_exact_sequence('ACDEF', databank_path), [])
+        eq_(find_exact_sequence('MNPQRS', databank_path),
+            [(os.path.join(hssp_dir, '2abc.sto.bz2'), 'A')])
+    finally:
+        os.remove(makeblastdb)
+        shutil.rmtree(root)
@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+from nose.tools import eq_
+
+from xssp_api.controllers.cost import (get_sequence_cost, get_structure_cost,
+                                       get_structure_size, get_tier)
+
+
+def test_get_sequence_cost():
+    eq_(get_sequence_cost(">1crn_A\nTTCCPSIVAR\n1 SNFNVCRLPG*\n"), 20)
+
+
+def _call_with_structure(f, content):
+    tmp_file, path = tempfile.mkstemp(suffix='.pdb')
+    os.close(tmp_file)
+    try:
+        with open(path, 'wt') as structure_file:
+            structure_file.write(content)
+        return f(path)
+    finally:
+        os.remove(path)
+
+
+def test_get_structure_cost():
+    content = ("SEQRES   1 A    5  THR THR CYS CYS PRO\n"
+               "SEQRES   2 A    5  SER\n"
+               "SEQRES   1 B    5  THR THR CYS CYS PRO\n"
+               "SEQRES   2 B    5  SER\n"
+               "SEQRES   1 C    2  ALA GLY\n"
+               "ATOM      1  N   THR A   1      17.047  14.099   3.625\n"
+               "SEQRES   1 D    2  ALA GLY\n")
+    eq_(_call_with_structure(get_structure_cost, content), 8)
+
+
+def test_get_structure_size():
+    eq_(_call_with_structure(get_structure_size,
+                             "SEQRES   1 A    2  ALA GLY\n"
+                             "SEQRES   1 B    2  ALA GLY\n"), (2, 2))
+
+
+def test_get_structure_cost_without_seqres():
+    eq_(_call_with_structure(get_structure_cost, "data_1CRN\n" + "x" * 6500),
+        10)
+
+
+def test_get_tier():
+    tiers = [('short', 300), ('medium', 1500), ('long', None)]
+    eq_(get_tier(25, tiers), 'short')
+    eq_(get_tier(300, tiers), 'short')
+    eq_(get_tier(301, tiers), 'medium')
+    eq_(get_tier(100000, tiers), 'long')
+    eq_(get_tier(100000, [('short', 300)]), 'short')
@@ -1,4 +1,7 @@
-from xssp_api.controllers.identify import get_identifier
+import tempfile
+
+from xssp_api.controllers.identify import (get_databank_version, get_identifier,
+                                           get_input_hash, normalize_sequence)
 
 
 def test_identifier():
@@ -28,3 +31,31 @@ VMLKKKQYTSIHHGVVEVDAAVTPEERHLSKMQQNGYENPTYKFFEQMQN
     id_2 = get_identifier(sequence.replace('\n', ''))
 
     assert id_1 == id_2
+
+
+def test_normalize_sequence():
+
+    assert normalize_sequence("ACDE FGH\r\nIKL\n") == "\nACDEFGHIKL"
+    assert normalize_sequence(">test 1\nACDE\nFGH\n") == ">test 1\nACDEFGH"
+
+
+def test_input_hash():
+
+    hash_1 = get_input_hash('sequence', 'hssp_hssp', 'ACDE', 'v1')
+
+    assert hash_1 == get_input_hash('sequence', 'hssp_hssp', 'ACDE', 'v1')
+    assert hash_1 != get_input_hash('sequence', 'hssp_stockholm', 'ACDE', 'v1')
+    assert hash_1 != get_input_hash('sequence', 'hssp_hssp', 'ACDE', 'v2')
+
+
+def test_databank_version():
+
+    with tempfile.NamedTemporaryFile() as f:
+        version_1 = get_databank_version([f.name])
+
+        f.write(b'new release')
+        f.flush()
+        version_2 = get_databank_version([f.name])
+
+    assert version_1 != version_2
+    assert version_2 != get_databank_version([f.name])
@@ -0,0 +1,93 @@
+import os
+import random
+import shutil
+import tempfile
+
+from nose.tools import eq_, ok_
+
+from xssp_api.controllers.kmer import (K, KmerIndex, banded_align,
+                                       get_kmer_index, iter_kmers,
+                                       write_kmer_index)
+
+
+random.seed(1)
+SEQUENCES = [''.join(random.choice('ACDEFGHIKLMNPQRSTVWY') for _ in range(n))
+             for n in [120, 150, 200, 90]]
+
+
+def _mutate(sequence, positions):
+    sequence = list(sequence)
+    for i in positions:
+        sequence[i] = 'W' if sequence[i] != 'W' else 'Y'
+    return ''.join(sequence)
+
+
+def _write_index(folder, sequences):
+    chains_path = os.path.join(folder, 'chains')
+    with open(chains_path, 'wt') as f:
+        for n, sequence in enumerate(sequences):
+            f.write('/hssp/{}.sto.bz2\tA\t{}\n'.format(n, sequence))
+    prefix = os.path.join(folder, 'db')
+    write_kmer_index(chains_path, prefix)
+    return prefix
+
+
+def test_iter_kmers():
+    eq_(len(list(iter_kmers('ACDEFGH'))), 7 - K + 1)
+    eq_(len(list(iter_kmers('ACDEFXGHIKL'))), 2)
+    eq_(list(iter_kmers('ACDEFACDEF'))[0], list(iter_kmers('ACDEF'))[0])
+
+
+def test_banded_align():
+    eq_(banded_align('ACDEF', 'ACDEF', 2), ('ACDEF', 'ACDEF'))
+    eq_(banded_align('ACDEF', 'ACEF', 2), ('ACDEF', 'AC-EF'))
+    eq_(banded_align('ACEF', 'ACDEF', 2), ('AC-EF', 'ACDEF'))
+    eq_(banded_align('', '', 2), ('', ''))
+
+
+def test_find():
+    folder = tempfile.mkdtemp()
+    try:
+        prefix = _write_index(folder, SEQUENCES)
+        index = KmerIndex(prefix)
+
+        query = _mutate(SEQUENCES[2], [10, 60, 150])
+        eq_(index.find(query), [('/hssp/2.sto.bz2', 'A')])
+        eq_(index.find('>query\n' + SEQUENCES[1].lower()),
+            [('/hssp/1.sto.bz2', 'A')])
+
+        # A deletion is aligned across.
+        query = SEQUENCES[0][:50] + SEQUENCES[0][52:]
+        eq_(index.find(query), [('/hssp/0.sto.bz2', 'A')])
+
+        # Too many mutations.
+        query = _mutate(SEQUENCES[3], range(0, 90, 9))
+        eq_(index.find(query), [])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_candidates():
+    folder = tempfile.mkdtemp()
+    try:
+        index = KmerIndex(_write_index(folder, SEQUENCES))
+
+        eq_([c[:2] for c in index.candidates(SEQUENCES[1])],
+            [('/hssp/1.sto.bz2', 'A')])
+        eq_(index.candidates('ACDEFGHIKLMNPQRSTVWY'), [])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_get_kmer_index():
+    folder = tempfile.mkdtemp()
+    try:
+        prefix = os.path.join(folder, 'db')
+        eq_(get_kmer_index(prefix), None)
+
+        _write_index(folder, SEQUENCES)
+        index = get_kmer_index(prefix)
+        ok_(index is get_kmer_index(prefix))
+        eq_(len(index.chains), 4)
+    finally:
+        shutil.rmtree(folder)
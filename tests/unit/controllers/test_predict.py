@@ -0,0 +1,27 @@
+from nose.tools import eq_, ok_
+
+from xssp_api.controllers.predict import fit_runtime_model, predict_runtime
+
+
+def test_fit_runtime_model():
+    samples = [({'residues': r, 'chains': c}, 5 + 0.5 * r + 20 * c)
+               for r in [50, 100, 300, 800] for c in [1, 2, 4]]
+    coefficients = fit_runtime_model(samples)
+
+    for found, expected in zip(coefficients, [5, 0.5, 20]):
+        ok_(abs(found - expected) < 1e-3)
+
+
+def test_fit_runtime_model_constant_feature():
+    samples = [({'residues': r, 'chains': 1}, 2 * r) for r in [10, 20, 30]]
+    coefficients = fit_runtime_model(samples)
+
+    ok_(abs(predict_runtime(coefficients, {'residues': 40, 'chains': 1}) -
+            80) < 1e-3)
+
+
+def test_predict_runtime():
+    eq_(predict_runtime([5, 0.5, 20], {'residues': 100, 'chains': 2}), 95)
+    eq_(predict_runtime([5, 0.5, 20], {}), 5)
+    eq_(predict_runtime([-50, 0.5, 0], {'residues': 10}), 0)
+    eq_(predict_runtime(None, {'residues': 100}), None)
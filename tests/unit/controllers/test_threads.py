@@ -0,0 +1,20 @@
+from nose.tools import eq_, raises
+
+from xssp_api.controllers.threads import choose_threads
+
+
+def test_choose_threads_fixed():
+    eq_(choose_threads('fixed', 0, 20, 8), 1)
+
+
+def test_choose_threads_adaptive():
+    eq_(choose_threads('adaptive', 0, 20, 8), 8)
+    eq_(choose_threads('adaptive', 0, 5, 8), 5)
+    eq_(choose_threads('adaptive', 3, 20, 8), 5)
+    eq_(choose_threads('adaptive', 50, 20, 8), 1)
+    eq_(choose_threads('adaptive', 0, 0, 8), 1)
+
+
+@raises(ValueError)
+def test_choose_threads_unexpected_policy():
+    choose_threads('unexpected', 0, 20, 8)
@@ -0,0 +1,130 @@
+import bz2
+import datetime
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO
+
+from nose.tools import eq_, raises
+
+from xssp_api.controllers.upload import (clean_uploads, get_structure_id,
+                                         save_structure)
+
+
+PDB = (b"HEADER    PLANT PROTEIN                           30-APR-81   1CRN\n"
+       b"REMARK   2 RESOLUTION. 1.50 ANGSTROMS.\n"
+       b"CRYST1   40.960   18.650   22.520  90.00  90.77  90.00 P 1 21 1\n")
+STRIPPED = (b"HEADER    PLANT PROTEIN                           30-APR-81   1CRN\n"
+            b"CRYST1   40.960   18.650   22.520  90.00  90.77  90.00 P 1 21 1\n")
+STRIPPED_HASH = hashlib.sha256(STRIPPED).hexdigest()
+
+
+def _check_save_structure(data, filename, expected_filename):
+    folder = tempfile.mkdtemp()
+    try:
+        path, hash_ = save_structure(BytesIO(data), filename, folder)
+        eq_(path, os.path.join(folder, expected_filename))
+        open_ = gzip.open if path.endswith('.gz') else open
+        with open_(path, 'rb') as f:
+            eq_(f.read(), STRIPPED)
+        eq_(hash_, STRIPPED_HASH)
+        eq_(os.listdir(folder), [expected_filename])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_save_structure():
+    _check_save_structure(PDB, '1crn.pdb', STRIPPED_HASH + '.pdb')
+
+
+def test_save_structure_gz():
+    _check_save_structure(gzip.compress(PDB), '1crn.pdb.gz',
+                          STRIPPED_HASH + '.pdb.gz')
+
+
+def test_save_structure_bz2():
+    _check_save_structure(bz2.compress(PDB), '1crn.PDB.BZ2',
+                          STRIPPED_HASH + '.pdb.gz')
+
+
+def test_save_structure_gz_without_extension():
+    _check_save_structure(gzip.compress(PDB), '1crn.gz',
+                          STRIPPED_HASH + '.gz')
+
+
+def _check_save_corrupt(data, filename):
+    folder = tempfile.mkdtemp()
+    try:
+        save_structure(BytesIO(data), filename, folder)
+    finally:
+        eq_(os.listdir(folder), [])
+        shutil.rmtree(folder)
+
+
+@raises(ValueError)
+def test_save_structure_gz_truncated():
+    _check_save_corrupt(gzip.compress(PDB)[:-10], '1crn.pdb.gz')
+
+
+@raises(ValueError)
+def test_save_structure_gz_bad_magic():
+    _check_save_corrupt(PDB, '1crn.pdb.gz')
+
+
+@raises(ValueError)
+def test_save_structure_gz_corrupt_data():
+    data = bytearray(gzip.compress(PDB))
+    data[12:20] = b'\xff' * 8
+    _check_save_corrupt(bytes(data), '1crn.pdb.gz')
+
+
+@raises(ValueError)
+def test_save_structure_bz2_corrupt():
+    _check_save_corrupt(bz2.compress(PDB)[:20], '1crn.pdb.bz2')
+
+
+def test_save_structure_twice():
+    folder = tempfile.mkdtemp()
+    try:
+        path1, _ = save_structure(BytesIO(PDB), 'model.pdb', folder)
+        path2, _ = save_structure(BytesIO(STRIPPED), 'other.pdb', folder)
+        eq_(path1, path2)
+        eq_(os.listdir(folder), [STRIPPED_HASH + '.pdb'])
+        eq_(get_structure_id(path1), STRIPPED_HASH)
+        eq_(get_structure_id(path1 + '.gz'), STRIPPED_HASH)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_clean_uploads():
+    folder = tempfile.mkdtemp()
+    try:
+        old_path, _ = save_structure(BytesIO(PDB), '1crn.pdb', folder)
+        old_mtime = time.time() - 3 * 24 * 3600
+        os.utime(old_path, (old_mtime, old_mtime))
+        new_path, _ = save_structure(BytesIO(b"HEADER\n"), '1abc.cif',
+                                     folder)
+
+        eq_(clean_uploads(folder, datetime.timedelta(days=2)), 1)
+        eq_(os.listdir(folder), [os.path.basename(new_path)])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_clean_uploads_keep():
+    folder = tempfile.mkdtemp()
+    try:
+        old_mtime = time.time() - 3 * 24 * 3600
+        for name in ['abc.part00000', 'def.part00000']:
+            with open(os.path.join(folder, name), 'wb') as f:
+                f.write(PDB)
+            os.utime(os.path.join(folder, name), (old_mtime, old_mtime))
+
+        keep = frozenset([os.path.join(folder, 'abc.part00000')])
+        eq_(clean_uploads(folder, datetime.timedelta(days=2), keep), 1)
+        eq_(os.listdir(folder), ['abc.part00000'])
+    finally:
+        shutil.rmtree(folder)
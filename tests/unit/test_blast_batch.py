@@ -0,0 +1,120 @@
+import json
+
+from mock import MagicMock, patch
+from nose.tools import assert_raises, eq_, ok_
+
+from xssp_api.controllers.blast import BlastAlignment
+from xssp_api.services.blast_batch import (_TAKE_SCRIPT, _dump_hits,
+                                           BlastBatcher)
+
+
+def _hit(title):
+    return title, BlastAlignment(1, 5, 'ACDEF', 3, 7, 'ACDEW')
+
+
+def _titles(hits):
+    return [title for title, _ in hits]
+
+
+@patch('xssp_api.services.blast_batch.blast_queries')
+def test_search_leader(mock_blast_queries):
+    client = MagicMock()
+    client.set.return_value = True
+    other = json.dumps({'id': 'other', 'sequence': 'GHIKL'})
+    client.eval.side_effect = \
+        lambda script, *args: [other] if script == _TAKE_SCRIPT else 1
+
+    def blast_queries(queries, databank_path):
+        return {id_: [_hit(id_ + ':A')] for id_ in queries}
+    mock_blast_queries.side_effect = blast_queries
+
+    batcher = BlastBatcher(client, '/db', 0, 32, 10, 60)
+    hits = list(batcher.search('ACDEF'))
+
+    queries = mock_blast_queries.call_args[0][0]
+    eq_(sorted(queries.values()), ['ACDEF', 'GHIKL'])
+    own_id = [id_ for id_ in queries if id_ != 'other'][0]
+    eq_(_titles(hits), [own_id + ':A'])
+    client.rpush.assert_called_with('blast:result:other',
+                                    _dump_hits([_hit('other:A')]))
+
+
+def test_search_follower():
+    client = MagicMock()
+    client.set.return_value = None
+    client.blpop.return_value = (b'key', _dump_hits([_hit('/hg-hssp/a:A'),
+                                                     _hit('/hg-hssp/b:B')]))
+
+    batcher = BlastBatcher(client, '/db', 0, 32, 10, 60)
+    hits = list(batcher.search('ACDEF'))
+
+    eq_(_titles(hits), ['/hg-hssp/a:A', '/hg-hssp/b:B'])
+    eq_(hits[0][1].subj_alignment, 'ACDEW')
+    eq_(client.rpush.call_args[0][0], 'blast:queue:/db')
+
+
+@patch('xssp_api.services.blast_batch.iter_blast_hits')
+def test_search_timeout(mock_iter_blast_hits):
+    client = MagicMock()
+    mock_iter_blast_hits.return_value = iter([_hit('/hg-hssp/a:A')])
+
+    batcher = BlastBatcher(client, '/db', 0, 32, 0, 60)
+    hits = list(batcher.search('ACDEF'))
+
+    eq_(_titles(hits), ['/hg-hssp/a:A'])
+    mock_iter_blast_hits.assert_called_once_with('ACDEF', '/db')
+    query = client.rpush.call_args[0][1]
+    client.lrem.assert_called_once_with('blast:queue:/db', 0, query)
+
+
+@patch('xssp_api.services.blast_batch.blast_queries')
+def test_search_leader_failed(mock_blast_queries):
+    client = MagicMock()
+    client.set.return_value = True
+    other = json.dumps({'id': 'other', 'sequence': 'GHIKL'})
+    client.eval.side_effect = \
+        lambda script, *args: [other] if script == _TAKE_SCRIPT else 1
+    mock_blast_queries.side_effect = RuntimeError('blastp error')
+
+    batcher = BlastBatcher(client, '/db', 0, 32, 10, 60)
+    with assert_raises(RuntimeError):
+        list(batcher.search('ACDEF'))
+
+    key, data = client.rpush.call_args[0]
+    eq_(key, 'blast:result:other')
+    ok_('blastp error' in json.loads(data)['error'])
+
+
+@patch('xssp_api.services.blast_batch.iter_blast_hits')
+def test_search_follower_leader_failed(mock_iter_blast_hits):
+    client = MagicMock()
+    client.set.return_value = None
+    client.blpop.return_value = (b'key', json.dumps({'error': 'failed'}))
+    mock_iter_blast_hits.return_value = iter([_hit('/hg-hssp/a:A')])
+
+    batcher = BlastBatcher(client, '/db', 0, 32, 10, 60)
+    hits = list(batcher.search('ACDEF'))
+
+    eq_(_titles(hits), ['/hg-hssp/a:A'])
+    mock_iter_blast_hits.assert_called_once_with('ACDEF', '/db')
+    eq_(client.blpop.call_count, 1)
+
+
+@patch('xssp_api.services.blast_batch.blast_queries')
+def test_search_second_leader(mock_blast_queries):
+    client = MagicMock()
+    # The first of the leases is taken.
+    client.set.side_effect = [None, True]
+    client.eval.side_effect = \
+        lambda script, *args: [] if script == _TAKE_SCRIPT else 1
+    mock_blast_queries.side_effect = \
+        lambda queries, databank_path: {id_: [_hit('/hg-hssp/a:A')]
+                                        for id_ in queries}
+
+    batcher = BlastBatcher(client, '/db', 0, 32, 10, 60, leaders=2)
+    hits = list(batcher.search('ACDEF'))
+
+    eq_(_titles(hits), ['/hg-hssp/a:A'])
+    eq_([c[0][0] for c in client.set.call_args_list],
+        ['lease:blast:/db:0', 'lease:blast:/db:1'])
+    client.blpop.assert_not_called()
@@ -0,0 +1,78 @@
+import bz2
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from nose.tools import eq_, ok_, raises
+
+from xssp_api.services.blobs import (BlobStore, resolve_result, store_result,
+                                     store_result_file)
+
+
+class TestBlobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config.update({'BLOB_ROOT': self.root, 'BLOB_MIN_SIZE': 10})
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_put_get(self):
+        store = BlobStore(self.root)
+
+        digest = store.put('content')
+        eq_(len(digest), 64)
+        ok_(os.path.isfile(store.path(digest)))
+        eq_(store.get(digest), 'content')
+
+    def test_put_duplicate(self):
+        store = BlobStore(self.root)
+        digest = store.put('content')
+        os.utime(store.path(digest), (0, 0))
+
+        eq_(store.put('content'), digest)
+        eq_(os.listdir(os.path.join(self.root, digest[:2])),
+            [digest + '.bz2'])
+        ok_(os.path.getmtime(store.path(digest)) > 0)
+
+    @raises(FileNotFoundError)
+    def test_get_missing(self):
+        BlobStore(self.root).get('0' * 64)
+
+    def test_clean(self):
+        store = BlobStore(self.root)
+        old = store.put('old content')
+        new = store.put('new content')
+        os.utime(store.path(old), (0, 0))
+
+        eq_(store.clean(datetime.timedelta(days=1)), 1)
+        ok_(not os.path.exists(store.path(old)))
+        eq_(store.get(new), 'new content')
+
+    def test_store_result(self):
+        with self.app.app_context():
+            eq_(store_result('short'), 'short')
+            eq_(resolve_result('short'), 'short')
+
+            reference = store_result('long content')
+            eq_(reference['size'], 12)
+            eq_(resolve_result(reference), 'long content')
+
+    def test_store_result_file(self):
+        path = os.path.join(self.root, 'output.bz2')
+        with self.app.app_context():
+            with bz2.open(path, 'wt') as f:
+                f.write('short')
+            eq_(store_result_file(path), 'short')
+
+            with bz2.open(path, 'wt') as f:
+                f.write('long content')
+            reference = store_result_file(path)
+            eq_(reference['size'], 12)
+            eq_(reference, store_result('long content'))
+            eq_(resolve_result(reference), 'long content')
@@ -0,0 +1,55 @@
+import os
+import signal
+import time
+
+from celery.exceptions import Ignore
+from mock import ANY, patch
+from nose.tools import eq_, ok_, raises
+
+from xssp_api.services.commands import Command
+
+
+@patch('xssp_api.services.commands.update_task_doc')
+def test_command(mock_update_task_doc):
+    with Command(['sh', '-c', 'cat; echo error >&2'], stdin=True) as command:
+        with command.stdin:
+            command.stdin.write('output\n')
+        eq_(command.stdout.read(), 'output\n')
+
+    eq_(command.returncode, 0)
+    eq_(command.stderr, 'error\n')
+    mock_update_task_doc.assert_any_call(
+        {'$set': {'pid': command.process.pid}})
+    mock_update_task_doc.assert_any_call({'$unset': {'pid': ''}})
+    mock_update_task_doc.assert_called_with({'$push': {'usage': ANY}})
+
+
+@raises(RuntimeError)
+def test_command_error():
+    with Command(['sh', '-c', 'echo error >&2; exit 1']) as command:
+        command.stdout.read()
+
+
+def test_command_closed_early():
+    def lines():
+        with Command(['sh', '-c', 'echo line; sleep 10']) as command:
+            yield from command.stdout
+
+    start = time.monotonic()
+    gen = lines()
+    eq_(next(gen), 'line\n')
+    gen.close()
+    ok_(time.monotonic() - start < 5)
+
+
+@raises(Ignore)
+@patch('xssp_api.services.commands.is_cancelled')
+def test_command_cancelled_while_streaming(mock_is_cancelled):
+    mock_is_cancelled.return_value = False
+    with Command(['sh', '-c', 'echo line; sleep 10']) as command:
+        eq_(command.stdout.readline(), 'line\n')
+
+        # As by kill_subprocess, after cancel_task.
+        mock_is_cancelled.return_value = True
+        os.killpg(command.process.pid, signal.SIGKILL)
+        command.stdout.read()
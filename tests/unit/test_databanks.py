@@ -0,0 +1,37 @@
+from flask import Flask
+from nose.tools import eq_, raises
+
+from xssp_api.services.databanks import get_accel_redirect, get_entry_path
+
+
+def _create_app():
+    app = Flask(__name__)
+    app.config.update({'DSSP_ROOT': '/dssp/',
+                       'DSSP_REDO_ROOT': '/dssp_redo/',
+                       'HSSP_ROOT': '/hssp/',
+                       'HSSP_STO_ROOT': '/hssp3/',
+                       'ACCEL_REDIRECT_LOCATIONS': {'/dssp': '/internal/dssp/'}})
+    return app
+
+
+def test_get_entry_path():
+    with _create_app().app_context():
+        eq_(get_entry_path('pdb_id', 'dssp', '1CRN'), '/dssp/1crn.dssp')
+        eq_(get_entry_path('pdb_id', 'hssp_hssp', '1crn'),
+            '/hssp/1crn.hssp.bz2')
+        eq_(get_entry_path('pdb_id', 'hssp_stockholm', '1crn'),
+            '/hssp3/1crn.hssp.bz2')
+        eq_(get_entry_path('pdb_redo_id', 'dssp', '1crn'),
+            '/dssp_redo/1crn.dssp')
+
+
+@raises(ValueError)
+def test_get_entry_path_no_databank():
+    with _create_app().app_context():
+        get_entry_path('pdb_redo_id', 'hssp_hssp', '1crn')
+
+
+def test_get_accel_redirect():
+    with _create_app().app_context():
+        eq_(get_accel_redirect('/dssp/1crn.dssp'), '/internal/dssp/1crn.dssp')
+        eq_(get_accel_redirect('/dssp_redo/1crn.dssp'), None)
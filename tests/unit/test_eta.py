@@ -0,0 +1,98 @@
+import datetime
+
+from flask import Flask
+from mock import patch
+from nose.tools import eq_, ok_
+
+from xssp_api.controllers.predict import predict_runtime
+from xssp_api.services.eta import RuntimeModels
+
+
+def _create_app():
+    app = Flask(__name__)
+    app.config['QUEUE_CONCURRENCY'] = {'mkhssp_short': 2}
+    return app
+
+
+@patch('xssp_api.services.eta.storage')
+def test_fit(mock_storage):
+    now = datetime.datetime.utcnow()
+    docs = [{'input_type': 'sequence', 'output_type': 'hssp_hssp',
+             'features': {'residues': r, 'chains': 1},
+             'started_on': now, 'finished_on':
+             now + datetime.timedelta(seconds=10 + r)}
+            for r in range(0, 200, 10)]
+    docs.append({'input_type': 'pdb_id', 'output_type': 'dssp',
+                 'started_on': now, 'finished_on': now})
+    docs.append({'started_on': now, 'finished_on': now})
+    mock_storage.find.return_value = docs
+
+    RuntimeModels().fit()
+
+    eq_(mock_storage.find.call_args[0][1]['cached'], {'$ne': True})
+
+    # Too few pdb_id jobs to fit a model on.
+    eq_(mock_storage.update_one.call_count, 1)
+    args = mock_storage.update_one.call_args[0]
+    eq_(args[1], {'_id': 'sequence:hssp_hssp'})
+    coefficients = args[2]['$set']['coefficients']
+    ok_(abs(coefficients[1] - 1) < 1e-3)
+    ok_(abs(predict_runtime(coefficients, {'residues': 300, 'chains': 1}) -
+            310) < 1e-3)
+
+
+@patch('xssp_api.services.eta.storage')
+def test_estimate_pending(mock_storage):
+    now = datetime.datetime.utcnow()
+    mock_storage.find_one.return_value = {'coefficients': [10, 1, 0]}
+    ahead = [{'input_type': 'sequence', 'output_type': 'hssp_hssp',
+              'features': {'residues': 90}}] * 3
+    running = [{'input_type': 'sequence', 'output_type': 'hssp_hssp',
+                'features': {'residues': 90},
+                'started_on': now - datetime.timedelta(seconds=40)}]
+    mock_storage.find.side_effect = [ahead, running]
+
+    doc = {'input_type': 'sequence', 'output_type': 'hssp_hssp',
+           'queue': 'mkhssp_short', 'features': {'residues': 50},
+           'created_on': now}
+    with _create_app().app_context():
+        estimate = RuntimeModels().estimate(doc, 'PENDING')
+
+    for call in mock_storage.find.call_args_list:
+        eq_(call[0][1]['cancelled'], {'$ne': True})
+
+    eq_(estimate['queue_position'], 4)
+    # 3 jobs of 100s ahead and 60s left of a running one, over 2 workers.
+    wait = (estimate['estimated_start'] - now).total_seconds()
+    ok_(180 <= wait < 181)
+    eq_((estimate['estimated_completion'] -
+         estimate['estimated_start']).total_seconds(), 60)
+
+
+@patch('xssp_api.services.eta.storage')
+def test_estimate_started(mock_storage):
+    now = datetime.datetime.utcnow()
+    mock_storage.find_one.return_value = {'coefficients': [10, 1, 0]}
+
+    doc = {'input_type': 'sequence', 'output_type': 'hssp_hssp',
+           'queue': 'mkhssp_short', 'features': {'residues': 50},
+           'started_on': now}
+    estimate = RuntimeModels().estimate(doc, 'STARTED')
+
+    eq_(estimate, {'estimated_completion':
+                   now + datetime.timedelta(seconds=60)})
+
+
+@patch('xssp_api.services.eta.storage')
+def test_estimate_without_model(mock_storage):
+    mock_storage.find_one.return_value = None
+    mock_storage.find.return_value = []
+
+    doc = {'input_type': 'pdb_id', 'output_type': 'dssp', 'queue': 'xssp',
+           'created_on': datetime.datetime.utcnow()}
+    with _create_app().app_context():
+        estimate = RuntimeModels().estimate(doc, 'PENDING')
+
+    eq_(estimate['queue_position'], 1)
+    ok_('estimated_start' in estimate)
+    ok_('estimated_completion' not in estimate)
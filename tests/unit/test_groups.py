@@ -0,0 +1,25 @@
+from mock import MagicMock, patch
+from nose.tools import eq_
+
+from xssp_api.services.groups import GroupRegistry
+
+
+def _status(states):
+    group = {'input_type': 'sequence', 'output_type': 'hssp_hssp',
+             'members': [{'name': str(i), 'task_id': str(i)}
+                         for i in range(len(states))]}
+    with patch('xssp_api.tasks.mkhssp_from_sequence.AsyncResult') as mock:
+        mock.side_effect = lambda id_: MagicMock(status=states[int(id_)])
+        return GroupRegistry().status(group)
+
+
+def test_status():
+    status, members = _status(['SUCCESS', 'STARTED'])
+    eq_(status, 'STARTED')
+    eq_(members, [{'name': '0', 'task_id': '0', 'status': 'SUCCESS'},
+                  {'name': '1', 'task_id': '1', 'status': 'STARTED'}])
+
+    eq_(_status(['SUCCESS', 'SUCCESS'])[0], 'SUCCESS')
+    eq_(_status(['SUCCESS', 'FAILURE'])[0], 'FAILURE')
+    eq_(_status(['PENDING', 'PENDING'])[0], 'PENDING')
+    eq_(_status(['PENDING', 'FAILURE'])[0], 'STARTED')
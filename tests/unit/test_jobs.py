@@ -0,0 +1,92 @@
+import datetime
+
+from mock import patch
+from nose.tools import eq_
+
+from xssp_api.services.jobs import JobRegistry
+
+
+@patch('xssp_api.tasks.get_task')
+@patch('xssp_api.services.jobs.storage')
+def test_find(mock_storage, mock_get_task):
+    mock_storage.find.return_value = [
+        {'task_id': '1', 'created_on': datetime.datetime.utcnow()},
+        {'task_id': '2', 'created_on': datetime.datetime.utcnow()}]
+    statuses = {'1': 'FAILURE', '2': 'SUCCESS'}
+    mock_get_task.return_value.AsyncResult.side_effect = \
+        lambda id_: type('AsyncResult', (), {'status': statuses[id_]})
+
+    eq_(JobRegistry().find('sequence', 'hssp_hssp', 'hash'), '2')
+
+
+@patch('xssp_api.tasks.get_task')
+@patch('xssp_api.services.jobs.storage')
+def test_find_expired(mock_storage, mock_get_task):
+    mock_storage.find.return_value = [
+        {'task_id': '1',
+         'created_on': datetime.datetime.utcnow() - datetime.timedelta(days=2)}]
+    mock_get_task.return_value.AsyncResult.return_value.status = 'PENDING'
+
+    eq_(JobRegistry().find('sequence', 'hssp_hssp', 'hash'), None)
+
+
+@patch('xssp_api.tasks.get_task')
+@patch('xssp_api.services.jobs.storage')
+def test_find_in_flight(mock_storage, mock_get_task):
+    mock_storage.find.return_value = [
+        {'task_id': '1', 'created_on': datetime.datetime.utcnow()}]
+    mock_get_task.return_value.AsyncResult.return_value.status = 'STARTED'
+
+    eq_(JobRegistry().find('sequence', 'hssp_hssp', 'hash'), '1')
+
+
+@patch('xssp_api.services.jobs.storage')
+def test_unsubscribe(mock_storage):
+    mock_storage.update_one.return_value.modified_count = 1
+    mock_storage.find_one.return_value = {'task_id': '1',
+                                          'subscriptions': ['b']}
+
+    eq_(JobRegistry().unsubscribe('1', 'a'), 1)
+    mock_storage.update_one.assert_called_once_with(
+        'tasks', {'task_id': '1', 'subscriptions': 'a'},
+        {'$pull': {'subscriptions': 'a'}})
+
+
+@patch('xssp_api.services.jobs.storage')
+def test_unsubscribe_again(mock_storage):
+    mock_storage.update_one.return_value.modified_count = 0
+
+    eq_(JobRegistry().unsubscribe('1', 'a'), None)
+    mock_storage.find_one.assert_not_called()
+
+
+@patch('xssp_api.tasks.get_task')
+@patch('xssp_api.services.jobs.storage')
+def test_find_started_lost(mock_storage, mock_get_task):
+    now = datetime.datetime.utcnow()
+    mock_storage.find.return_value = [
+        {'task_id': '1', 'created_on': now - datetime.timedelta(hours=3),
+         'started_on': now - datetime.timedelta(hours=2)}]
+    mock_get_task.return_value.name = 'xssp_api.tasks.get_hssp'
+    mock_get_task.return_value.AsyncResult.return_value.status = 'STARTED'
+
+    registry = JobRegistry({'default': {'timeout': 3600}})
+    eq_(registry.find('pdb_id', 'hssp_hssp', 'hash'), None)
+
+    registry = JobRegistry({'default': {'timeout': 3600},
+                            'xssp_api.tasks.get_hssp': {'timeout': 3 * 3600}})
+    eq_(registry.find('pdb_id', 'hssp_hssp', 'hash'), '1')
+
+
+@patch('xssp_api.tasks.get_task')
+@patch('xssp_api.services.jobs.storage')
+def test_find_retry_lost(mock_storage, mock_get_task):
+    now = datetime.datetime.utcnow()
+    mock_storage.find.return_value = [
+        {'task_id': '1', 'created_on': now - datetime.timedelta(hours=3),
+         'retried_on': now - datetime.timedelta(hours=2)}]
+    mock_get_task.return_value.name = 'xssp_api.tasks.mkhssp_from_sequence'
+    mock_get_task.return_value.AsyncResult.return_value.status = 'RETRY'
+
+    registry = JobRegistry({'default': {'timeout': 3600}})
+    eq_(registry.find('sequence', 'hssp_hssp', 'hash'), None)
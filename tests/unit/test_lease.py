@@ -0,0 +1,44 @@
+import time
+
+from mock import ANY, MagicMock
+from nose.tools import eq_, ok_
+
+from xssp_api.services.lease import Lease
+
+
+def test_acquire():
+    client = MagicMock()
+    client.set.return_value = True
+    lease = Lease(client, 'mkhssp:abc', 'task-1', 60)
+
+    ok_(lease.acquire())
+    client.set.assert_called_once_with('lease:mkhssp:abc', 'task-1', nx=True,
+                                       px=60000)
+
+
+def test_acquire_taken():
+    client = MagicMock()
+    client.set.return_value = None
+    lease = Lease(client, 'mkhssp:abc', 'task-2', 60)
+
+    ok_(not lease.acquire())
+
+
+def test_release_only_own_lease():
+    client = MagicMock()
+    lease = Lease(client, 'mkhssp:abc', 'task-1', 60)
+
+    lease.release()
+    client.eval.assert_called_once_with(ANY, 1, 'lease:mkhssp:abc', 'task-1')
+
+
+def test_heartbeat():
+    client = MagicMock()
+    client.eval.return_value = 1
+    lease = Lease(client, 'mkhssp:abc', 'task-1', 0.03)
+
+    with lease.heartbeat():
+        time.sleep(0.05)
+
+    ok_(client.eval.call_count >= 1)
+    client.eval.assert_called_with(ANY, 1, 'lease:mkhssp:abc', 'task-1', 30)
@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+from nose.tools import eq_
+
+from xssp_api.services.results import get_file_version, get_stored_result
+
+
+class TestGetStoredResult(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, '1crn.hssp.bz2')
+        with open(self.path, 'wb') as f:
+            f.write(b'old')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    @patch('xssp_api.services.results.storage')
+    def test_unchanged(self, mock_storage):
+        mock_storage.find_one.return_value = {
+            'result_path': self.path,
+            'result_version': get_file_version(self.path)}
+        async_result = MagicMock()
+
+        eq_(get_stored_result('1', async_result), (self.path, None))
+        async_result.get.assert_not_called()
+
+    @patch('xssp_api.services.results.storage')
+    def test_replaced(self, mock_storage):
+        mock_storage.find_one.return_value = {
+            'result_path': self.path,
+            'result_version': get_file_version(self.path)}
+        with open(self.path, 'wb') as f:
+            f.write(b'refreshed')
+        async_result = MagicMock()
+        async_result.get.return_value = 'output'
+
+        eq_(get_stored_result('1', async_result), (None, 'output'))
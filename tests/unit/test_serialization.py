@@ -0,0 +1,38 @@
+import datetime
+
+from kombu.serialization import dumps, loads, prepare_accept_content
+from nose.tools import eq_, ok_, raises
+
+from xssp_api import serialization
+from xssp_api.serialization import register_serializer
+
+
+def test_round_trip():
+    obj = {'status': 'SUCCESS', 'result': 'content',
+           'children': [], 'date_done': datetime.datetime(2020, 1, 2, 3, 4)}
+    payload = serialization.dumps(obj)
+    eq_(payload[:2], bytes([serialization.VERSION, 0]))
+    eq_(serialization.loads(payload), obj)
+
+
+def test_round_trip_compressed():
+    obj = {'result': 'x' * 10 * serialization.COMPRESS_MIN_SIZE}
+    payload = serialization.dumps(obj)
+    eq_(payload[1], serialization.FLAG_ZLIB)
+    ok_(len(payload) < serialization.COMPRESS_MIN_SIZE)
+    eq_(serialization.loads(payload), obj)
+
+
+@raises(ValueError)
+def test_loads_unexpected_version():
+    serialization.loads(b'\x00\x00')
+
+
+def test_register_serializer():
+    register_serializer()
+    content_type, content_encoding, payload = dumps(
+        [['/tmp/1crn.pdb', 'dssp'], {}, {}], serializer='xssp-msgpack')
+    eq_(content_type, 'application/x-xssp-msgpack')
+    eq_(loads(payload, content_type, content_encoding,
+              accept=prepare_accept_content(['xssp-msgpack'])),
+        [['/tmp/1crn.pdb', 'dssp'], {}, {}])
@@ -0,0 +1,153 @@
+import bz2
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import ANY, Mock, call, patch
+from nose.tools import eq_, ok_, raises
+from pymongo.errors import DuplicateKeyError
+
+from xssp_api.services.stockholm_cache import StockholmCache
+
+
+class TestStockholmCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    @patch('xssp_api.services.stockholm_cache.storage')
+    def test_get_miss(self, mock_storage):
+        mock_storage.find_one.return_value = None
+        cache = StockholmCache(self.root)
+
+        eq_(cache.get('abc', 'v1'), (None, False))
+        mock_storage.update_one.assert_called_once_with(
+            'cache_stats', {'_id': 'stockholm'}, {'$inc': {'misses': 1}},
+            upsert=True)
+
+    @patch('xssp_api.services.stockholm_cache.storage')
+    def test_put_get(self, mock_storage):
+        mock_storage.find_one.return_value = {'size': 10,
+                                              'databank_version': 'v1'}
+        cache = StockholmCache(self.root, max_size=1000)
+
+        cache.put('abc', 'content', 'v1')
+        ok_(os.path.isfile(cache.path('abc')))
+        eq_(os.listdir(self.root), ['abc.sto.bz2'])
+
+        eq_(cache.get('abc', 'v1'), ('content', False))
+        mock_storage.update_one.assert_any_call(
+            'stockholm_cache', {'_id': 'abc'},
+            {'$inc': {'hits': 1}, '$set': {'last_access': ANY}})
+
+    @patch('xssp_api.services.stockholm_cache.storage')
+    def test_get_stale(self, mock_storage):
+        mock_storage.find_one.return_value = {'size': 10,
+                                              'databank_version': 'v1'}
+        cache = StockholmCache(self.root)
+        cache.put('abc', 'content', 'v1')
+
+        eq_(cache.get('abc', 'v2'), (None, False))
+
+        cache.serve_stale = True
+        eq_(cache.get('abc', 'v2'), ('content', True))
+        mock_storage.update_one.assert_any_call(
+            'stockholm_cache', {'_id': 'abc'},
+            {'$inc': {'hits': 1},
+             '$set': {'last_access': ANY, 'stale': True}})
+
+    @patch('xssp_api.services.stockholm_cache.storage')
+    def test_get_hssp_path(self, mock_storage):
+        doc = {'size': 10, 'databank_version': 'v1'}
+        mock_storage.find_one.return_value = doc
+        cache = StockholmCache(self.root)
+        cache.put('abc', 'stockholm', 'v1')
+
+        convert = Mock(return_value=iter(['hs', 'sp']))
+        eq_(cache.get_hssp_path('abc', 'v1', convert),
+            (cache.hssp_path('abc'), False))
+        convert.assert_called_once_with(cache.path('abc'))
+        with bz2.open(cache.hssp_path('abc'), 'rt') as f:
+            eq_(f.read(), 'hssp')
+
+        # The second time, the derived file is used.
+        doc['hssp_source'] = os.stat(cache.path('abc')).st_mtime_ns
+        eq_(cache.get_hssp_path('abc', 'v1', convert),
+            (cache.hssp_path('abc'), False))
+        eq_(convert.call_count, 1)
+
+        # A new stockholm file replaces the derived one.
+        cache.put('abc', 'stockholm', 'v1')
+        ok_(not os.path.isfile(cache.hssp_path('abc')))
+
+    @patch('xssp_api.services.stockholm_cache.storage')
+    def test_evict(self, mock_storage):
+        cache = StockholmCache(self.root, max_size=100)
+        for id_ in ['a', 'b', 'c']:
+            open(cache.path(id_), 'w').close()
+
+        mock_storage.find_one.return_value = {'size': 300}
+        mock_storage.find.return_value = [{'_id': 'a', 'size': 150},
+                                          {'_id': 'b', 'size': 100},
+                                          {'_id': 'c', 'size': 50}]
+        cache.evict()
+
+        eq_(os.listdir(self.root), ['c.sto.bz2'])
+        mock_storage.find.assert_called_once_with(
+            'stockholm_cache', {}, sort=[('last_access', 1)], limit=16)
+        mock_storage.update_one.assert_has_calls([
+            call('cache_stats', {'_id': 'stockholm'},
+                 {'$inc': {'evictions': 1}}, upsert=True)])
+
+    @patch('xssp_api.services.stockholm_cache.storage')
+    def test_evict_lfu(self, mock_storage):
+        cache = StockholmCache(self.root, max_size=100, policy='lfu')
+
+        mock_storage.find_one.return_value = {'size': 300}
+        mock_storage.find.return_value = []
+        cache.evict()
+
+        mock_storage.find.assert_called_once_with(
+            'stockholm_cache', {}, sort=[('hits', 1), ('last_access', 1)],
+            limit=16)
+
+    @raises(ValueError)
+    def test_unexpected_policy(self):
+        StockholmCache(self.root, policy='fifo')
+
+    @patch('xssp_api.services.stockholm_cache.storage')
+    def test_start_refresh(self, mock_storage):
+        cache = StockholmCache(self.root,
+                               refresh_timeout=datetime.timedelta(hours=1))
+
+        ok_(cache.start_refresh('abc'))
+        selector = mock_storage.update_one.call_args[0][1]
+        eq_(selector['$or'][0], {'refreshing': {'$ne': True}})
+        # Claims older than the timeout are free.
+        expired = selector['$or'][1]['refresh_claimed_on']['$not']['$gt']
+        ok_(expired < datetime.datetime.utcnow() -
+            datetime.timedelta(minutes=59))
+
+        mock_storage.update_one.side_effect = DuplicateKeyError('taken')
+        ok_(not cache.start_refresh('abc'))
+
+    @patch('xssp_api.services.stockholm_cache.storage')
+    def test_sync(self, mock_storage):
+        cache = StockholmCache(self.root)
+        cache.put('abc', 'content', 'v1')
+        mock_storage.reset_mock()
+        mock_storage.find.return_value = [{'_id': 'gone'}]
+        mock_storage.find_one.return_value = {'size': 0}
+
+        cache.sync('v2')
+
+        update = mock_storage.update_one.call_args_list[0][0]
+        eq_(update[1], {'_id': 'abc'})
+        eq_(update[2]['$set']['databank_version'], 'v2')
+        mock_storage.delete_one.assert_called_once_with('stockholm_cache',
+                                                        {'_id': 'gone'})
@@ -0,0 +1,74 @@
+import bz2
+import gzip
+import os
+import tempfile
+import zipfile
+from io import BytesIO
+
+from flask import Flask
+from nose.tools import eq_, ok_
+from werkzeug.datastructures import Accept
+
+from xssp_api.frontend import streaming
+from xssp_api.frontend.streaming import (make_stream_response,
+                                         negotiate_encoding, stream_bz2_file,
+                                         stream_text, stream_zip)
+
+
+def test_negotiate_encoding():
+    accept = Accept([('gzip', 1), ('bzip2', 0.5)])
+    eq_(negotiate_encoding(accept, ['bzip2', 'gzip', 'identity']), 'gzip')
+    accept = Accept([('gzip', 1), ('bzip2', 1)])
+    eq_(negotiate_encoding(accept, ['bzip2', 'gzip', 'identity']), 'bzip2')
+    eq_(negotiate_encoding(Accept(), ['gzip', 'identity']),
+        'identity')
+
+
+def test_negotiate_encoding_wildcard():
+    eq_(negotiate_encoding(Accept([('*', 1)]), ['bzip2', 'gzip', 'identity']),
+        'gzip')
+    eq_(negotiate_encoding(Accept([('*', 1), ('bzip2', 0)]),
+                           ['bzip2', 'gzip', 'identity']), 'gzip')
+
+
+def test_stream_text():
+    text = 'x' * (streaming.CHUNK_SIZE * 2 + 1)
+    eq_(b''.join(stream_text(text, 'identity')), text.encode())
+    eq_(gzip.decompress(b''.join(stream_text(text, 'gzip'))), text.encode())
+    eq_(bz2.decompress(b''.join(stream_text(text, 'bzip2'))), text.encode())
+
+
+def test_stream_bz2_file():
+    tmp_file, path = tempfile.mkstemp(suffix='.bz2')
+    os.close(tmp_file)
+    try:
+        with bz2.open(path, 'wt') as f:
+            f.write('content')
+        with open(path, 'rb') as f:
+            stored = f.read()
+
+        eq_(b''.join(stream_bz2_file(path, 'bzip2')), stored)
+        eq_(b''.join(stream_bz2_file(path, 'identity')), b'content')
+        eq_(gzip.decompress(b''.join(stream_bz2_file(path, 'gzip'))),
+            b'content')
+    finally:
+        os.remove(path)
+
+
+def test_make_stream_response():
+    with Flask(__name__).app_context():
+        rv = make_stream_response(iter([b'content']), 'gzip', 'hssp_hssp',
+                                  '12345', 7)
+    eq_(rv.headers['Content-Encoding'], 'gzip')
+    eq_(rv.headers['Content-Length'], '7')
+    eq_(rv.headers['Content-Disposition'], 'attachment; filename=12345.hssp')
+    ok_(rv.direct_passthrough)
+
+
+def test_stream_zip():
+    data = b''.join(stream_zip([('a.dssp', [b'a' * 10, b'b' * 10]),
+                                ('b.dssp', iter([]))]))
+    with zipfile.ZipFile(BytesIO(data)) as zf:
+        eq_(zf.namelist(), ['a.dssp', 'b.dssp'])
+        eq_(zf.read('a.dssp'), b'a' * 10 + b'b' * 10)
+        eq_(zf.read('b.dssp'), b'')
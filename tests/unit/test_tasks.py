@@ -1,13 +1,16 @@
 import os
 import shutil
+import signal
 import subprocess
+import sys
 import tempfile
 import unittest
 import logging
 from io import StringIO
 
+from celery.exceptions import Ignore
 from mock import ANY, call, mock_open, patch
-from nose.tools import eq_, raises
+from nose.tools import eq_, ok_, raises
 
 from xssp_api.factory import create_app, create_celery_app
 
@@ -47,7 +50,7 @@ class TestTasks(unittest.TestCase):
         result = mkdssp_from_pdb.delay(tmp_file.name)
 
         eq_(result.get(), "output")
-        eq_(os.path.isfile(tmp_file.name), False)
+        eq_(os.path.isfile(tmp_file.name), True)
         mock_subprocess.assert_called_once_with(['mkdssp', '-i', ANY],
                                                 stderr=ANY)
 
@@ -82,7 +85,7 @@ class TestTasks(unittest.TestCase):
         result = mkhssp_from_pdb.delay(tmp_file.name, 'hssp_hssp')
 
         eq_(result.get(), "output2")
-        eq_(os.path.isfile(tmp_file.name), False)
+        eq_(os.path.isfile(tmp_file.name), True)
         mock_subprocess.assert_has_calls([
             call(['mkhssp', '-i', ANY, '-d', ANY, '-d', ANY], stderr=ANY),
             call(['hsspconv', '-i', ANY], stderr=ANY)])
@@ -97,7 +100,7 @@ class TestTasks(unittest.TestCase):
         result = mkhssp_from_pdb.delay(tmp_file.name, 'hssp_stockholm')
 
         eq_(result.get(), "output1")
-        eq_(os.path.isfile(tmp_file.name), False)
+        eq_(os.path.isfile(tmp_file.name), True)
         mock_subprocess.assert_called_once_with(['mkhssp', '-i', ANY, '-d',
                                                  ANY, '-d', ANY], stderr=ANY)
         assert not call(['hsspconv', '-i', ANY], stderr=ANY) in \
@@ -368,3 +371,103 @@ class TestTasks(unittest.TestCase):
     def test_get_task_unexpected_input_type(self):
         from xssp_api.tasks import get_task
         get_task('unexpected', 'hssp_stockholm')
+
+
+def test_stream_stockholm_to_hssp():
+    bin_dir = tempfile.mkdtemp()
+    try:
+        hsspconv_path = os.path.join(bin_dir, 'hsspconv')
+        with open(hsspconv_path, 'wt') as f:
+            f.write('#!/bin/sh\necho "HSSP from $2"\n')
+        os.chmod(hsspconv_path, 0o755)
+
+        with patch.dict(os.environ,
+                        {'PATH': bin_dir + os.pathsep + os.environ['PATH']}):
+            from xssp_api.tasks import _stream_stockholm_to_hssp
+            output = ''.join(_stream_stockholm_to_hssp('/srv/abc.sto.bz2'))
+
+        eq_(output, "HSSP from /srv/abc.sto.bz2\n")
+    finally:
+        shutil.rmtree(bin_dir)
+
+
+@raises(RuntimeError)
+def test_stream_stockholm_to_hssp_error():
+    bin_dir = tempfile.mkdtemp()
+    try:
+        hsspconv_path = os.path.join(bin_dir, 'hsspconv')
+        with open(hsspconv_path, 'wt') as f:
+            f.write('#!/bin/sh\necho "no such file" >&2\nexit 1\n')
+        os.chmod(hsspconv_path, 0o755)
+
+        with patch.dict(os.environ,
+                        {'PATH': bin_dir + os.pathsep + os.environ['PATH']}):
+            from xssp_api.tasks import _stream_stockholm_to_hssp
+            list(_stream_stockholm_to_hssp('/srv/abc.sto.bz2'))
+    finally:
+        shutil.rmtree(bin_dir)
+
+
+def _limits_app(limits):
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config['TASK_LIMITS'] = {'default': limits}
+    return app
+
+
+def test_execute_subprocess():
+    from xssp_api.tasks import _execute_subprocess
+
+    with _limits_app({'timeout': 10}).app_context():
+        output, error = _execute_subprocess(
+            ['sh', '-c', 'echo output; echo error >&2'])
+    eq_(output, "output\n")
+    eq_(error, "error\n")
+
+
+@raises(RuntimeError)
+def test_execute_subprocess_timeout():
+    from xssp_api.tasks import _execute_subprocess
+
+    with _limits_app({'timeout': 0.1}).app_context():
+        _execute_subprocess(['sleep', '10'])
+
+
+@raises(RuntimeError)
+def test_execute_subprocess_address_space():
+    from xssp_api.tasks import _execute_subprocess
+
+    with _limits_app({'address_space': 512 * 1024 ** 2}).app_context():
+        _execute_subprocess([sys.executable, '-c', 'x = bytearray(1024 ** 3)'])
+
+
+@raises(Ignore)
+@patch('xssp_api.services.commands.is_cancelled')
+def test_execute_subprocess_cancelled(mock_is_cancelled):
+    from xssp_api.tasks import _execute_subprocess
+
+    mock_is_cancelled.return_value = True
+    with _limits_app({'timeout': 10}).app_context():
+        _execute_subprocess(['sleep', '10'])
+
+
+def test_kill_subprocess():
+    from xssp_api.tasks import kill_subprocess
+
+    p = subprocess.Popen(['sleep', '10'], start_new_session=True)
+    result = kill_subprocess(None, p.pid)
+    eq_(p.wait(timeout=5), -signal.SIGKILL)
+    ok_('ok' in result)
+
+
+def test_kill_subprocess_not_session_leader():
+    from xssp_api.tasks import kill_subprocess
+
+    p = subprocess.Popen(['sleep', '10'])
+    try:
+        ok_('error' in kill_subprocess(None, p.pid))
+        eq_(p.poll(), None)
+    finally:
+        p.kill()
+        p.wait()
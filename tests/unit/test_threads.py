@@ -0,0 +1,36 @@
+import time
+
+from mock import ANY, MagicMock
+from nose.tools import eq_
+
+from xssp_api.services.threads import ThreadBudget
+
+
+def test_free():
+    client = MagicMock()
+    client.zrangebyscore.return_value = [b'a:3', b'b:1']
+    budget = ThreadBudget(client, 'node-1', 20, 60)
+
+    eq_(budget.free(), 16)
+    client.zrangebyscore.assert_called_once_with('threads:node-1', ANY, '+inf')
+
+
+def test_reserve():
+    client = MagicMock()
+    client.eval.return_value = 4
+    budget = ThreadBudget(client, 'node-1', 20, 60)
+
+    id_, threads = budget.reserve(8, 'adaptive')
+    eq_(threads, 4)
+    client.eval.assert_called_once_with(ANY, 1, 'threads:node-1', ANY, ANY,
+                                        id_, 20, 8, 'adaptive')
+    expires = client.eval.call_args[0][4]
+    eq_(round(expires - time.time()), 60)
+
+
+def test_release():
+    client = MagicMock()
+    budget = ThreadBudget(client, 'node-1', 20, 60)
+
+    budget.release('abc', 4)
+    client.zrem.assert_called_once_with('threads:node-1', 'abc:4')
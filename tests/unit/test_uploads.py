@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+from mock import patch
+from nose.tools import eq_, ok_, raises
+
+from xssp_api.services.uploads import UploadRegistry
+
+
+PDB = (b"HEADER    PLANT PROTEIN                           30-APR-81   1CRN\n"
+       b"REMARK   2 RESOLUTION. 1.50 ANGSTROMS.\n"
+       b"CRYST1   40.960   18.650   22.520  90.00  90.77  90.00 P 1 21 1\n")
+STRIPPED = (b"HEADER    PLANT PROTEIN                           30-APR-81   1CRN\n"
+            b"CRYST1   40.960   18.650   22.520  90.00  90.77  90.00 P 1 21 1\n")
+
+
+class TestUploadRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.registry = UploadRegistry()
+        patcher = patch('xssp_api.services.uploads.storage')
+        self.mock_storage = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _upload(self, filename, data, part_size):
+        upload = {'_id': 'abc', 'filename': filename, 'size': len(data),
+                  'parts': {}}
+        for n, i in enumerate(range(0, len(data), part_size)):
+            size, sha256 = self.registry.put_part(
+                upload, self.folder, n, BytesIO(data[i:i + part_size]))
+            upload['parts'][str(n)] = {'size': size, 'sha256': sha256}
+        return upload
+
+    def test_put_part(self):
+        upload = self._upload('1crn.pdb', PDB, 50)
+
+        eq_(len(upload['parts']), 4)
+        eq_(upload['parts']['1'],
+            {'size': 50, 'sha256': hashlib.sha256(PDB[50:100]).hexdigest()})
+        with open(self.registry.part_path(self.folder, 'abc', 1), 'rb') as f:
+            eq_(f.read(), PDB[50:100])
+
+    @raises(ValueError)
+    def test_put_part_checksum(self):
+        upload = {'_id': 'abc', 'filename': '1crn.pdb', 'size': len(PDB),
+                  'parts': {}}
+        try:
+            self.registry.put_part(upload, self.folder, 0, BytesIO(PDB),
+                                   hashlib.sha256(b"other").hexdigest())
+        finally:
+            eq_(os.listdir(self.folder), [])
+
+    @raises(ValueError)
+    def test_put_part_too_large(self):
+        upload = {'_id': 'abc', 'filename': '1crn.pdb', 'size': 10,
+                  'parts': {}}
+        self.registry.put_part(upload, self.folder, 0, BytesIO(PDB))
+
+    def test_get_part_paths(self):
+        self.mock_storage.find.return_value = [
+            {'_id': 'abc', 'parts': {'0': {}, '1': {}}},
+            {'_id': 'def', 'parts': {}}]
+
+        eq_(self.registry.get_part_paths(self.folder),
+            {os.path.join(self.folder, 'abc.part00000'),
+             os.path.join(self.folder, 'abc.part00001')})
+
+    def test_finalize(self):
+        upload = self._upload('1crn.pdb', PDB, 50)
+
+        path, file_hash = self.registry.finalize(upload, self.folder)
+
+        with open(path, 'rb') as f:
+            eq_(f.read(), STRIPPED)
+        eq_(file_hash, hashlib.sha256(STRIPPED).hexdigest())
+        eq_(os.listdir(self.folder), [os.path.basename(path)])
+        self.mock_storage.delete_one.assert_called_once_with(
+            'uploads', {'_id': 'abc'})
+
+    def test_finalize_gz(self):
+        upload = self._upload('1crn.pdb.gz', gzip.compress(PDB), 16)
+
+        path, file_hash = self.registry.finalize(upload, self.folder)
+
+        ok_(path.endswith('.pdb.gz'))
+        with gzip.open(path, 'rb') as f:
+            eq_(f.read(), STRIPPED)
+        eq_(file_hash, hashlib.sha256(STRIPPED).hexdigest())
+
+    @raises(ValueError)
+    def test_finalize_gz_corrupt(self):
+        data = bytearray(gzip.compress(PDB))
+        data[12:20] = b'\xff' * 8
+        upload = self._upload('1crn.pdb.gz', bytes(data), 16)
+
+        self.registry.finalize(upload, self.folder)
+
+    @raises(ValueError)
+    def test_finalize_missing_part(self):
+        upload = self._upload('1crn.pdb', PDB, 50)
+        del upload['parts']['1']
+
+        self.registry.finalize(upload, self.folder)
@@ -66,39 +66,56 @@ def test_pdb_redo_id_strategy_dssp(mock_get_task):
     eq_(result_id, '12345')
 
 
+def _create_app():
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config['MKHSSP_COST_TIERS'] = [('short', 300), ('long', None)]
+    return app
+
+
+@patch('xssp_api.services.xssp.get_structure_size')
 @patch('xssp_api.tasks.get_task')
-def test_pdb_file_strategy_hssp(mock_get_task):
+def test_pdb_file_strategy_hssp(mock_get_task, mock_get_structure_size):
     mock_get_task.return_value.__name__ = 'mock_task'
-    mock_get_task.return_value.delay.return_value.id = '12345'
+    mock_get_task.return_value.apply_async.return_value.id = '12345'
+    mock_get_structure_size.return_value = (1000, 2)
 
     strategy = PdbContentStrategy('hssp_hssp', '1crn')
-    result_id = strategy()
-    mock_get_task.return_value.delay.assert_called_once_with('1crn',
-                                                             'hssp_hssp')
+    with _create_app().app_context():
+        result_id = strategy()
+    mock_get_task.return_value.apply_async.assert_called_once_with(
+        ('1crn', 'hssp_hssp'), queue='mkhssp_long')
     eq_(result_id, '12345')
+    eq_(strategy.queue, 'mkhssp_long')
+    eq_(strategy.features, {'residues': 1000, 'chains': 2})
 
 
+@patch('xssp_api.services.xssp.get_structure_size')
 @patch('xssp_api.tasks.get_task')
-def test_pdb_file_strategy_dssp(mock_get_task):
+def test_pdb_file_strategy_dssp(mock_get_task, mock_get_structure_size):
     mock_get_task.return_value.__name__ = 'mock_task'
+    mock_get_structure_size.return_value = (1000, 2)
     mock_get_task.return_value.delay.return_value.id = '12345'
 
     strategy = PdbContentStrategy('dssp', '1crn')
     result_id = strategy()
-    mock_get_task.return_value.delay.assert_called_once_with('1crn')
+    mock_get_task.return_value.delay.assert_called_once_with('1crn', 'dssp')
     eq_(result_id, '12345')
 
 
 @patch('xssp_api.tasks.get_task')
 def test_sequence_strategy_hssp(mock_get_task):
     mock_get_task.return_value.__name__ = 'mock_task'
-    mock_get_task.return_value.delay.return_value.id = '12345'
+    mock_get_task.return_value.apply_async.return_value.id = '12345'
 
     strategy = SequenceStrategy('hssp_hssp', '1crn')
-    result_id = strategy()
-    mock_get_task.return_value.delay.assert_called_once_with('1crn',
-                                                             'hssp_hssp')
+    with _create_app().app_context():
+        result_id = strategy()
+    mock_get_task.return_value.apply_async.assert_called_once_with(
+        ('1crn', 'hssp_hssp'), queue='mkhssp_short')
     eq_(result_id, '12345')
+    eq_(strategy.features, {'residues': 3, 'chains': 1})
 
 
 @patch('xssp_api.tasks.get_task')
@@ -118,3 +135,21 @@ def test_sequence_strategy_hg_hssp(mock_get_task):
 def test_sequence_strategy_dssp():
     strategy = SequenceStrategy('dssp', '1crn')
     strategy()
+
+
+def test_get_request_hash():
+    from flask import Flask
+    from xssp_api.services.xssp import get_request_hash
+
+    app = Flask(__name__)
+    app.config.update({'DSSP_ROOT': '/dssp/',
+                       'XSSP_DATABANKS': ['/uniprot_sprot.fasta']})
+    with app.app_context():
+        hash_1 = get_request_hash('pdb_id', 'dssp', pdb_id='1CRN')
+        eq_(hash_1, get_request_hash('pdb_id', 'dssp', pdb_id='1crn'))
+
+        hash_2 = get_request_hash('sequence', 'hssp_hssp', sequence='ACD EF\n')
+        eq_(hash_2, get_request_hash('sequence', 'hssp_hssp',
+                                     sequence='ACDEF'))
+        ok_(hash_2 != get_request_hash('sequence', 'hssp_stockholm',
+                                       sequence='ACDEF'))
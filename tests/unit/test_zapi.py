@@ -32,6 +32,13 @@ class TestEndpoints(object):
         eq_(response['id'], 12345)
         mock_call.assert_called_once_with()
 
+    def test_create_xssp_pdb_file_corrupt_gz(self):
+        rv = self.app.post('/api/create/pdb_file/dssp/',
+                           data={'file_': (BytesIO(b'not-gzip-data'),
+                                           'fake.pdb.gz')})
+        eq_(rv.status_code, 400)
+        ok_('error' in json.loads(rv.data))
+
     def test_create_xssp_pdb_file_dssp_no_data(self):
         rv = self.app.post('/api/create/pdb_file/dssp/')
         eq_(rv.status_code, 400)
@@ -158,6 +165,30 @@ class TestEndpoints(object):
         rv = self.app.get('/api/result/sequence/unknown/12345/')
         eq_(rv.status_code, 400)
 
+    @patch('xssp_api.frontend.api.endpoints.storage.find_one')
+    @patch('xssp_api.tasks.mkhssp_from_sequence.AsyncResult')
+    def test_download_xssp_result_sequence_hssp(self, mock_result,
+                                                mock_find_one):
+        mock_result.return_value.status = 'SUCCESS'
+        mock_result.return_value.get.return_value = 'content-of-result'
+        mock_find_one.return_value = {'task_id': '12345'}
+        rv = self.app.get('/api/download/sequence/hssp_hssp/12345/',
+                          headers={'Accept-Encoding': 'identity'})
+        eq_(rv.status_code, 200)
+        eq_(rv.data, b'content-of-result')
+        eq_(rv.headers['Content-Disposition'],
+            'attachment; filename=12345.hssp')
+
+    @patch('xssp_api.frontend.api.endpoints.os.stat')
+    def test_get_xssp_entry_not_found(self, mock_stat):
+        mock_stat.side_effect = FileNotFoundError
+        rv = self.app.get('/api/get/pdb_id/dssp/1crn/')
+        eq_(rv.status_code, 404)
+
+    def test_get_xssp_entry_no_databank(self):
+        rv = self.app.get('/api/get/sequence/dssp/1crn/')
+        eq_(rv.status_code, 400)
+
     def test_api_doc(self):
         from xssp_api.frontend.api import endpoints
 
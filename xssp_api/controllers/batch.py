@@ -0,0 +1,44 @@
+import re
+from typing import List, Tuple
+
+
+RE_ID_SEPARATOR = re.compile(r"[\s,;]+")
+
+
+def split_fasta(text: str) -> List[Tuple[str, str]]:
+    """
+    Split multiple sequence FASTA input into single sequence FASTA entries.
+
+    Text before the first description line is taken as a sequence without
+    description.
+
+    :return: A list of tuples of the entry's name and the entry itself. The
+             name is the first word of the description, or 'sequence_<n>'
+             for the n-th entry if it has no description.
+    """
+
+    entries = []
+    for chunk in re.split(r"\n(?=>)", text.replace('\r', '').strip()):
+        if len(chunk.strip()) == 0:
+            continue
+
+        name = 'sequence_{}'.format(len(entries) + 1)
+        if chunk.startswith('>'):
+            words = chunk.split('\n', 1)[0][1:].split()
+            if len(words) > 0:
+                name = words[0]
+        entries.append((name, chunk.strip() + '\n'))
+
+    return entries
+
+
+def split_ids(text: str) -> List[Tuple[str, str]]:
+    """
+    Split a list of pdb ids, separated by whitespace, commas or semicolons.
+
+    :return: A list of tuples of the entry's name and the id, both in lower
+             case.
+    """
+
+    return [(id_.lower(), id_.lower())
+            for id_ in RE_ID_SEPARATOR.split(text.strip()) if len(id_) > 0]
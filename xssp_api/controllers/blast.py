@@ -1,11 +1,16 @@
+import hashlib
+import json
 import os
 import logging
+import re
+import sqlite3
 import subprocess
 import tempfile
 from bz2 import BZ2File
-import xml.etree.ElementTree as ET
 
 import xssp_api.default_settings as settings
+from xssp_api.services.commands import Command
+from xssp_api.frontend.validators import RE_FASTA_DESCRIPTION
 
 
 _log = logging.getLogger(__name__)
@@ -35,29 +40,228 @@ def get_stockholm_sequences(path):
     return sequences
 
 
+def get_sequence_index_path(databank_path):
+    return databank_path + '.seqidx'
+
+
+def get_sequence_key(sequence):
+    """
+    Get the key of a sequence in the sequence index: the sha256 of the
+    sequence without FASTA description and whitespace, in upper case.
+    """
+    sequence = re.sub(RE_FASTA_DESCRIPTION, '', sequence)
+    return hashlib.sha256(''.join(sequence.split()).upper().encode()).hexdigest()
+
+
+def find_exact_sequence(sequence, databank_path):
+    """
+    Look the sequence up in the index that is made next to the databank.
+
+    :return: A list of tuples of the path and chain of the HSSP files with
+             exactly this sequence. The list is empty if there's no index.
+    """
+    index_path = get_sequence_index_path(databank_path)
+    if not os.path.isfile(index_path):
+        _log.warning("No sequence index at '{}'".format(index_path))
+        return []
+
+    db = sqlite3.connect('file:{}?mode=ro'.format(index_path), uri=True)
+    try:
+        return db.execute('SELECT path, chain FROM sequences WHERE key = ?',
+                          (get_sequence_key(sequence),)).fetchall()
+    finally:
+        db.close()
+
+
+def get_manifest_path(databank_path):
+    return databank_path + '.manifest'
+
+
+def get_built_path(databank_path):
+    return databank_path + '.built'
+
+
+def _create_manifest_tables(db):
+    db.execute('CREATE TABLE IF NOT EXISTS files '
+               '(path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, '
+               'size INTEGER NOT NULL, sequences TEXT)')
+    db.execute('CREATE TABLE IF NOT EXISTS generation (value INTEGER)')
+
+
+def _raise_manifest_generation(db):
+    if db.execute('UPDATE generation SET value = value + 1').rowcount == 0:
+        db.execute('INSERT INTO generation VALUES (1)')
+
+
+def get_manifest_generation(manifest_path):
+    """
+    :return: The generation of the manifest, which is raised whenever files
+             are added, changed or removed. It's 0 for a new manifest.
+    """
+    db = sqlite3.connect(manifest_path)
+    try:
+        _create_manifest_tables(db)
+        row = db.execute('SELECT value FROM generation').fetchone()
+        return row[0] if row is not None else 0
+    finally:
+        db.close()
+
+
+def update_manifest(hssp_dir_path, manifest_path):
+    """
+    Bring the manifest of the HSSP files in the directory up to date.
+
+    The manifest keeps the mtime, size and chain sequences of every file, so
+    that only files that are new or changed since the last update have to
+    be parsed. Files that can't be parsed are kept without sequences, so
+    that they aren't parsed again until they change.
+
+    The generation of the manifest is raised with the first change, see
+    get_manifest_generation.
+
+    :return: The number of files that were added, changed or removed.
+    """
+    db = sqlite3.connect(manifest_path)
+    try:
+        _create_manifest_tables(db)
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in
+                 db.execute('SELECT path, mtime_ns, size FROM files')}
+
+        changed = 0
+        for filename in os.listdir(hssp_dir_path):
+            if not filename.endswith('.hssp.bz2') and not filename.endswith('.sto.bz2'):
+                continue
+            path = os.path.join(hssp_dir_path, filename)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if known.pop(path, None) == (st.st_mtime_ns, st.st_size):
+                continue
+
+            try:
+                sequences = json.dumps(get_stockholm_sequences(path))
+            except Exception as e:
+                _log.warn("skipping {}: {}".format(path, str(e)))
+                sequences = None
+
+            if changed == 0:
+                _raise_manifest_generation(db)
+            db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                       (path, st.st_mtime_ns, st.st_size, sequences))
+            changed += 1
+            # Keep the progress if the update is interrupted.
+            if changed % 1000 == 0:
+                db.commit()
+
+        if changed == 0 and len(known) > 0:
+            _raise_manifest_generation(db)
+        db.executemany('DELETE FROM files WHERE path = ?',
+                       [(path,) for path in known])
+        db.commit()
+    finally:
+        db.close()
+
+    _log.info("{} files changed and {} removed in '{}'".format(
+        changed, len(known), hssp_dir_path))
+    return changed + len(known)
+
+
+def iter_manifest(manifest_path):
+    """
+    :return: A generator of tuples of the path of every file in the manifest
+             that could be parsed and its chain sequences by chain.
+    """
+    db = sqlite3.connect(manifest_path)
+    try:
+        for path, sequences in db.execute(
+                'SELECT path, sequences FROM files '
+                'WHERE sequences IS NOT NULL ORDER BY path'):
+            yield path, json.loads(sequences)
+    finally:
+        db.close()
+
+
 def create_databank(hssp_dir_path, databank_path):
+    """
+    Make a blast databank of the chain sequences of the HSSP files in the
+    directory, and an index of the files and chains by exact sequence.
+
+    The sequences are taken from the manifest next to the databank, which is
+    updated first, see update_manifest. The generation of the manifest that
+    the databank was last built from is kept next to it. If it's still the
+    current generation, the databank and indexes are left as they are.
+
+    The index is built next to the databank and replaces the old one when
+    it's complete, as is the k-mer index of the sequences, see
+    xssp_api.controllers.kmer.
+    """
+    from xssp_api.controllers.kmer import CHAINS_SUFFIX, write_kmer_index
+
+    manifest_path = get_manifest_path(databank_path)
+    index_path = get_sequence_index_path(databank_path)
+    built_path = get_built_path(databank_path)
+    update_manifest(hssp_dir_path, manifest_path)
+    generation = get_manifest_generation(manifest_path)
+    if _read_built_generation(built_path) == generation and \
+            os.path.isfile(databank_path + '.psq') and \
+            os.path.isfile(index_path) and \
+            os.path.isfile(databank_path + CHAINS_SUFFIX):
+        _log.info("Databank '{}' is up to date".format(databank_path))
+        return
+
+    # A build that fails or is interrupted leaves the databank out of date.
+    if os.path.isfile(built_path):
+        os.remove(built_path)
+
     fasta_path = tempfile.mktemp()
+    # Next to the databank, so that it can be moved into place.
+    chains_path = databank_path + CHAINS_SUFFIX + '.tmp'
+    tmp_index_path = index_path + '.tmp'
+    if os.path.isfile(tmp_index_path):
+        os.remove(tmp_index_path)
     try:
-        with open(fasta_path, 'wt') as f:
-            for filename in os.listdir(hssp_dir_path):
-                if not filename.endswith('.hssp.bz2') and not filename.endswith('.sto.bz2'):
-                    continue
-                path = os.path.join(hssp_dir_path, filename)
-                try:
-                    sequences = get_stockholm_sequences(path)
-                except Exception as e:
-                    _log.warn("skipping {}: {}".format(path, str(e)))
-                    continue
-
+        with open(fasta_path, 'wt') as f, open(chains_path, 'wt') as chains, \
+                sqlite3.connect(tmp_index_path) as db:
+            db.execute('CREATE TABLE sequences '
+                       '(key TEXT NOT NULL, path TEXT NOT NULL, '
+                       'chain TEXT NOT NULL)')
+            for path, sequences in iter_manifest(manifest_path):
                 _log.debug("adding {} chains {}".format(path, sequences.keys()))
                 for chain in sequences:
                     f.write(">%s:%s\n%s\n" % (path, chain, sequences[chain]))
+                    chains.write("%s\t%s\t%s\n" % (path, chain,
+                                                   sequences[chain]))
+                db.executemany('INSERT INTO sequences VALUES (?, ?, ?)',
+                               [(get_sequence_key(sequences[chain]), path,
+                                 chain) for chain in sequences])
+
+            db.execute('CREATE INDEX sequences_key ON sequences (key)')
+        db.close()
 
-        subprocess.call([settings.MAKEBLASTDB, '-in', fasta_path,
-                         '-dbtype', 'prot', '-out', databank_path])
+        subprocess.check_call([settings.MAKEBLASTDB, '-in', fasta_path,
+                               '-dbtype', 'prot', '-out', databank_path])
+        os.replace(tmp_index_path, index_path)
+        write_kmer_index(chains_path, databank_path)
+
+        with open(built_path + '.tmp', 'wt') as f:
+            f.write('%d\n' % generation)
+        os.replace(built_path + '.tmp', built_path)
     finally:
         if os.path.isfile(fasta_path):
             os.remove(fasta_path)
+        if os.path.isfile(chains_path):
+            os.remove(chains_path)
+        if os.path.isfile(tmp_index_path):
+            os.remove(tmp_index_path)
+
+
+def _read_built_generation(built_path):
+    try:
+        with open(built_path, 'rt') as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
 
 
 class BlastAlignment(object):
@@ -71,45 +275,101 @@ class BlastAlignment(object):
         self.subj_alignment = subj_alignment
 
 
-def blast_databank(sequence, databank_path):
-    fasta_path = tempfile.mktemp()
-    result_path = tempfile.mktemp()
+# The tabular output columns of blastp. stitle is the FASTA description of
+# the subject, which is '<path>:<chain>' in our databanks, and comes last
+# because it may contain spaces.
+BLAST_COLUMNS = ['qseqid', 'qstart', 'qend', 'qseq', 'sstart', 'send', 'sseq',
+                 'stitle']
+
 
+def parse_blast_hits(lines):
+    """
+    Parse tabular blastp output with the columns in BLAST_COLUMNS.
+
+    :return: A generator of tuples of the query id, the subject title and the
+             BlastAlignment of every HSP, in the order of the output.
+    """
+    for line in lines:
+        line = line.rstrip('\n')
+        if len(line) == 0 or line.startswith('#'):
+            continue
+
+        (query_id, query_start, query_end, query_alignment, subj_start,
+         subj_end, subj_alignment, title) = line.split('\t', 7)
+        yield query_id, title, BlastAlignment(int(query_start),
+                                              int(query_end),
+                                              query_alignment,
+                                              int(subj_start), int(subj_end),
+                                              subj_alignment)
+
+
+def _run_blastp(fasta, databank_path):
+    # Runs blastp on the queries in the FASTA text and yields the parsed
+    # hits. blastp is killed when the generator is closed early.
+    #
+    # The queries are passed in a file rather than on stdin. blastp may write
+    # the hits for the first queries of a batch before reading the others,
+    # and then stop reading when its stdout is full, while the rest of the
+    # queries would still be waiting to be written.
+    tmp_file, tmp_path = tempfile.mkstemp(prefix='hssp_api_tmp',
+                                          suffix='.fasta')
     try:
-        with open(fasta_path, 'wt') as f:
-            f.write('>1\n%s\n' % sequence)
-
-        subprocess.call([settings.BLASTP, '-query', fasta_path,
-                         '-db', databank_path, '-outfmt', '5',
-                         '-out', result_path])
-
-        root = ET.parse(result_path).getroot()
-        hits = {}
-
-        iterations = root.find('BlastOutput_iterations')
-        for it in iterations.findall('Iteration'):
-            for mem in it.findall('Iteration_hits'):
-                for hit in mem.findall('Hit'):
-
-                    hitID = hit.find('Hit_def').text
-                    hits[hitID] = []
-
-                    hsps = hit.find('Hit_hsps')
-                    for hsp in hsps.findall('Hsp'):
-                        querystart = int(hsp.find('Hsp_query-from').text)
-                        queryend = int(hsp.find('Hsp_query-to').text)
-                        queryali = hsp.find('Hsp_qseq').text
-
-                        subjstart = int(hsp.find('Hsp_hit-from').text)
-                        subjend = int(hsp.find('Hsp_hit-to').text)
-                        subjali = hsp.find('Hsp_hseq').text
-
-                        hits[hitID].append(BlastAlignment(querystart, queryend,
-                                                          queryali, subjstart,
-                                                          subjend, subjali))
-        return hits
+        with os.fdopen(tmp_file, 'wt') as f:
+            f.write(fasta)
+
+        args = [settings.BLASTP, '-query', tmp_path, '-db', databank_path,
+                '-outfmt', '6 ' + ' '.join(BLAST_COLUMNS)]
+        with Command(args) as command:
+            yield from parse_blast_hits(command.stdout)
     finally:
-        if os.path.isfile(fasta_path):
-            os.remove(fasta_path)
-        if os.path.isfile(result_path):
-            os.remove(result_path)
+        os.remove(tmp_path)
+
+
+def get_query_sequence(sequence):
+    """
+    Get the residues of a sequence as the sequence validator accepts it:
+    without FASTA description, whitespace, sequence numbers and asterisks.
+    """
+    sequence = re.sub(RE_FASTA_DESCRIPTION, '', sequence)
+    return re.sub(r'\s+|\d+|\*', '', sequence).upper()
+
+
+def iter_blast_hits(sequence, databank_path):
+    """
+    Search the databank for the sequence with blastp.
+
+    The output is parsed as blastp writes it, rather than after it exits.
+    blastp writes it in chunks once the search is done, though, so this
+    mostly saves holding all hits in memory. When the caller stops iterating
+    and closes the generator, blastp is killed.
+
+    :return: A generator of tuples of the subject title and the
+             BlastAlignment of every HSP.
+    """
+    fasta = '>1\n%s\n' % get_query_sequence(sequence)
+    for _, title, alignment in _run_blastp(fasta, databank_path):
+        yield title, alignment
+
+
+def blast_queries(queries, databank_path):
+    """
+    Search the databank for several sequences with a single blastp run, so
+    that the databank is loaded only once.
+
+    :param queries: A dict of sequences by query id. The ids must not contain
+                    whitespace.
+    :return: A dict with a list of tuples of the subject title and the
+             BlastAlignment of every HSP, in rank order, by query id.
+    """
+    # The sequences may have a FASTA description, whose first word blastp
+    # would take for the query id.
+    fasta = ''.join('>%s\n%s\n' % (id_, get_query_sequence(sequence))
+                    for id_, sequence in queries.items())
+
+    hits = {id_: [] for id_ in queries}
+    for query_id, title, alignment in _run_blastp(fasta, databank_path):
+        if query_id not in hits:
+            _log.warning("Hit for unknown query '{}'".format(query_id))
+            continue
+        hits[query_id].append((title, alignment))
+    return hits
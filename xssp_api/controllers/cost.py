@@ -0,0 +1,70 @@
+import os
+import re
+from typing import List, Optional, Tuple
+
+from xssp_api.frontend.validators import RE_FASTA_DESCRIPTION
+
+
+# A residue takes about eight ATOM records of 81 bytes in a PDB file.
+BYTES_PER_RESIDUE = 650
+
+
+def get_sequence_cost(sequence: str):
+    """
+    Estimate the cost of running mkhssp on a sequence, in residues.
+    """
+
+    sequence = re.sub(RE_FASTA_DESCRIPTION, '', sequence)
+    return len(re.sub(r'\s+|\d+|\*', '', sequence))
+
+
+def get_structure_size(path: str):
+    """
+    Get the total length of the distinct chains in a structure file, in
+    residues, and the number of chains.
+
+    The lengths are taken from the SEQRES records, which are at the start of
+    the file, so only the header is read. Files without SEQRES records, such
+    as mmCIF files, are estimated by their size, as a single chain.
+    """
+
+    chains = {}
+    with open(path, 'rt', errors='replace') as f:
+        for line in f:
+            if line.startswith(('ATOM  ', 'HETATM', 'MODEL ')):
+                break
+            if line.startswith('SEQRES'):
+                chain = line[11]
+                chains[chain] = chains.get(chain, '') + line[19:].strip() + ' '
+
+    if len(chains) == 0:
+        return os.path.getsize(path) // BYTES_PER_RESIDUE, 1
+
+    residues = sum(len(r.split()) for r in set(chains.values()))
+    return residues, len(chains)
+
+
+def get_structure_cost(path: str):
+    """
+    Estimate the cost of running mkhssp on a structure file, in residues.
+
+    mkhssp makes an alignment for every distinct chain, so the cost is the
+    total length of the distinct chains.
+    """
+
+    return get_structure_size(path)[0]
+
+
+def get_tier(cost: int, tiers: List[Tuple[str, Optional[int]]]):
+    """
+    Get the name of the first tier whose maximum cost isn't exceeded.
+
+    :param tiers: A list of tuples of the tier name and its maximum cost,
+                  cheapest first. A maximum of None means unbounded.
+    """
+
+    for name, max_cost in tiers:
+        if max_cost is None or cost <= max_cost:
+            return name
+
+    return tiers[-1][0]
@@ -1,4 +1,6 @@
 import hashlib
+import os
+from typing import List
 
 
 def get_identifier(sequence: str):
@@ -8,3 +10,66 @@ def get_identifier(sequence: str):
     id_ = hashlib.md5(sequence.encode()).hexdigest()
 
     return id_
+
+
+def normalize_sequence(sequence: str):
+    """
+    Normalize sequence or single sequence FASTA input.
+
+    The FASTA description line is kept as is, whitespace is removed from the
+    sequence itself.
+    """
+
+    lines = sequence.replace('\r', '').strip().split('\n')
+
+    description = ''
+    if lines[0].startswith('>'):
+        description = lines.pop(0).strip()
+
+    return description + '\n' + ''.join(''.join(lines).split())
+
+
+def get_file_hash(path: str):
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def get_databank_version(paths: List[str]):
+    """
+    Fingerprint the given databank files by their path, mtime and size.
+
+    Missing files are part of the fingerprint too, so that the version changes
+    when a databank appears or disappears.
+    """
+
+    h = hashlib.md5()
+    for path in sorted(paths):
+        if os.path.exists(path):
+            st = os.stat(path)
+            h.update(f"{path}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+        else:
+            h.update(f"{path}:missing\n".encode())
+
+    return h.hexdigest()
+
+
+def get_input_hash(input_type: str, output_type: str, input_data: str,
+                   databank_version: str = ''):
+    """
+    Get the key under which the result for the given input is cached.
+
+    :param input_data: the normalized pdb id, sequence or hash of the uploaded
+                       file content.
+    """
+
+    h = hashlib.sha256()
+    for part in [input_type, output_type, input_data, databank_version]:
+        h.update(part.encode())
+        h.update(b'\0')
+
+    return h.hexdigest()
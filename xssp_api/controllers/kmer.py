@@ -0,0 +1,248 @@
+import array
+import logging
+import mmap
+import os
+import re
+from collections import Counter
+from itertools import accumulate
+from typing import List, Tuple
+
+from xssp_api.controllers.blast import BlastAlignment
+from xssp_api.domain.method import is_almost_same
+from xssp_api.frontend.validators import RE_FASTA_DESCRIPTION
+
+
+_log = logging.getLogger(__name__)
+
+
+K = 5
+ALPHABET = 'ACDEFGHIKLMNPQRSTVWY'
+_CODES = {aa: i for i, aa in enumerate(ALPHABET)}
+N_KMERS = len(ALPHABET) ** K
+
+# A chain is a candidate if it shares at least this fraction of the k-mers
+# of the query. A chain with 95% identity shares at least 75% of them when the
+# mismatches are spread out.
+MIN_SHARED = 0.5
+MAX_CANDIDATES = 10
+
+# The width of the band around the diagonal in the identity check, besides
+# the difference in length. Candidates that differ more in length are left to
+# blastp.
+BAND = 16
+MAX_LENGTH_DIFFERENCE = 100
+
+OFFSETS_SUFFIX = '.kmer.offsets'
+POSTINGS_SUFFIX = '.kmer.postings'
+CHAINS_SUFFIX = '.kmer.chains'
+
+
+def iter_kmers(sequence: str):
+    """
+    :return: A generator of the codes of the k-mers in the sequence, skipping
+             those with letters outside ALPHABET.
+    """
+    code = 0
+    length = 0
+    for aa in sequence:
+        i = _CODES.get(aa)
+        if i is None:
+            length = 0
+            continue
+        code = (code * len(ALPHABET) + i) % N_KMERS
+        length += 1
+        if length >= K:
+            yield code
+
+
+def write_kmer_index(chains_path: str, prefix: str):
+    """
+    Write a k-mer index of the chains in the given file, which has a line
+    with the path, chain and sequence of every chain, separated by tabs.
+
+    The index consists of an array with the offset in the postings of every
+    k-mer and the postings, which list the numbers of the chains that have
+    the k-mer. The postings are filled in through a memory map, so they don't
+    have to fit in memory.
+    """
+    counts = array.array('I', bytes(4 * (N_KMERS + 1)))
+    with open(chains_path, 'rt') as f:
+        for line in f:
+            for code in set(iter_kmers(line.rstrip('\n').split('\t')[2])):
+                counts[code + 1] += 1
+
+    counts = array.array('I', accumulate(counts))
+    total = counts[N_KMERS]
+
+    tmp_suffix = '.tmp'
+    with open(prefix + OFFSETS_SUFFIX + tmp_suffix, 'wb') as f:
+        counts.tofile(f)
+
+    with open(prefix + POSTINGS_SUFFIX + tmp_suffix, 'w+b') as f:
+        f.truncate(4 * total)
+        if total > 0:
+            with mmap.mmap(f.fileno(), 4 * total) as m:
+                postings = memoryview(m).cast('I')
+                positions = array.array('I', counts[:N_KMERS])
+                with open(chains_path, 'rt') as chains:
+                    for n, line in enumerate(chains):
+                        sequence = line.rstrip('\n').split('\t')[2]
+                        for code in set(iter_kmers(sequence)):
+                            postings[positions[code]] = n
+                            positions[code] += 1
+                postings.release()
+
+    _log.info("Indexed {} k-mer postings".format(total))
+    os.replace(prefix + OFFSETS_SUFFIX + tmp_suffix, prefix + OFFSETS_SUFFIX)
+    os.replace(prefix + POSTINGS_SUFFIX + tmp_suffix, prefix + POSTINGS_SUFFIX)
+    os.replace(chains_path, prefix + CHAINS_SUFFIX)
+
+
+def banded_align(query: str, subject: str, band: int):
+    """
+    Globally align two sequences, only considering cells within band of the
+    diagonal. Matches score 1, mismatches -1 and gaps -2.
+
+    :return: A tuple of the aligned query and subject, with '-' for gaps, or
+             None if the end can't be reached within the band.
+    """
+    n, m = len(query), len(subject)
+    band = max(band, abs(n - m))
+    gap = -2
+    minus_inf = float('-inf')
+
+    # Rows of scores and traceback moves, indexed by j - i + band.
+    width = 2 * band + 1
+    scores = [[minus_inf] * width for _ in range(n + 1)]
+    moves = [[None] * width for _ in range(n + 1)]
+    scores[0][band] = 0
+    for j in range(1, min(m, band) + 1):
+        scores[0][band + j] = gap * j
+        moves[0][band + j] = 'l'
+
+    for i in range(1, n + 1):
+        for j in range(max(0, i - band), min(m, i + band) + 1):
+            d = j - i + band
+            best, move = minus_inf, None
+            if j > 0:
+                s = scores[i - 1][d] + (1 if query[i - 1] == subject[j - 1]
+                                        else -1)
+                if s > best:
+                    best, move = s, 'd'
+            if d + 1 < width and scores[i - 1][d + 1] + gap > best:
+                best, move = scores[i - 1][d + 1] + gap, 'u'
+            if j > 0 and d > 0 and scores[i][d - 1] + gap > best:
+                best, move = scores[i][d - 1] + gap, 'l'
+            scores[i][d], moves[i][d] = best, move
+
+    if (n, m) != (0, 0) and moves[n][m - n + band] is None:
+        return None
+
+    aligned_query, aligned_subject = [], []
+    i, j = n, m
+    while i > 0 or j > 0:
+        move = moves[i][j - i + band]
+        if move == 'd':
+            aligned_query.append(query[i - 1])
+            aligned_subject.append(subject[j - 1])
+            i, j = i - 1, j - 1
+        elif move == 'u':
+            aligned_query.append(query[i - 1])
+            aligned_subject.append('-')
+            i -= 1
+        else:
+            aligned_query.append('-')
+            aligned_subject.append(subject[j - 1])
+            j -= 1
+
+    return ''.join(reversed(aligned_query)), ''.join(reversed(aligned_subject))
+
+
+class KmerIndex(object):
+    """
+    A k-mer index of chain sequences, made by write_kmer_index.
+
+    The offsets and postings are memory mapped, so the index is shared by
+    the processes on a node through the page cache.
+    """
+
+    def __init__(self, prefix):
+        self._files = []
+        self.offsets = self._map(prefix + OFFSETS_SUFFIX)
+        self.postings = self._map(prefix + POSTINGS_SUFFIX)
+
+        self.chains = []
+        with open(prefix + CHAINS_SUFFIX, 'rt') as f:
+            for line in f:
+                path, chain, sequence = line.rstrip('\n').split('\t')
+                self.chains.append((path, chain, sequence))
+
+    def _map(self, path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b'').cast('I')
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files.append(m)
+        return memoryview(m).cast('I')
+
+    def candidates(self, sequence: str) -> List[Tuple[str, str, str]]:
+        """
+        :return: The path, chain and sequence of the chains that share the
+                 most k-mers with the sequence, at least MIN_SHARED of them.
+        """
+        kmers = set(iter_kmers(sequence))
+        counts = Counter()
+        for code in kmers:
+            counts.update(self.postings[self.offsets[code]:
+                                        self.offsets[code + 1]])
+
+        min_shared = MIN_SHARED * len(kmers)
+        return [self.chains[n]
+                for n, count in counts.most_common(MAX_CANDIDATES)
+                if count >= min_shared]
+
+    def find(self, sequence: str) -> List[Tuple[str, str]]:
+        """
+        :return: The path and chain of the candidates that are almost the
+                 same as the sequence.
+        """
+        sequence = re.sub(RE_FASTA_DESCRIPTION, '', sequence)
+        sequence = ''.join(sequence.split()).upper()
+
+        found = []
+        for path, chain, subject in self.candidates(sequence):
+            if abs(len(subject) - len(sequence)) > MAX_LENGTH_DIFFERENCE:
+                continue
+
+            alignment = banded_align(sequence, subject, BAND)
+            if alignment is None:
+                continue
+
+            query_alignment, subj_alignment = alignment
+            if is_almost_same(sequence, BlastAlignment(
+                    1, len(sequence), query_alignment,
+                    1, len(subject), subj_alignment)):
+                found.append((path, chain))
+        return found
+
+
+_indexes = {}
+
+
+def get_kmer_index(databank_path):
+    """
+    Get the k-mer index made next to the databank, loaded once per process
+    and again when it's been rebuilt.
+
+    :return: The index, or None if there's none.
+    """
+    prefix = databank_path
+    try:
+        mtime = os.stat(prefix + CHAINS_SUFFIX).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if prefix not in _indexes or _indexes[prefix][0] != mtime:
+        _log.info("Loading k-mer index '{}'".format(prefix))
+        _indexes[prefix] = (mtime, KmerIndex(prefix))
+    return _indexes[prefix][1]
@@ -0,0 +1,70 @@
+from typing import Dict, List, Optional, Tuple
+
+
+# The input features a runtime is predicted from, besides a constant term.
+FEATURES = ['residues', 'chains']
+
+# Keeps the fit stable when a feature hardly varies.
+RIDGE = 1e-6
+
+
+def _get_vector(features: Dict[str, float]):
+    return [1.0] + [float(features.get(name) or 0) for name in FEATURES]
+
+
+def _solve(a: List[List[float]], b: List[float]):
+    # Gaussian elimination with partial pivoting.
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+        if m[col][col] == 0:
+            continue
+        for r in range(col + 1, n):
+            factor = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= factor * m[col][c]
+
+    x = [0.0] * n
+    for r in reversed(range(n)):
+        if m[r][r] != 0:
+            x[r] = (m[r][n] - sum(m[r][c] * x[c]
+                                  for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+def fit_runtime_model(samples: List[Tuple[Dict[str, float], float]]):
+    """
+    Fit a linear model of the runtime on the input features by least
+    squares.
+
+    :param samples: A list of tuples of the features and the runtime in
+                    seconds.
+    :return: The coefficients, the constant term first.
+    """
+
+    n = len(FEATURES) + 1
+    ata = [[RIDGE if i == j else 0.0 for j in range(n)] for i in range(n)]
+    atb = [0.0] * n
+    for features, runtime in samples:
+        v = _get_vector(features)
+        for i in range(n):
+            atb[i] += v[i] * runtime
+            for j in range(n):
+                ata[i][j] += v[i] * v[j]
+
+    return _solve(ata, atb)
+
+
+def predict_runtime(coefficients: Optional[List[float]],
+                    features: Dict[str, float]):
+    """
+    :return: The predicted runtime in seconds, or None without a model.
+    """
+
+    if coefficients is None:
+        return None
+
+    v = _get_vector(features)
+    return max(0.0, sum(c * x for c, x in zip(coefficients, v)))
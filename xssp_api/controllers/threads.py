@@ -0,0 +1,21 @@
+def choose_threads(policy: str, queue_depth: int, free: int,
+                   max_threads: int):
+    """
+    Choose the number of threads for a mkhssp job.
+
+    The 'fixed' policy always runs single-threaded. The 'adaptive' policy
+    shares the free threads of the node between this job and the jobs that
+    are still waiting in the queue: a job started on an empty queue gets all
+    free threads, up to max_threads, and a job started on a long queue gets
+    one.
+
+    :param queue_depth: The number of jobs waiting in the queue.
+    :param free: The number of threads left in the node's budget.
+    """
+
+    if policy == 'fixed':
+        return 1
+    elif policy == 'adaptive':
+        return max(1, min(max_threads, free // (1 + max(queue_depth, 0))))
+
+    raise ValueError("Unexpected thread policy '{}'".format(policy))
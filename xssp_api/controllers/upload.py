@@ -0,0 +1,113 @@
+import bz2
+import datetime
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import zlib
+from typing import BinaryIO, Tuple
+
+
+_log = logging.getLogger(__name__)
+
+
+# Uploads with these extensions are decompressed to filter them.
+_DECOMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open}
+
+# Compressed uploads are saved gzip compressed, which both mkdssp and mkhssp
+# read. A low level keeps it cheap; the file only lives until clean_uploads.
+_COMPRESS_LEVEL = 1
+
+
+def save_structure(stream: BinaryIO, filename: str,
+                   folder: str) -> Tuple[str, str]:
+    """
+    Save an uploaded structure file in a single pass.
+
+    REMARK records are left out, because mkdssp and mkhssp choke on some of
+    them. gzip or bzip2 compressed uploads are filtered on the fly and saved
+    gzip compressed again, so that no decompressed copy is kept.
+
+    The file is named by the sha256 of its decompressed content, keeping the
+    extension of the upload, with '.gz' for a compressed upload. It's written
+    to a temporary file first, so that concurrent uploads of the same content
+    can't see a partially written file.
+
+    :return: The path of the saved file and the sha256 of its content.
+    :raises ValueError: If a compressed upload is corrupt or truncated.
+    """
+
+    root, ext = os.path.splitext(filename)
+    lines = stream
+    compressed = ext.lower() in _DECOMPRESSORS
+    if compressed:
+        stream = _DECOMPRESSORS[ext.lower()](stream, 'rb')
+        lines = _decompress_lines(stream, filename)
+        # An upload like '1crn.gz' has no extension left.
+        root, ext = os.path.splitext(root)
+        ext += '.gz'
+
+    h = hashlib.sha256()
+    tmp_file, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with stream, os.fdopen(tmp_file, 'wb') as raw:
+            f = gzip.GzipFile(fileobj=raw, mode='wb',
+                              compresslevel=_COMPRESS_LEVEL) \
+                if compressed else raw
+            with f:
+                for line in lines:
+                    if not line.startswith(b"REMARK "):
+                        f.write(line)
+                        h.update(line)
+
+        path = os.path.join(folder, h.hexdigest() + ext.lower())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+
+    return path, h.hexdigest()
+
+
+def _decompress_lines(stream, filename):
+    # Errors while decompressing are errors in the upload, unlike errors
+    # while writing the saved file.
+    try:
+        yield from stream
+    except (OSError, EOFError, zlib.error) as e:
+        raise ValueError("Corrupt compressed file '{}': {}".format(filename,
+                                                                   e)) from e
+
+
+def get_structure_id(path: str):
+    """Get the id of a saved structure file, the sha256 of its content."""
+    return os.path.basename(path).split('.')[0]
+
+
+def clean_uploads(folder: str, max_age: datetime.timedelta,
+                  keep: frozenset = frozenset()):
+    """
+    Remove the uploaded files that haven't been uploaded again for max_age.
+
+    :param keep: The paths of files to leave, like the parts of unfinished
+                 chunked uploads. Those age by the last part received for
+                 their upload instead, see UploadRegistry.clean.
+    :return: The number of removed files.
+    """
+
+    min_mtime = time.time() - max_age.total_seconds()
+    n = 0
+    for entry in os.scandir(folder):
+        if entry.path in keep:
+            continue
+        if entry.is_file() and entry.stat().st_mtime < min_mtime:
+            _log.debug("Removing upload '{}'".format(entry.path))
+            try:
+                os.remove(entry.path)
+                n += 1
+            except FileNotFoundError:
+                pass
+
+    return n
@@ -1,16 +1,26 @@
+import datetime
+
 from celery.schedules import crontab
 from kombu import Exchange, Queue
 
 # Celery
-CELERY_TASK_SERIALIZER = 'pickle'
-CELERY_RESULT_SERIALIZER='pickle'
-CELERY_ACCEPT_CONTENT = ['pickle']
+# The serializer is registered in xssp_api.serialization.
+CELERY_TASK_SERIALIZER = 'xssp-msgpack'
+CELERY_RESULT_SERIALIZER = 'xssp-msgpack'
+# Messages and results written with pickle before the switch to xssp-msgpack
+# may still be queued or stored at deploy time, so pickle is still accepted.
+# Drop it in the release after, when they've all been consumed or expired.
+CELERY_ACCEPT_CONTENT = ['xssp-msgpack', 'pickle']
 CELERY_BROKER_URL = 'amqp://guest@rabbitmq'
 CELERY_DEFAULT_QUEUE = 'xssp'
 default_exchange = Exchange('xssp', type='direct')
 CELERY_QUEUES = (
     Queue('xssp', default_exchange, routing_key='xssp'),
     Queue('mkhssp', default_exchange, routing_key='mkhssp'),
+    Queue('mkhssp_short', default_exchange, routing_key='mkhssp_short'),
+    Queue('mkhssp_medium', default_exchange, routing_key='mkhssp_medium'),
+    Queue('mkhssp_long', default_exchange, routing_key='mkhssp_long'),
+    Queue('mkhssp_refresh', default_exchange, routing_key='mkhssp_refresh'),
 )
 CELERY_RESULT_BACKEND = 'redis://redis/0'
 CELERY_TRACK_STARTED = True
@@ -20,6 +30,26 @@ CELERYBEAT_SCHEDULE = {
         'task': 'xssp_api.tasks.remove_old_tasks',
         'schedule': crontab(hour=0, minute=0),
     },
+    # Every day at one o'clock
+    'clean_stockholm_cache': {
+        'task': 'xssp_api.tasks.clean_stockholm_cache',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    # Every day at two o'clock
+    'clean_blobs': {
+        'task': 'xssp_api.tasks.clean_blobs',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    # Every day at three o'clock
+    'clean_uploads_folder': {
+        'task': 'xssp_api.tasks.clean_uploads_folder',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    # Every hour
+    'fit_runtime_models': {
+        'task': 'xssp_api.tasks.fit_runtime_models',
+        'schedule': crontab(minute=30),
+    },
 }
 
 # xssp
@@ -29,6 +59,16 @@ XSSP_DATABANKS = ['/mnt/chelonium/uniprot/uniprot_sprot.fasta',
 # uploads
 UPLOAD_FOLDER = '/tmp/xssp-api/uploads'
 ALLOWED_EXTENSIONS = ['bdb', 'bz2', 'cif', 'ent', 'gz', 'mcif', 'pdb']
+# Uploads are kept for jobs on the same structure, and removed when they
+# haven't been uploaded again for UPLOAD_MAX_AGE. It must be longer than jobs
+# may wait in the queue.
+UPLOAD_MAX_AGE = datetime.timedelta(days=2)
+# The maximum size of a file sent in parts, see /api/upload/. A single part
+# is limited by MAX_CONTENT_LENGTH.
+UPLOAD_MAX_SIZE = 1024 ** 3
+
+# The maximum number of entries in a batch submission
+BATCH_MAX_SIZE = 1000
 
 # HSSP and DSSP databank locations
 DSSP_ROOT = '/mnt/chelonium/dssp/'
@@ -36,9 +76,74 @@ DSSP_REDO_ROOT = '/mnt/chelonium/dssp_redo/'
 HSSP_ROOT = '/mnt/chelonium/hssp/'
 HG_HSSP_ROOT = '/mnt/chelonium/hg-hssp'
 HSSP_STO_ROOT = '/mnt/chelonium/hssp3/'
+# Roots of the databanks that nginx serves from internal locations, for
+# example {DSSP_ROOT: '/internal/dssp/'}. Plain text entries under these roots
+# are handed off to nginx with X-Accel-Redirect.
+ACCEL_REDIRECT_LOCATIONS = {}
 PDB_ROOT = '/mnt/chelonium/pdb/all/'
 PDB_REDO_ROOT = '/mnt/chelonium/pdb_redo/'
 HSSP_STO_CACHE = "/srv/hssp3"
+# Byte budget of the stockholm cache (None means unbounded) and the eviction
+# policy: 'lru' or 'lfu'.
+HSSP_STO_CACHE_MAX_SIZE = 100 * 1024 ** 3
+HSSP_STO_CACHE_POLICY = 'lru'
+# Keep serving entries made from older databanks while they're recomputed on
+# the mkhssp_refresh queue.
+HSSP_STO_CACHE_SERVE_STALE = True
+# A refresh that hasn't replaced its entry after this long, for example
+# because its worker died, may be queued again. It must exceed the timeout of
+# refresh_stockholm_cache in TASK_LIMITS plus its wait in the queue.
+HSSP_STO_CACHE_REFRESH_TIMEOUT = datetime.timedelta(hours=12)
+
+# Limits on the subprocesses of tasks, by task name, with the limits of
+# 'default' for other tasks. The timeout is in wall-clock seconds, the
+# address_space in bytes and the cpu_time in seconds. None means unlimited.
+# mkhssp memory-maps the XSSP_DATABANKS, so an address_space limit for it must
+# leave room for all of them.
+TASK_LIMITS = {
+    'default': {'timeout': 3600, 'address_space': None, 'cpu_time': None},
+    'xssp_api.tasks.mkhssp_from_pdb': {'timeout': 6 * 3600},
+    'xssp_api.tasks.mkhssp_from_sequence': {'timeout': 6 * 3600},
+    'xssp_api.tasks.refresh_stockholm_cache': {'timeout': 6 * 3600},
+}
+
+# mkhssp jobs are routed to the mkhssp_<tier> queue of the first tier whose
+# maximum cost, in residues, isn't exceeded.
+MKHSSP_COST_TIERS = [('short', 300), ('medium', 1500), ('long', None)]
+
+# Threads for mkhssp (its -a option). The 'fixed' policy runs every job
+# single-threaded. The 'adaptive' policy gives jobs more threads, up to
+# MKHSSP_MAX_THREADS, when the mkhssp queue is short. Either way the jobs on a
+# node, MKHSSP_NODE or the hostname, share MKHSSP_THREAD_BUDGET threads. Every
+# job gets at least one thread, so the budget must be at least the number of
+# mkhssp worker processes on the node. Workers in containers must share a
+# MKHSSP_NODE, because each container has a hostname of its own.
+# docker-compose.yml runs 6 + 8 + 6 + 2 = 22 mkhssp worker processes.
+MKHSSP_THREAD_POLICY = 'fixed'
+MKHSSP_THREAD_BUDGET = 24
+MKHSSP_MAX_THREADS = 8
+MKHSSP_NODE = None
+
+# The number of workers per queue, as in docker-compose.yml, from which the
+# start of queued jobs is estimated.
+QUEUE_CONCURRENCY = {'xssp': 10, 'mkhssp': 6, 'mkhssp_short': 6,
+                     'mkhssp_medium': 8, 'mkhssp_long': 6}
+
+# Task outputs of at least BLOB_MIN_SIZE characters are kept in the blob store
+# instead of the result backend. Blobs that haven't been reused for
+# BLOB_MAX_AGE are removed, which must be longer than results are kept.
+BLOB_ROOT = '/srv/blobs'
+BLOB_MIN_SIZE = 64 * 1024
+BLOB_MAX_AGE = datetime.timedelta(days=7)
+
+# Leases on running mkhssp jobs. Tasks waiting for a lease are retried every
+# LEASE_RETRY_INTERVAL seconds. A lease expires LEASE_TTL seconds after its
+# holder stopped sending heartbeats.
+LEASE_REDIS_URL = 'redis://redis/1'
+LEASE_TTL = 60
+LEASE_RETRY_INTERVAL = 60
+# Lease held while looking up and queueing a job for an input.
+SUBMIT_LEASE_TTL = 5
 
 # Database
 MONGODB_URI = 'mongodb://mongo'
@@ -52,6 +157,21 @@ BLASTP = '/usr/bin/blastp'
 HG_HSSP_DATABANK = '/srv/blast/hg-hssp'
 HSSP_STO_DATABANK = '/srv/blast/hssp3'
 
+# hg_hssp searches arriving within HG_HSSP_BATCH_WINDOW seconds of each other
+# are run together, up to HG_HSSP_BATCH_MAX_SIZE in a single blastp call,
+# which loads the databank once. A search that isn't answered within
+# HG_HSSP_BATCH_TIMEOUT seconds is run alone. A window of 0 disables batching.
+# Batches are led through leases shared by all workers, so that across the
+# cluster no more than HG_HSSP_BATCH_LEADERS blastp batches run at a time for
+# a databank. Searches beyond those wait for the next batch.
+HG_HSSP_BATCH_WINDOW = 0.2
+HG_HSSP_BATCH_MAX_SIZE = 32
+HG_HSSP_BATCH_TIMEOUT = 600
+HG_HSSP_BATCH_LEADERS = 4
+
+# admin endpoints, disabled unless a token is set
+ADMIN_TOKEN = None
+
 # support
 ADMINISTRATOR_EMAIL = "coos.baakman@radboudumc.nl"
 MAIL_SERVER = "smtp.umcn.nl"
@@ -94,8 +94,10 @@ def create_app(settings=None):
     # Register blueprints
     from xssp_api.frontend.api.endpoints import bp as api_bp
     from xssp_api.frontend.dashboard.views import bp as dashboard_bp
+    from xssp_api.frontend.admin.views import bp as admin_bp
     app.register_blueprint(api_bp)
     app.register_blueprint(dashboard_bp)
+    app.register_blueprint(admin_bp)
 
     # Database
     from xssp_api.storage import storage
@@ -110,6 +112,9 @@ def create_app(settings=None):
     from xssp_api.services.mail import mail
     mail.smtp_hostname = app.config["MAIL_SERVER"]
 
+    from xssp_api.services.jobs import jobs
+    jobs.task_limits = app.config["TASK_LIMITS"]
+
     return app
 
 
@@ -118,6 +123,9 @@ def create_celery_app(app):  # pragma: no cover
 
     app = app or create_app()
 
+    from xssp_api.serialization import register_serializer
+    register_serializer()
+
     celery = Celery(__name__,
                     backend='amqp',
                     broker=app.config['CELERY_BROKER_URL'])
@@ -0,0 +1,57 @@
+import hmac
+import logging
+
+from flask import Blueprint, abort, current_app as app, request
+from flask.json import jsonify
+
+from xssp_api.services.stockholm_cache import get_stockholm_cache
+
+_log = logging.getLogger(__name__)
+
+bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+
+@bp.before_request
+def before_request():
+    """Only allow requests that carry the configured admin token."""
+    token = app.config.get('ADMIN_TOKEN')
+    given = request.headers.get('X-Admin-Token', '')
+    if not token or not hmac.compare_digest(given, token):
+        abort(403)
+
+
+@bp.route('/cache/stockholm/', methods=['GET'])
+def get_stockholm_cache_entries():
+    """
+    Get the stockholm cache counters and entries.
+
+    The entries are listed in eviction order, the first to be evicted first.
+    The number of entries can be set with the 'limit' query parameter.
+    """
+    cache = get_stockholm_cache()
+    limit = request.args.get('limit', 100, type=int)
+
+    entries = [{'id': d['_id'],
+                'size': d.get('size'),
+                'hssp_size': d.get('hssp_size', 0),
+                'hits': d.get('hits'),
+                'databank_version': d.get('databank_version'),
+                'stale': d.get('stale', False),
+                'last_access': d.get('last_access'),
+                'created_on': d.get('created_on')}
+               for d in cache.entries(limit)]
+
+    return jsonify({'stats': cache.stats(), 'entries': entries})
+
+
+@bp.route('/cache/stockholm/purge/', methods=['POST'])
+def purge_stockholm_cache():
+    """
+    Remove the entry given by the 'id' form parameter from the stockholm
+    cache, or all entries if no id is given.
+    """
+    id_ = request.form.get('id', None)
+    n = get_stockholm_cache().purge(id_)
+    _log.info("Purged {} entries from the stockholm cache".format(n))
+
+    return jsonify({'purged': n})
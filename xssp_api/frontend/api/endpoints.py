@@ -1,13 +1,28 @@
+import datetime
 import inspect
 import logging
+import os
 import re
-import datetime
+import uuid
 
-from flask import g, Blueprint, current_app as app, render_template, request
+from flask import (g, Blueprint, current_app as app, render_template, request,
+                   Response)
 from flask.json import jsonify
+from werkzeug.utils import secure_filename
 
+from xssp_api.controllers.batch import split_fasta, split_ids
 from xssp_api.frontend.dashboard.forms import XsspForm
-from xssp_api.services.xssp import process_request
+from xssp_api.frontend.streaming import (get_filename, make_stream_response,
+                                         negotiate_encoding, stream_bz2_file,
+                                         stream_file, stream_text, stream_zip)
+from xssp_api.services.blobs import resolve_result
+from xssp_api.services.databanks import get_accel_redirect, get_entry_path
+from xssp_api.services.eta import get_runtime_models
+from xssp_api.services.groups import groups
+from xssp_api.services.jobs import jobs
+from xssp_api.services.results import get_stored_result
+from xssp_api.services.uploads import uploads
+from xssp_api.services.xssp import process_batch, process_request
 from xssp_api.storage import storage
 from xssp_api import get_version
 
@@ -28,7 +43,8 @@ def create_xssp(input_type, output_type):
 
     :param input_type: Either 'pdb_id', 'pdb_redo_id', 'pdb_file' or 'sequence'.
     :param output_type: Either 'hssp_hssp', 'hssp_stockholm', 'hg_hssp', or 'dssp'.
-    :return: The id of the job.
+    :return: The id of the job, and a subscription token with which this
+             request can cancel the job.
     """
     form = XsspForm(allowed_extensions=app.config['ALLOWED_EXTENSIONS'],
                     meta={'csrf': False})
@@ -39,16 +55,18 @@ def create_xssp(input_type, output_type):
     form.file_.data = request.files.get('file_', None)
     
     if form.validate():
-        celery_id = process_request(form.input_type.data, form.output_type.data,
-                                    form.pdb_id.data, request.files,
-                                    form.sequence.data)
-
-        storage.insert_one('tasks', {'task_id': celery_id,
-                                    'input_type': input_type,
-                                    'output_type': output_type,
-                                    'created_on': datetime.datetime.utcnow()})
-
-        return jsonify({'id': celery_id}), 202
+        subscription = uuid.uuid4().hex
+        try:
+            celery_id = process_request(form.input_type.data,
+                                        form.output_type.data,
+                                        form.pdb_id.data, request.files,
+                                        form.sequence.data,
+                                        subscriber=subscription)
+        except ValueError as e:
+            # A corrupt compressed upload.
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({'id': celery_id, 'subscription': subscription}), 202
     return jsonify(form.errors), 400
 
 
@@ -62,6 +80,9 @@ def get_xssp_status(input_type, output_type, id):
     :param output_type: Either 'hssp_hssp', 'hssp_stockholm', or 'dssp'.
     :param id: The id returned by a call to the create method.
     :return: Either PENDING, STARTED, SUCCESS, FAILURE, RETRY, or REVOKED.
+             Unfinished jobs also get the queue_position and the
+             estimated_start and estimated_completion in UTC, as far as they
+             can be estimated.
     """
     from xssp_api.tasks import get_task
     task = get_task(input_type, output_type)
@@ -70,9 +91,59 @@ def get_xssp_status(input_type, output_type, id):
     response = {'status': async_result.status}
     if async_result.failed():
         response.update({'message': async_result.traceback})
+
+    doc = storage.find_one('tasks', {'task_id': id})
+    if doc is not None and 'input_type' in doc and \
+            async_result.status in ['PENDING', 'STARTED', 'RETRY']:
+        estimate = get_runtime_models().estimate(doc, async_result.status)
+        for key, value in estimate.items():
+            if isinstance(value, datetime.datetime):
+                value = value.isoformat(timespec='seconds') + 'Z'
+            response[key] = value
     return jsonify(response)
 
 
+@bp.route('/cancel/<input_type>/<output_type>/<id>/', methods=['POST'])
+def cancel_xssp(input_type, output_type, id):
+    """
+    Cancel a job submission that hasn't finished yet. A running job is
+    stopped right away.
+
+    The same input may have been submitted by others, who got the same id. The
+    job then keeps running until all of them cancelled it. The subscription
+    token returned by the create method must be set in a form parameter
+    called 'subscription', so that a request can only cancel for itself.
+
+    :param input_type:
+        Either 'pdb_id', 'pdb_redo_id', 'pdb_file' or 'sequence'.
+    :param output_type: Either 'hssp_hssp', 'hssp_stockholm', or 'dssp'.
+    :param id: The id returned by a call to the create method.
+    :return: The status of the job, which is REVOKED if it was cancelled.
+    """
+    from xssp_api.tasks import cancel_task, get_task
+    task = get_task(input_type, output_type)
+    async_result = task.AsyncResult(id)
+
+    if storage.find_one('tasks', {'task_id': id}) is None:
+        return jsonify({'error': 'job not found'}), 404
+    if async_result.status not in jobs.in_flight_states:
+        return jsonify({'error': 'job status is {}'.format(
+            async_result.status)}), 409
+
+    subscription = request.form.get('subscription')
+    if not subscription:
+        return jsonify({'error': 'no subscription'}), 400
+
+    # Cancelling again, or for a subscription of another job, has no effect.
+    remaining = jobs.unsubscribe(id, subscription)
+    if remaining is None or remaining > 0:
+        return jsonify({'status': async_result.status})
+
+    _log.info("Cancelling job '{}'".format(id))
+    cancel_task(id)
+    return jsonify({'status': 'REVOKED'})
+
+
 @bp.route('/result/<input_type>/<output_type>/<id>/', methods=['GET'])
 def get_xssp_result(input_type, output_type, id):
     """
@@ -93,7 +164,10 @@ def get_xssp_result(input_type, output_type, id):
     if async_result.status != 'SUCCESS':
         return jsonify({'error': 'job status is {}'.format(async_result.status)}), 500
 
-    result = async_result.get()
+    try:
+        result = resolve_result(async_result.get())
+    except FileNotFoundError:
+        return jsonify({'error': 'result has expired'}), 500
     if len(result) <= 0:
         return jsonify({'error': 'empty result'}), 500
 
@@ -101,11 +175,348 @@ def get_xssp_result(input_type, output_type, id):
     return jsonify(response)
 
 
+@bp.route('/download/<input_type>/<output_type>/<id>/', methods=['GET'])
+def download_xssp_result(input_type, output_type, id):
+    """
+    Download the result of a previous job submission as a file.
+
+    The result is streamed as plain text, and compressed if the request's
+    Accept-Encoding header allows for 'gzip' or 'bzip2'. Results that are
+    stored bzip2 compressed are sent as stored when 'bzip2' is accepted.
+
+    :param input_type:
+        Either 'pdb_id', 'pdb_redo_id', 'pdb_file' or 'sequence'.
+    :param output_type: Either 'hssp_hssp', 'hssp_stockholm', or 'dssp'.
+    :param id: The id returned by a call to the create method.
+    :return: The output of the job. If the job status is not SUCCESS, this
+             method returns an error.
+    """
+    from xssp_api.tasks import get_task
+    task = get_task(input_type, output_type)
+
+    async_result = task.AsyncResult(id)
+    if async_result.status != 'SUCCESS':
+        return jsonify({'error': 'job status is {}'.format(async_result.status)}), 500
+
+    try:
+        path, result = get_stored_result(id, async_result)
+    except FileNotFoundError:
+        return jsonify({'error': 'result has expired'}), 500
+
+    if path is not None:
+        encoding = negotiate_encoding(request.accept_encodings,
+                                      ['bzip2', 'gzip', 'identity'])
+        length = os.path.getsize(path) if encoding == 'bzip2' else None
+        return make_stream_response(stream_bz2_file(path, encoding), encoding,
+                                    output_type, id, length)
+
+    if len(result) <= 0:
+        return jsonify({'error': 'empty result'}), 500
+
+    encoding = negotiate_encoding(request.accept_encodings,
+                                  ['gzip', 'bzip2', 'identity'])
+    return make_stream_response(stream_text(result, encoding), encoding,
+                                output_type, id)
+
+
+@bp.route('/get/<input_type>/<output_type>/<id>/', methods=['GET'])
+def get_xssp_entry(input_type, output_type, id):
+    """
+    Get precomputed DSSP or HSSP data for a PDB entry, without creating a job.
+
+    Supports conditional requests with If-None-Match and If-Modified-Since.
+    The data is compressed as described for the download method.
+
+    :param input_type: Either 'pdb_id' or 'pdb_redo_id'.
+    :param output_type: Either 'hssp_hssp', 'hssp_stockholm', or 'dssp'. Only
+                        'dssp' is available for 'pdb_redo_id'.
+    :param id: The pdb id or pdb-redo id.
+    :return: The data. If there's no precomputed data, this method returns an
+             error.
+    """
+    try:
+        path = get_entry_path(input_type, output_type, id)
+        st = os.stat(path)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({'error': 'no data for {}'.format(id)}), 404
+
+    compressed = path.endswith('.bz2')
+    if compressed:
+        encoding = negotiate_encoding(request.accept_encodings,
+                                      ['bzip2', 'gzip', 'identity'])
+    else:
+        encoding = negotiate_encoding(request.accept_encodings,
+                                      ['gzip', 'bzip2', 'identity'])
+
+    # Every encoding of the entry is a different representation, with its
+    # own etag.
+    name = id.lower()
+    etag = '{:x}-{:x}-{}'.format(st.st_mtime_ns, st.st_size, encoding)
+    last_modified = datetime.datetime.fromtimestamp(int(st.st_mtime),
+                                                    datetime.timezone.utc)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = request.if_modified_since is not None and \
+            request.if_modified_since >= last_modified
+
+    if not_modified:
+        response = Response(status=304)
+    elif not compressed and get_accel_redirect(path) is not None:
+        # nginx doesn't pass a Content-Encoding on, so only plain text
+        # entries are handed off. nginx compresses them itself if enabled.
+        response = make_stream_response([], 'identity', output_type, name)
+        response.headers['X-Accel-Redirect'] = get_accel_redirect(path)
+    elif compressed:
+        length = st.st_size if encoding == 'bzip2' else None
+        response = make_stream_response(stream_bz2_file(path, encoding),
+                                        encoding, output_type, name, length)
+    else:
+        length = st.st_size if encoding == 'identity' else None
+        response = make_stream_response(stream_file(path, encoding),
+                                        encoding, output_type, name, length)
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+@bp.route('/upload/initiate/<input_type>/<output_type>/', methods=['POST'])
+def initiate_upload(input_type, output_type):
+    """
+    Start a chunked upload of a large structure file.
+
+    The file is sent in numbered parts to the part method, which can be
+    retried until the part is in. The job is created by the finalize method
+    once all parts are in. The filename and the size of the file in bytes
+    must be set in form parameters called 'filename' and 'size'.
+
+    :param input_type: Must be 'pdb_file'.
+    :param output_type: Either 'hssp_hssp', 'hssp_stockholm', 'mmcif' or
+        'dssp'.
+    :return: The id of the upload.
+    """
+    from xssp_api.tasks import get_task
+    try:
+        get_task(input_type, output_type)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if input_type != 'pdb_file':
+        return jsonify({'error': 'only pdb_file can be uploaded'}), 400
+
+    filename = secure_filename(request.form.get('filename', ''))
+    allowed = {e.lower() for e in app.config['ALLOWED_EXTENSIONS']}
+    if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in allowed:
+        return jsonify({'error': 'Only the following file extensions are '
+                        'supported: .{}'.format(' .'.join(sorted(allowed)))}), 400
+
+    try:
+        size = int(request.form.get('size', ''))
+    except ValueError:
+        return jsonify({'error': 'size must be a number of bytes'}), 400
+    if not 0 < size <= app.config['UPLOAD_MAX_SIZE']:
+        return jsonify({'error': 'size must be between 1 and {} bytes'.format(
+            app.config['UPLOAD_MAX_SIZE'])}), 400
+
+    upload_id = uploads.create(input_type, output_type, filename, size)
+    return jsonify({'id': upload_id}), 201
+
+
+@bp.route('/upload/part/<id>/<n>/', methods=['PUT'])
+def put_upload_part(id, n):
+    """
+    Send a part of a chunked upload.
+
+    The request body is the content of the part. Parts are numbered from 0,
+    in the order in which they're joined. A part that is sent again replaces
+    the earlier copy. If the X-Content-SHA256 header is set, the part is only
+    accepted if its hash matches.
+
+    :param id: The id returned by a call to the initiate method.
+    :param n: The number of the part.
+    :return: The size and sha256 of the part as received.
+    """
+    upload = uploads.get(id)
+    if upload is None:
+        return jsonify({'error': 'upload not found'}), 404
+    if not n.isdigit():
+        return jsonify({'error': 'part number must be a number'}), 400
+
+    try:
+        size, sha256 = uploads.put_part(upload, app.config['UPLOAD_FOLDER'],
+                                        int(n), request.stream,
+                                        request.headers.get('X-Content-SHA256'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'part': int(n), 'size': size, 'sha256': sha256})
+
+
+@bp.route('/upload/status/<id>/', methods=['GET'])
+def get_upload_status(id):
+    """
+    Get the parts of a chunked upload that are in, to resume an upload.
+
+    :param id: The id returned by a call to the initiate method.
+    :return: The size of the file, the number of bytes received and the size
+        and sha256 of every part that is in.
+    """
+    upload = uploads.get(id)
+    if upload is None:
+        return jsonify({'error': 'upload not found'}), 404
+
+    return jsonify({'filename': upload['filename'],
+                    'size': upload['size'],
+                    'received': sum(p['size']
+                                    for p in upload['parts'].values()),
+                    'parts': upload['parts']})
+
+
+@bp.route('/upload/finalize/<id>/', methods=['POST'])
+def finalize_upload(id):
+    """
+    Join the parts of a chunked upload and create the job.
+
+    :param id: The id returned by a call to the initiate method.
+    :return: The id of the job, to be used with the status and result
+        methods, and a subscription token to cancel it with.
+    """
+    upload = uploads.get(id)
+    if upload is None:
+        return jsonify({'error': 'upload not found'}), 404
+
+    try:
+        file_path, file_hash = uploads.finalize(upload,
+                                                app.config['UPLOAD_FOLDER'])
+    except ValueError as e:
+        # Missing parts, or a corrupt compressed upload.
+        return jsonify({'error': str(e)}), 400
+
+    subscription = uuid.uuid4().hex
+    celery_id = process_request(upload['input_type'], upload['output_type'],
+                                file_path=file_path, file_hash=file_hash,
+                                subscriber=subscription)
+    return jsonify({'id': celery_id, 'subscription': subscription}), 202
+
+
+@bp.route('/batch/create/<input_type>/<output_type>/', methods=['POST'])
+def create_batch(input_type, output_type):
+    """
+    Create HSSP or DSSP data for a batch of inputs.
+
+    Adds a job to a queue for every distinct input. The inputs must be set in
+    a form parameter called 'data': either multiple sequence FASTA, or pdb ids
+    separated by whitespace or commas.
+
+    :param input_type: Either 'pdb_id', 'pdb_redo_id' or 'sequence'.
+    :param output_type: Either 'hssp_hssp', 'hssp_stockholm', 'hg_hssp', or 'dssp'.
+    :return: The id of the group of jobs.
+    """
+    if input_type == 'sequence':
+        entries = split_fasta(request.form.get('data', ''))
+    elif input_type in ['pdb_id', 'pdb_redo_id']:
+        entries = split_ids(request.form.get('data', ''))
+    else:
+        return jsonify({'input_type': ['Not supported for batches.']}), 400
+
+    if len(entries) == 0:
+        return jsonify({'data': ['This field is required.']}), 400
+    if len(entries) > app.config['BATCH_MAX_SIZE']:
+        return jsonify({'data': ['At most {} entries are allowed.'.format(
+            app.config['BATCH_MAX_SIZE'])]}), 400
+
+    errors = {}
+    for name, input_data in entries:
+        form = XsspForm(meta={'csrf': False})
+        form.input_type.data = input_type
+        form.output_type.data = output_type
+        form.sequence.data = input_data
+        form.pdb_id.data = input_data
+        if not form.validate():
+            errors[name] = form.errors
+    if len(errors) > 0:
+        return jsonify(errors), 400
+
+    group_id = process_batch(input_type, output_type, entries)
+    return jsonify({'id': group_id}), 202
+
+
+@bp.route('/batch/status/<id>/', methods=['GET'])
+def get_batch_status(id):
+    """
+    Get the status of a previous batch submission.
+
+    :param id: The id returned by a call to the batch create method.
+    :return: The status of the batch and of each of its members. The batch
+             status is SUCCESS when all members succeeded, FAILURE when all
+             finished but some failed, and otherwise PENDING or STARTED.
+    """
+    group = groups.get(id)
+    if group is None:
+        return jsonify({'error': 'no batch {}'.format(id)}), 404
+
+    status, members = groups.status(group)
+    counts = {}
+    for member in members:
+        counts[member['status']] = counts.get(member['status'], 0) + 1
+
+    return jsonify({'status': status, 'counts': counts, 'members': members})
+
+
+@bp.route('/batch/result/<id>/', methods=['GET'])
+def get_batch_result(id):
+    """
+    Get the results of a previous batch submission as a zip archive.
+
+    :param id: The id returned by a call to the batch create method.
+    :return: A zip archive with a file per member. If the batch status is not
+             SUCCESS, this method returns an error.
+    """
+    group = groups.get(id)
+    if group is None:
+        return jsonify({'error': 'no batch {}'.format(id)}), 404
+
+    status, members = groups.status(group)
+    if status != 'SUCCESS':
+        return jsonify({'error': 'batch status is {}'.format(status)}), 500
+
+    from xssp_api.tasks import get_task
+    task = get_task(group['input_type'], group['output_type'])
+
+    def iter_members():
+        for i, member in enumerate(members):
+            filename = get_filename('{:05d}_{}'.format(
+                i + 1, secure_filename(member['name'])), group['output_type'])
+            path, result = get_stored_result(
+                member['task_id'], task.AsyncResult(member['task_id']))
+            if path is not None:
+                yield filename, stream_bz2_file(path, 'identity')
+            else:
+                yield filename, stream_text(result, 'identity')
+
+    return Response(stream_zip(iter_members()), content_type='application/zip',
+                    headers={'Content-Disposition':
+                             'attachment; filename={}.zip'.format(id)},
+                    direct_passthrough=True)
+
+
 @bp.route('/', methods=['GET'])
 def api_doc():
     fs = [create_xssp,
           get_xssp_status,
-          get_xssp_result]
+          cancel_xssp,
+          initiate_upload,
+          put_upload_part,
+          get_upload_status,
+          finalize_upload,
+          get_xssp_result,
+          download_xssp_result,
+          get_xssp_entry,
+          create_batch,
+          get_batch_status,
+          get_batch_result]
     docs = {}
     for f in fs:
         src = inspect.getsourcelines(f)
@@ -130,7 +541,8 @@ def api_examples():
 
 @bp.route('/queued/', methods=['GET'])
 def get_queued():
-    res = storage.find('tasks', {})
+    # Skip the documents of tasks that weren't submitted as jobs.
+    res = storage.find('tasks', {'input_type': {'$exists': True}})
 
     from xssp_api.tasks import get_task
 
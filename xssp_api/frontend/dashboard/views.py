@@ -1,5 +1,6 @@
 import logging
 import traceback
+import uuid
 
 from flask import (Blueprint, current_app as app, g, redirect, render_template,
                    request, url_for)
@@ -20,15 +21,24 @@ def index():
     _log.debug("request for index")
     form = XsspForm(allowed_extensions=app.config['ALLOWED_EXTENSIONS'])
     if form.validate_on_submit():
-        celery_id = process_request(form.input_type.data, form.output_type.data,
-                                    form.pdb_id.data, request.files,
-                                    form.sequence.data)
+        subscription = uuid.uuid4().hex
+        try:
+            celery_id = process_request(form.input_type.data,
+                                        form.output_type.data,
+                                        form.pdb_id.data, request.files,
+                                        form.sequence.data,
+                                        subscriber=subscription)
+        except ValueError as e:
+            # A corrupt compressed upload.
+            form.file_.errors.append(str(e))
+            return render_template("dashboard/index.html", form=form), 400
 
         _log.info("Redirecting to output page")
         return redirect(url_for('dashboard.output',
                                 input_type=form.input_type.data,
                                 output_type=form.output_type.data,
-                                celery_id=celery_id))
+                                celery_id=celery_id,
+                                subscription=subscription))
     _log.info("Rendering index page")
 
     return render_template("dashboard/index.html", form=form)
@@ -36,10 +46,12 @@ def index():
 
 @bp.route("/output/<input_type>/<output_type>/<celery_id>", methods=['GET'])
 def output(input_type, output_type, celery_id):
+    # Only the page the job was submitted from can cancel it.
     return render_template("dashboard/output.html",
                            input_type=input_type,
                            output_type=output_type,
-                           celery_id=celery_id)
+                           celery_id=celery_id,
+                           subscription=request.args.get('subscription'))
 
 
 @bp.route("/queue/", methods=['GET'])
@@ -0,0 +1,135 @@
+import bz2
+import logging
+import zipfile
+import zlib
+
+from flask import Response
+
+
+_log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Content types and file extensions of the output types.
+_CONTENT_TYPES = {'mmcif': 'chemical/x-mmcif'}
+_EXTENSIONS = {'dssp': 'dssp', 'mmcif': 'cif', 'hssp_hssp': 'hssp',
+               'hssp_stockholm': 'sto', 'hg_hssp': 'sto'}
+
+
+def negotiate_encoding(accept_encodings, preferred):
+    """
+    Pick the content encoding for a response.
+
+    :param accept_encodings: The request's parsed Accept-Encoding header.
+    :param preferred: The encodings we can offer, cheapest first.
+    :return: Either 'bzip2', 'gzip' or 'identity'. bzip2 is only picked
+             when it's named, because few clients can decode it, so a
+             wildcard gets gzip.
+    """
+    if not any(value.lower() == 'bzip2' and quality > 0
+               for value, quality in accept_encodings):
+        preferred = [e for e in preferred if e != 'bzip2']
+    return accept_encodings.best_match(preferred, default='identity')
+
+
+def _compress(chunks, encoding):
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif encoding == 'bzip2':
+        compressor = bz2.BZ2Compressor()
+    else:
+        yield from chunks
+        return
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _iter_text(text):
+    for i in range(0, len(text), CHUNK_SIZE):
+        yield text[i:i + CHUNK_SIZE].encode('utf-8')
+
+
+def _iter_file(f):
+    with f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            yield chunk
+
+
+def stream_text(text, encoding):
+    return _compress(_iter_text(text), encoding)
+
+
+def stream_file(path, encoding):
+    return _compress(_iter_file(open(path, 'rb')), encoding)
+
+
+def stream_bz2_file(path, encoding):
+    """
+    Stream the content of a bzip2 compressed file.
+
+    The stored bytes are passed through untouched if the response is bzip2
+    encoded.
+    """
+    if encoding == 'bzip2':
+        return _iter_file(open(path, 'rb'))
+    return _compress(_iter_file(bz2.open(path, 'rb')), encoding)
+
+
+class _Sink(object):
+    # A write-only file that collects what's written until it's drained.
+    # zipfile writes data descriptors to files that can't seek.
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks = self.chunks
+        self.chunks = []
+        return chunks
+
+
+def stream_zip(members):
+    """
+    Stream a zip archive.
+
+    :param members: An iterable of tuples of the filename of a member and
+                    the chunks of its content.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for filename, chunks in members:
+            with zf.open(filename, 'w', force_zip64=True) as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def get_filename(name, output_type):
+    return '{}.{}'.format(name, _EXTENSIONS.get(output_type, 'txt'))
+
+
+def make_stream_response(chunks, encoding, output_type, name, length=None):
+    filename = get_filename(name, output_type)
+    headers = {'Content-Disposition': 'attachment; filename=' + filename,
+               'Vary': 'Accept-Encoding'}
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    if length is not None:
+        headers['Content-Length'] = str(length)
+
+    content_type = _CONTENT_TYPES.get(output_type, 'text/plain; charset=utf-8')
+    return Response(chunks, content_type=content_type, headers=headers,
+                    direct_passthrough=True)
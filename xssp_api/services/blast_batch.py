@@ -0,0 +1,145 @@
+import json
+import logging
+import time
+import uuid
+
+from flask import current_app as app
+
+from xssp_api.controllers.blast import (BlastAlignment, blast_queries,
+                                        iter_blast_hits)
+from xssp_api.services.lease import Lease, get_redis_client
+
+
+_log = logging.getLogger(__name__)
+
+
+# Take up to ARGV[1] queries off the queue.
+_TAKE_SCRIPT = """
+local queries = redis.call('lrange', KEYS[1], 0, ARGV[1] - 1)
+redis.call('ltrim', KEYS[1], #queries, -1)
+return queries
+"""
+
+
+def _dump_hits(hits):
+    return json.dumps([[title, a.query_start, a.query_end, a.query_alignment,
+                        a.subj_start, a.subj_end, a.subj_alignment]
+                       for title, a in hits])
+
+
+def _load_hits(hits):
+    return [(hit[0], BlastAlignment(*hit[1:])) for hit in hits]
+
+
+class BlastBatcher(object):
+    """
+    Runs the blastp searches of concurrent tasks on a databank together.
+
+    Every search is put on a queue in redis. A task that finds fewer than
+    leaders leaders becomes a leader: it waits window seconds for more
+    queries to arrive, runs up to max_size of them in a single blastp call
+    and hands every other task its hits through redis. Other tasks wait for
+    their hits, and take over as leader when a leader is done, for example
+    when their query arrived after the leader took the queue. When the
+    leader fails, it hands the other tasks an error instead. A task that gets
+    an error, or no hits within timeout seconds, runs blastp on its own query.
+    """
+
+    def __init__(self, client, databank_path, window, max_size, timeout,
+                 lease_ttl, leaders=1):
+        self.client = client
+        self.databank_path = databank_path
+        self.window = window
+        self.max_size = max_size
+        self.timeout = timeout
+        self.lease_ttl = lease_ttl
+        self.leaders = leaders
+
+        self.queue_key = 'blast:queue:' + databank_path
+
+    def _result_key(self, query_id):
+        return 'blast:result:' + query_id
+
+    def search(self, sequence):
+        """
+        :return: A generator of tuples of the subject title and the
+                 BlastAlignment of every HSP, in rank order.
+        """
+        query_id = uuid.uuid4().hex
+        query = json.dumps({'id': query_id, 'sequence': sequence})
+        self.client.rpush(self.queue_key, query)
+
+        leases = [Lease(self.client,
+                        'blast:{}:{}'.format(self.databank_path, n),
+                        query_id, self.lease_ttl)
+                  for n in range(self.leaders)]
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            lease = next((lease for lease in leases if lease.acquire()), None)
+            if lease is not None:
+                try:
+                    with lease.heartbeat():
+                        hits = self._lead(query_id, query, sequence)
+                finally:
+                    lease.release()
+                yield from hits
+                return
+
+            popped = self.client.blpop(self._result_key(query_id), timeout=1)
+            if popped is not None:
+                result = json.loads(popped[1])
+                if isinstance(result, dict):
+                    _log.warning("blastp batch failed for '{}', running it "
+                                 "alone: {}".format(query_id, result['error']))
+                    break
+                yield from _load_hits(result)
+                return
+        else:
+            _log.warning("No blastp batch for '{}', running it alone".format(
+                query_id))
+            self.client.lrem(self.queue_key, 0, query)
+
+        yield from iter_blast_hits(sequence, self.databank_path)
+
+    def _lead(self, query_id, query, sequence):
+        time.sleep(self.window)
+        self.client.lrem(self.queue_key, 0, query)
+        queued = self.client.eval(_TAKE_SCRIPT, 1, self.queue_key,
+                                  self.max_size)
+
+        queries = {query_id: sequence}
+        for query in queued:
+            query = json.loads(query)
+            queries[query['id']] = query['sequence']
+        _log.info("Running blastp batch of {} queries".format(len(queries)))
+
+        # Also when the task is cancelled or the worker stops, so that the
+        # other tasks needn't wait for the timeout.
+        try:
+            hits = blast_queries(queries, self.databank_path)
+        except BaseException as e:
+            error = json.dumps({'error': repr(e)})
+            for id_ in queries:
+                if id_ != query_id:
+                    self._put_result(id_, error)
+            raise
+
+        for id_ in queries:
+            if id_ != query_id:
+                self._put_result(id_, _dump_hits(hits[id_]))
+
+        return hits[query_id]
+
+    def _put_result(self, query_id, data):
+        key = self._result_key(query_id)
+        self.client.rpush(key, data)
+        self.client.expire(key, int(self.timeout) + 1)
+
+
+def get_blast_batcher(databank_path):
+    return BlastBatcher(get_redis_client(), databank_path,
+                        app.config['HG_HSSP_BATCH_WINDOW'],
+                        app.config['HG_HSSP_BATCH_MAX_SIZE'],
+                        app.config['HG_HSSP_BATCH_TIMEOUT'],
+                        app.config['LEASE_TTL'],
+                        app.config['HG_HSSP_BATCH_LEADERS'])
@@ -0,0 +1,172 @@
+import bz2
+import datetime
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from flask import current_app as app
+
+
+_log = logging.getLogger(__name__)
+
+
+SUFFIX = '.bz2'
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobStore(object):
+    """
+    Keeps task outputs on disk, bzip2 compressed and named by the sha256 of
+    their content, so that identical outputs are only stored once.
+
+    Storing content that's already there touches the blob, so that the blobs
+    that are still in use can be told apart by their mtime.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + SUFFIX)
+
+    def put(self, content):
+        """
+        Store the given text.
+
+        :return: The sha256 hex digest of the text, by which it's stored.
+        """
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if not self._reuse(digest):
+            self._write(digest, lambda f: f.write(bz2.compress(data)))
+        return digest
+
+    def put_compressed(self, stream, digest):
+        """
+        Store the bzip2 compressed text read from the given binary stream as
+        is, without decompressing it.
+
+        :param digest: The sha256 hex digest of the decompressed text.
+        :return: The digest.
+        """
+        if not self._reuse(digest):
+            self._write(digest,
+                        lambda f: shutil.copyfileobj(stream, f, CHUNK_SIZE))
+        return digest
+
+    def _reuse(self, digest):
+        try:
+            os.utime(self.path(digest))
+            _log.debug("Reusing blob '{}'".format(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _write(self, digest, write):
+        # Write to a temporary file first, so that readers never see a
+        # partially written blob.
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                              suffix='.tmp')
+        try:
+            with os.fdopen(tmp_file, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+        _log.debug("Stored blob '{}'".format(digest))
+
+    def get(self, digest):
+        """
+        :return: The text stored under the given digest.
+        :raises FileNotFoundError: If there's no such blob.
+        """
+        with bz2.open(self.path(digest), 'rt') as f:
+            return f.read()
+
+    def clean(self, max_age):
+        """
+        Remove the blobs that haven't been stored or reused in the given
+        timedelta.
+
+        :return: The number of removed blobs.
+        """
+        min_mtime = (datetime.datetime.now() - max_age).timestamp()
+        n = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.path.getmtime(path) < min_mtime:
+                        os.remove(path)
+                        n += 1
+                except FileNotFoundError:
+                    continue
+
+        _log.info("Removed {} blobs".format(n))
+        return n
+
+
+def get_blob_store():
+    return BlobStore(app.config['BLOB_ROOT'])
+
+
+def store_result(content):
+    """
+    Store task output of at least BLOB_MIN_SIZE characters in the blob store.
+
+    :return: Either the content itself, or a reference to the blob that
+             resolve_result understands.
+    """
+    if len(content) < app.config['BLOB_MIN_SIZE']:
+        return content
+
+    return {'blob': get_blob_store().put(content), 'size': len(content)}
+
+
+def store_result_file(path):
+    """
+    Store task output that's on disk already, bzip2 compressed, like
+    store_result. The output is only loaded if it's stored as is. Otherwise
+    it's decompressed in chunks to hash it, and the compressed file is copied
+    into the blob store.
+
+    The size of the output is counted in bytes rather than characters.
+    """
+    with open(path, 'rb') as f:
+        h = hashlib.sha256()
+        size = 0
+        with bz2.open(f, 'rb') as text:
+            for chunk in iter(lambda: text.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+                size += len(chunk)
+
+        # The same open file is read again, in case the path is replaced in
+        # the meantime.
+        f.seek(0)
+        if size < app.config['BLOB_MIN_SIZE']:
+            with bz2.open(f, 'rt') as text:
+                return text.read()
+
+        digest = get_blob_store().put_compressed(f, h.hexdigest())
+    return {'blob': digest, 'size': size}
+
+
+def is_blob_reference(result):
+    return isinstance(result, dict) and 'blob' in result
+
+
+def resolve_result(result):
+    """
+    Get the output of a task from its result.
+
+    :raises FileNotFoundError: If the result refers to a blob that's gone.
+    """
+    if is_blob_reference(result):
+        return get_blob_store().get(result['blob'])
+    return result
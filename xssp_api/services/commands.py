@@ -0,0 +1,186 @@
+import logging
+import os
+import resource
+import signal
+import subprocess
+import threading
+import time
+
+from celery import current_task
+from celery.exceptions import Ignore
+from flask import current_app as app, has_app_context
+
+from xssp_api.storage import storage
+
+
+_log = logging.getLogger(__name__)
+
+
+def get_task_limits():
+    """
+    Get the limits for subprocesses of the current task from TASK_LIMITS,
+    falling back to the 'default' limits. There are no limits outside the
+    app.
+    """
+
+    if not has_app_context():
+        return {}
+    limits = dict(app.config['TASK_LIMITS'].get('default', {}))
+    if current_task:
+        limits.update(app.config['TASK_LIMITS'].get(current_task.name, {}))
+    return limits
+
+
+def update_task_doc(update):
+    if current_task and current_task.request.id is not None:
+        storage.update_one('tasks', {'task_id': current_task.request.id},
+                           update, upsert=True)
+
+
+def is_cancelled():
+    if not current_task or current_task.request.id is None:
+        return False
+    doc = storage.find_one('tasks', {'task_id': current_task.request.id})
+    return doc is not None and doc.get('cancelled', False)
+
+
+def _set_rlimits(pid, limits):
+    # Set on the running command rather than in a preexec_fn, which may
+    # deadlock in a process with threads, like the lease heartbeat.
+    try:
+        if limits.get('address_space') is not None:
+            resource.prlimit(pid, resource.RLIMIT_AS,
+                             (limits['address_space'],
+                              limits['address_space']))
+        if limits.get('cpu_time') is not None:
+            resource.prlimit(pid, resource.RLIMIT_CPU,
+                             (limits['cpu_time'], limits['cpu_time']))
+    except ProcessLookupError:
+        pass
+
+
+class Command(object):
+    """
+    Runs a command within the limits of the current task and records its
+    resource usage on the task document.
+
+    The command runs in a session of its own, so that on timeout or when the
+    task is cancelled it's killed together with any processes it started.
+    Its pid is recorded on the task document while it runs, for cancel_task.
+
+    The caller reads stdout, and writes stdin if it's asked for, within the
+    with block. stderr is read on the side, so that a full stderr pipe can't
+    block the command. When the block is left by an exception, for example
+    because a generator reading the output was closed, the command is killed.
+    Otherwise a failure of the command is raised when the block exits.
+    """
+
+    def __init__(self, args, stdin=False):
+        self.args = args
+        self.stdin_pipe = stdin
+        self.process = None
+        self.returncode = None
+        self.stderr = None
+
+    @property
+    def stdin(self):
+        return self.process.stdin
+
+    @property
+    def stdout(self):
+        return self.process.stdout
+
+    def __enter__(self):
+        self.limits = get_task_limits()
+        _log.info("Running command '{}' with limits {}".format(self.args,
+                                                               self.limits))
+
+        self.start = time.monotonic()
+        stdin = subprocess.PIPE if self.stdin_pipe else subprocess.DEVNULL
+        self.process = subprocess.Popen(
+            self.args, stdin=stdin,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            start_new_session=True)
+        _set_rlimits(self.process.pid, self.limits)
+
+        self._errors = []
+        self._stderr_reader = threading.Thread(
+            target=lambda: self._errors.append(self.process.stderr.read()),
+            daemon=True)
+        self._stderr_reader.start()
+
+        self.timed_out = threading.Event()
+        self._timer = None
+        if self.limits.get('timeout') is not None:
+            self._timer = threading.Timer(self.limits['timeout'],
+                                          self._time_out)
+            self._timer.start()
+
+        update_task_doc({'$set': {'pid': self.process.pid}})
+        # The task may have been cancelled before the pid was recorded.
+        self.cancelled = is_cancelled()
+        if self.cancelled:
+            self.kill()
+        return self
+
+    def _time_out(self):
+        self.timed_out.set()
+        self.kill()
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.kill()
+        for pipe in [self.process.stdin, self.process.stdout]:
+            if pipe is not None and not pipe.closed:
+                try:
+                    pipe.close()
+                except BrokenPipeError:
+                    pass
+
+        try:
+            _, status, rusage = os.wait4(self.process.pid, 0)
+        finally:
+            if self._timer is not None:
+                self._timer.cancel()
+            update_task_doc({'$unset': {'pid': ''}})
+        self.returncode = os.waitstatus_to_exitcode(status)
+        self.process.returncode = self.returncode
+        self._stderr_reader.join()
+        self.process.stderr.close()
+        self.stderr = ''.join(self._errors)
+
+        update_task_doc({'$push': {'usage': {
+            'command': self.args[0],
+            'returncode': self.returncode,
+            'timed_out': self.timed_out.is_set(),
+            'wall_time': time.monotonic() - self.start,
+            'user_time': rusage.ru_utime,
+            'system_time': rusage.ru_stime,
+            'max_rss': rusage.ru_maxrss * 1024,
+            'read_blocks': rusage.ru_inblock,
+            'write_blocks': rusage.ru_oublock,
+        }}})
+
+        # The caller stopped reading.
+        if exc_type is GeneratorExit:
+            return False
+
+        if self.timed_out.is_set():
+            raise RuntimeError(
+                f"{self.args} timed out after {self.limits['timeout']} s")
+        if self.returncode == -signal.SIGKILL and \
+                (self.cancelled or is_cancelled()):
+            _log.info("Command '{}' was cancelled".format(self.args[0]))
+            # Keep the REVOKED state set by cancel_task.
+            raise Ignore()
+        # A command that fails may close stdin before it's all written.
+        if (exc_type is None or issubclass(exc_type, BrokenPipeError)) and \
+                self.returncode != 0:
+            raise RuntimeError(f"{self.args} error:\n{self.stderr}")
+        return False
@@ -0,0 +1,47 @@
+import logging
+import os
+
+from flask import current_app as app
+
+
+_log = logging.getLogger(__name__)
+
+
+def get_entry_path(input_type, output_type, id_):
+    """
+    Get the path of the precomputed databank entry for the given pdb id or
+    pdb-redo id.
+
+    The DSSP entries are plain text and the HSSP entries bzip2 compressed.
+    If the combination of input_type and output_type doesn't have a databank,
+    a ValueError is raised.
+    """
+    id_ = id_.lower()
+    if input_type == 'pdb_id':
+        if output_type == 'dssp':
+            return os.path.join(app.config['DSSP_ROOT'], id_ + '.dssp')
+        elif output_type == 'hssp_hssp':
+            return os.path.join(app.config['HSSP_ROOT'], id_ + '.hssp.bz2')
+        elif output_type == 'hssp_stockholm':
+            return os.path.join(app.config['HSSP_STO_ROOT'],
+                                id_ + '.hssp.bz2')
+    elif input_type == 'pdb_redo_id' and output_type == 'dssp':
+        return os.path.join(app.config['DSSP_REDO_ROOT'], id_ + '.dssp')
+
+    raise ValueError("No databank for input '{}' and output '{}'".format(
+        input_type, output_type))
+
+
+def get_accel_redirect(path):
+    """
+    Get the internal nginx location that serves the given path.
+
+    :return: The location, or None if the file's root isn't mapped in
+             ACCEL_REDIRECT_LOCATIONS.
+    """
+    for root, location in app.config['ACCEL_REDIRECT_LOCATIONS'].items():
+        relpath = os.path.relpath(path, root)
+        if not relpath.startswith(os.pardir):
+            return location.rstrip('/') + '/' + relpath
+
+    return None
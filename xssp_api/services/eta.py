@@ -0,0 +1,135 @@
+import datetime
+import logging
+
+from flask import current_app as app
+from pymongo import DESCENDING
+
+from xssp_api.controllers.predict import fit_runtime_model, predict_runtime
+from xssp_api.services.jobs import jobs
+from xssp_api.storage import storage
+
+
+_log = logging.getLogger(__name__)
+
+
+MODELS = 'runtime_models'
+
+
+class RuntimeModels(object):
+    """
+    Predicts the runtime of jobs from their input features, with a model per
+    combination of input and output type, fitted on the runtimes of recent
+    successful jobs. Jobs that were served from a cache, see xssp_api.tasks,
+    took no time to speak of and are left out.
+    """
+
+    # The number of recent jobs the models are fitted on.
+    max_samples = 5000
+
+    # Models fitted on fewer jobs aren't used.
+    min_samples = 10
+
+    # Jobs further down a queue aren't looked at.
+    max_ahead = 1000
+
+    def __init__(self):
+        self._coefficients = {}
+
+    def fit(self):
+        docs = storage.find('tasks', {'state': 'SUCCESS',
+                                      'cached': {'$ne': True},
+                                      'started_on': {'$exists': True},
+                                      'finished_on': {'$exists': True}},
+                            sort=[('finished_on', DESCENDING)],
+                            limit=self.max_samples)
+
+        samples = {}
+        for doc in docs:
+            if 'input_type' not in doc:
+                continue
+            runtime = (doc['finished_on'] - doc['started_on']).total_seconds()
+            samples.setdefault(self._get_model_id(doc), []).append(
+                (doc.get('features', {}), runtime))
+
+        for model_id, model_samples in samples.items():
+            if len(model_samples) < self.min_samples:
+                continue
+
+            coefficients = fit_runtime_model(model_samples)
+            _log.info("Fitted runtime model '{}' on {} jobs: {}".format(
+                model_id, len(model_samples), coefficients))
+            storage.update_one(MODELS, {'_id': model_id},
+                               {'$set': {'coefficients': coefficients,
+                                         'samples': len(model_samples),
+                                         'fitted_on':
+                                         datetime.datetime.utcnow()}},
+                               upsert=True)
+
+    def predict(self, doc):
+        """:return: The predicted runtime in seconds, or None."""
+        model_id = self._get_model_id(doc)
+        if model_id not in self._coefficients:
+            model = storage.find_one(MODELS, {'_id': model_id}) or {}
+            self._coefficients[model_id] = model.get('coefficients')
+
+        return predict_runtime(self._coefficients[model_id],
+                               doc.get('features', {}))
+
+    def estimate(self, doc, status):
+        """
+        Estimate when a job starts and completes.
+
+        A waiting job starts when the predicted work ahead of it in its queue
+        is done, by the number of workers of the queue in QUEUE_CONCURRENCY.
+        Cancelled jobs are revoked, so they don't count, even while their
+        message is still in the queue.
+
+        :return: A dict with the queue_position, estimated_start and
+                 estimated_completion that could be estimated.
+        """
+        now = datetime.datetime.utcnow()
+        runtime = self.predict(doc)
+
+        if status == 'STARTED' and 'started_on' in doc:
+            if runtime is None:
+                return {}
+            completion = max(now, doc['started_on'] +
+                             datetime.timedelta(seconds=runtime))
+            return {'estimated_completion': completion}
+
+        if status not in ['PENDING', 'RETRY'] or 'queue' not in doc:
+            return {}
+
+        min_created_on = now - jobs.max_pending_age
+        ahead = storage.find('tasks', {
+            'queue': doc['queue'],
+            'cancelled': {'$ne': True},
+            'started_on': {'$exists': False},
+            'finished_on': {'$exists': False},
+            'created_on': {'$gt': min_created_on, '$lt': doc['created_on']}},
+            limit=self.max_ahead)
+        running = storage.find('tasks', {
+            'queue': doc['queue'],
+            'cancelled': {'$ne': True},
+            'started_on': {'$gt': min_created_on},
+            'finished_on': {'$exists': False}})
+
+        work = sum(self.predict(d) or 0 for d in ahead)
+        for d in running:
+            elapsed = (now - d['started_on']).total_seconds()
+            work += max(0, (self.predict(d) or 0) - elapsed)
+
+        concurrency = app.config['QUEUE_CONCURRENCY'].get(doc['queue'], 1)
+        start = now + datetime.timedelta(seconds=work / concurrency)
+        estimate = {'queue_position': len(ahead) + 1, 'estimated_start': start}
+        if runtime is not None:
+            estimate['estimated_completion'] = \
+                start + datetime.timedelta(seconds=runtime)
+        return estimate
+
+    def _get_model_id(self, doc):
+        return '{}:{}'.format(doc['input_type'], doc['output_type'])
+
+
+def get_runtime_models():
+    return RuntimeModels()
@@ -0,0 +1,77 @@
+import datetime
+import logging
+import uuid
+
+from xssp_api.storage import storage
+
+
+_log = logging.getLogger(__name__)
+
+
+class GroupRegistry(object):
+    """
+    Keeps track of batch submissions in the 'groups' collection.
+
+    A group lists its members by name, each with the id of the job that
+    makes its output. Members with the same input share a job.
+    """
+
+    # States of members that have finished.
+    finished_states = ['SUCCESS', 'FAILURE', 'REVOKED']
+
+    def create(self, input_type, output_type, members):
+        """
+        :param members: A list of tuples of the member's name and task id.
+        :return: The id of the group.
+        """
+        group_id = uuid.uuid4().hex
+        storage.insert_one('groups', {
+            '_id': group_id,
+            'input_type': input_type,
+            'output_type': output_type,
+            'members': [{'name': name, 'task_id': task_id}
+                        for name, task_id in members],
+            'created_on': datetime.datetime.utcnow()})
+
+        _log.info("Created group '{}' with {} members".format(
+            group_id, len(members)))
+        return group_id
+
+    def get(self, group_id):
+        return storage.find_one('groups', {'_id': group_id})
+
+    def status(self, group):
+        """
+        Get the status of every member of the group, and of the group as a
+        whole.
+
+        :return: A tuple of the group status and a list of member statuses.
+                 The group status is SUCCESS if all members succeeded, FAILURE
+                 if all finished and some didn't succeed, PENDING if none
+                 started, and STARTED otherwise.
+        """
+        from xssp_api.tasks import get_task
+        task = get_task(group['input_type'], group['output_type'])
+
+        statuses = {}
+        members = []
+        for member in group['members']:
+            task_id = member['task_id']
+            if task_id not in statuses:
+                statuses[task_id] = task.AsyncResult(task_id).status
+            members.append(dict(member, status=statuses[task_id]))
+
+        states = set(statuses.values())
+        if states <= {'SUCCESS'}:
+            status = 'SUCCESS'
+        elif states <= set(self.finished_states):
+            status = 'FAILURE'
+        elif states <= {'PENDING'}:
+            status = 'PENDING'
+        else:
+            status = 'STARTED'
+
+        return status, members
+
+
+groups = GroupRegistry()
@@ -0,0 +1,137 @@
+import datetime
+import logging
+
+from pymongo import DESCENDING
+
+from xssp_api.storage import storage
+
+
+_log = logging.getLogger(__name__)
+
+
+class JobRegistry(object):
+    """
+    Keeps track of the submitted jobs in the 'tasks' collection.
+
+    Every job is stored with the hash of its input, so that a later request
+    for the same input can be answered with the id of a job that already
+    completed or is still in flight, instead of queueing a new one.
+    """
+
+    # Only the most recent jobs for an input hash are considered.
+    max_candidates = 5
+
+    # States of jobs that haven't finished yet.
+    in_flight_states = ['PENDING', 'STARTED', 'RETRY']
+
+    # A job that's been PENDING for longer than this is assumed to be lost,
+    # or its result to have expired.
+    max_pending_age = datetime.timedelta(days=1)
+
+    # A STARTED or RETRY job whose worker hasn't touched it for longer than
+    # the timeout in TASK_LIMITS plus this is assumed to have died with its
+    # worker.
+    run_time_margin = datetime.timedelta(minutes=10)
+
+    def __init__(self, task_limits=None):
+        # Set from TASK_LIMITS by the app factory.
+        self.task_limits = task_limits or {}
+
+    def register(self, task_id, input_type, output_type, input_hash,
+                 queue=None, features=None, subscriber=None):
+        """
+        :param subscriber: A token for the request that got the job's id,
+                           with which it may cancel the job, see unsubscribe.
+        :param queue: The queue the task was sent to.
+        :param features: The input features the runtime of the job is
+                         predicted from, see xssp_api.controllers.predict.
+        """
+        # The task may already have written to its document by the time it's
+        # registered.
+        storage.update_one('tasks', {'task_id': task_id},
+                           {'$set': {'input_type': input_type,
+                                     'output_type': output_type,
+                                     'input_hash': input_hash,
+                                     'queue': queue,
+                                     'features': features or {},
+                                     'created_on': datetime.datetime.utcnow()},
+                            '$addToSet': {'subscriptions': subscriber}},
+                           upsert=True)
+
+    def find(self, input_type, output_type, input_hash, subscriber=None):
+        """
+        Get the id of a job for the given input hash that either completed or
+        is still in flight. The subscriber is added to a job in flight, see
+        register.
+
+        :return: The task id, or None when there's no such job.
+        """
+        from xssp_api.tasks import get_task
+        task = get_task(input_type, output_type)
+
+        docs = storage.find('tasks', {'input_hash': input_hash},
+                            sort=[('created_on', DESCENDING)],
+                            limit=self.max_candidates)
+        for doc in docs:
+            status = task.AsyncResult(doc['task_id']).status
+            if status == 'SUCCESS':
+                _log.info("Result cache hit for '{}': '{}'".format(
+                    input_hash, doc['task_id']))
+                return doc['task_id']
+
+            if self._is_alive(doc, status, task.name):
+                _log.info("Attaching to job in flight for '{}': '{}'".format(
+                    input_hash, doc['task_id']))
+                storage.update_one('tasks', {'task_id': doc['task_id']},
+                                   {'$addToSet': {'subscriptions': subscriber}})
+                return doc['task_id']
+
+        _log.debug("No job for '{}'".format(input_hash))
+        return None
+
+    def _is_alive(self, doc, status, task_name):
+        """
+        Whether a job in the given state may still complete.
+
+        The worker sets started_on when it starts the job and retried_on when
+        it puts the job back in the queue, see xssp_api.tasks. A job that
+        hasn't been touched for longer than it may run was lost with its
+        worker.
+        """
+        now = datetime.datetime.utcnow()
+        if status == 'PENDING':
+            return doc['created_on'] > now - self.max_pending_age
+        if status not in self.in_flight_states:
+            return False
+
+        limits = dict(self.task_limits.get('default', {}))
+        limits.update(self.task_limits.get(task_name, {}))
+        if limits.get('timeout') is None:
+            max_age = self.max_pending_age
+        else:
+            max_age = datetime.timedelta(seconds=limits['timeout']) + \
+                self.run_time_margin
+
+        field = 'started_on' if status == 'STARTED' else 'retried_on'
+        touched_on = doc.get(field) or doc['created_on']
+        return touched_on > now - max_age
+
+    def unsubscribe(self, task_id, subscriber):
+        """
+        Drop the request with the given token from those that were answered
+        with the id of the given job, when it cancels the job. Dropping it
+        again has no effect.
+
+        :return: The number of requests still waiting for the job, or None if
+                 the request wasn't waiting for it.
+        """
+        result = storage.update_one('tasks', {'task_id': task_id,
+                                              'subscriptions': subscriber},
+                                    {'$pull': {'subscriptions': subscriber}})
+        if result.modified_count == 0:
+            return None
+        doc = storage.find_one('tasks', {'task_id': task_id}) or {}
+        return len(doc.get('subscriptions', []))
+
+
+jobs = JobRegistry()
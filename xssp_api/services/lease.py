@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+from flask import current_app as app
+
+
+_log = logging.getLogger(__name__)
+
+
+# Only touch the lease if it's still held by the given owner.
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class Lease(object):
+    """
+    An exclusive, expiring claim on a named resource, kept in redis.
+
+    The holder keeps the lease alive with heartbeats. When the holder dies the
+    heartbeats stop and the lease expires after ttl seconds, so that another
+    owner can acquire it.
+    """
+
+    def __init__(self, client, name, owner, ttl):
+        self.client = client
+        self.key = 'lease:' + name
+        self.owner = owner
+        self.ttl = ttl
+
+    def acquire(self, timeout=0):
+        """
+        :param timeout: The number of seconds to keep trying for.
+        :return: True if the lease was acquired, False if it's taken.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            acquired = self.client.set(self.key, self.owner, nx=True,
+                                       px=int(self.ttl * 1000))
+            if acquired or time.monotonic() >= deadline:
+                return bool(acquired)
+            time.sleep(0.05)
+
+    def renew(self):
+        """:return: False if the lease is no longer held by this owner."""
+        renewed = self.client.eval(_RENEW_SCRIPT, 1, self.key, self.owner,
+                                   int(self.ttl * 1000))
+        return renewed == 1
+
+    def release(self):
+        self.client.eval(_RELEASE_SCRIPT, 1, self.key, self.owner)
+
+    def holder(self):
+        holder = self.client.get(self.key)
+        return holder.decode() if holder is not None else None
+
+    @contextmanager
+    def heartbeat(self):
+        """Renew the lease in the background until the block exits."""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.ttl / 3.0):
+                if not self.renew():
+                    _log.warning("Lost lease '{}'".format(self.key))
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+
+
+_clients = {}
+
+
+def get_redis_client():
+    url = app.config['LEASE_REDIS_URL']
+    if url not in _clients:
+        _clients[url] = redis.Redis.from_url(url)
+    return _clients[url]
+
+
+def get_lease(name, owner, ttl=None):
+    return Lease(get_redis_client(), name, owner,
+                 ttl or app.config['LEASE_TTL'])
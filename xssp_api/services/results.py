@@ -0,0 +1,48 @@
+import logging
+import os
+
+from xssp_api.services.blobs import get_blob_store, is_blob_reference
+from xssp_api.storage import storage
+
+
+_log = logging.getLogger(__name__)
+
+
+def get_file_version(path):
+    """
+    :return: The modification time and size of the file, which change when
+             it's replaced.
+    """
+    st = os.stat(path)
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+
+def get_stored_result(task_id, async_result):
+    """
+    Get the output of a successful task, preferring a bzip2 compressed copy
+    on disk over the result itself.
+
+    The copy is only used while it's still the version the task returned. A
+    file that has been replaced since, e.g. by a refresh of the stockholm
+    cache, no longer holds the output of the task.
+
+    :return: A tuple of the path of the compressed copy and the output. Only
+             one of them is set.
+    :raises FileNotFoundError: If the output was kept in a blob that's gone.
+    """
+    doc = storage.find_one('tasks', {'task_id': task_id}) or {}
+    path = doc.get('result_path')
+    if path is not None and os.path.isfile(path):
+        if get_file_version(path) == doc.get('result_version'):
+            return path, None
+        _log.info("'{}' changed after task '{}' completed".format(path,
+                                                                 task_id))
+
+    result = async_result.get()
+    if is_blob_reference(result):
+        path = get_blob_store().path(result['blob'])
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return path, None
+
+    return None, result
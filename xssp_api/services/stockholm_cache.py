@@ -0,0 +1,358 @@
+import bz2
+import datetime
+import logging
+import os
+import tempfile
+
+from flask import current_app as app
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from xssp_api.storage import storage
+
+
+_log = logging.getLogger(__name__)
+
+
+ENTRIES = 'stockholm_cache'
+STATS = 'cache_stats'
+STATS_ID = 'stockholm'
+SUFFIX = '.sto.bz2'
+HSSP_SUFFIX = '.hssp.bz2'
+
+
+class StockholmCache(object):
+    """
+    Keeps the stockholm files made by mkhssp, one per sequence id.
+
+    Hits and the last access are recorded per entry in storage. When the
+    total size of the entries exceeds max_size, entries are evicted in least
+    recently used ('lru') or least frequently used ('lfu') order.
+
+    Every entry is tagged with the version of the databanks it was made
+    from. An entry made from other databanks is stale: it's either treated as
+    missing, or when serve_stale is set, returned and marked as stale so that
+    it can be refreshed in the background. A refresh that hasn't stored a
+    new entry within refresh_timeout is assumed to have been lost, so that
+    the entry can be refreshed again.
+
+    The classic HSSP output is derived from an entry the first time it's
+    asked for, and kept next to it until the entry is replaced or evicted.
+    """
+
+    def __init__(self, root, max_size=None, policy='lru', serve_stale=False,
+                 refresh_timeout=None):
+        if policy not in ['lru', 'lfu']:
+            raise ValueError("Unexpected eviction policy '{}'".format(policy))
+
+        self.root = root
+        self.max_size = max_size
+        self.policy = policy
+        self.serve_stale = serve_stale
+        self.refresh_timeout = refresh_timeout
+
+    def path(self, id_):
+        return os.path.join(self.root, id_ + SUFFIX)
+
+    def hssp_path(self, id_):
+        return os.path.join(self.root, id_ + HSSP_SUFFIX)
+
+    def get(self, id_, databank_version, count=True):
+        """
+        Get the stockholm content for the given id.
+
+        :param count: Whether to count the lookup as a hit or miss.
+        :return: A tuple of the content and whether it's stale. The content is
+                 None if it's not in the cache.
+        """
+        doc, stale = self._lookup(id_, databank_version, count)
+        if doc is None:
+            return None, False
+
+        try:
+            with bz2.open(self.path(id_), 'rt') as f:
+                content = f.read()
+        except FileNotFoundError:
+            self._miss(count)
+            return None, False
+
+        self._hit(id_, stale, count)
+        return content, stale
+
+    def get_hssp_path(self, id_, databank_version, convert, count=True):
+        """
+        Get the path of the classic HSSP file, bzip2 compressed, for the given
+        id. The content isn't loaded.
+
+        If it hasn't been derived from the stockholm entry yet, it's derived
+        now and stored. convert is called with the path of the stockholm file
+        and must yield the HSSP content in chunks, which are written to the
+        file as they come.
+
+        :return: A tuple of the path and whether it's stale. The path is None
+                 if it's not in the cache.
+        """
+        doc, stale = self._lookup(id_, databank_version, count)
+        if doc is None:
+            return None, False
+
+        # The derived file belongs to the stockholm file it was made from,
+        # which is identified by its mtime.
+        try:
+            source = os.stat(self.path(id_)).st_mtime_ns
+        except FileNotFoundError:
+            self._miss(count)
+            return None, False
+
+        if doc.get('hssp_source') == source and \
+                os.path.isfile(self.hssp_path(id_)):
+            self._hit(id_, stale, count)
+            return self.hssp_path(id_), stale
+
+        _log.info("Deriving HSSP for stockholm cache entry '{}'".format(id_))
+
+        def write(f):
+            for chunk in convert(self.path(id_)):
+                f.write(chunk)
+
+        size = self._write(self.hssp_path(id_), write)
+        storage.update_one(ENTRIES, {'_id': id_},
+                           {'$set': {'hssp_source': source,
+                                     'hssp_size': size}})
+        self._count('size', size - doc.get('hssp_size', 0))
+
+        self._hit(id_, stale, count)
+        return self.hssp_path(id_), stale
+
+    def contains(self, id_, databank_version):
+        """Check for a fresh entry without counting a hit or miss."""
+        doc = storage.find_one(ENTRIES, {'_id': id_}) or {}
+        return doc.get('databank_version') == databank_version and \
+            os.path.isfile(self.path(id_))
+
+    def put(self, id_, content, databank_version):
+        """
+        Store the stockholm content under the given id and evict if
+        necessary. A previously derived HSSP file is removed.
+        """
+        doc = storage.find_one(ENTRIES, {'_id': id_}) or {}
+
+        size = self._write(self.path(id_), lambda f: f.write(content))
+        self._remove_file(self.hssp_path(id_))
+
+        now = datetime.datetime.utcnow()
+        storage.update_one(ENTRIES, {'_id': id_},
+                           {'$set': {'size': size, 'last_access': now,
+                                     'created_on': now,
+                                     'databank_version': databank_version,
+                                     'stale': False, 'refreshing': False,
+                                     'refresh_claimed_on': None,
+                                     'hssp_source': None, 'hssp_size': 0},
+                            '$setOnInsert': {'hits': 0}},
+                           upsert=True)
+        self._count('size', size - doc.get('size', 0) -
+                    doc.get('hssp_size', 0))
+
+        self.evict()
+
+    def start_refresh(self, id_):
+        """
+        Claim the refresh of a stale entry.
+
+        :return: True if the caller should refresh the entry, False if it's
+                 already being refreshed.
+        """
+        now = datetime.datetime.utcnow()
+        free = [{'refreshing': {'$ne': True}}]
+        if self.refresh_timeout is not None:
+            # Also matches claims from before they were timestamped.
+            free.append({'refresh_claimed_on': {
+                '$not': {'$gt': now - self.refresh_timeout}}})
+        try:
+            storage.update_one(ENTRIES, {'_id': id_, '$or': free},
+                               {'$set': {'refreshing': True,
+                                         'refresh_claimed_on': now}},
+                               upsert=True)
+        except DuplicateKeyError:
+            # The entry exists and is already being refreshed.
+            return False
+        return True
+
+    def end_refresh(self, id_):
+        """Release the claim on a refresh that didn't store a new entry."""
+        storage.update_one(ENTRIES, {'_id': id_},
+                           {'$set': {'refreshing': False,
+                                     'refresh_claimed_on': None}})
+
+    def evict(self):
+        """Remove entries until the total size is within max_size."""
+        if self.max_size is None:
+            return
+
+        size = self.stats()['size']
+        while size > self.max_size:
+            victims = storage.find(ENTRIES, {}, sort=self._eviction_order(),
+                                   limit=16)
+            if len(victims) == 0:
+                break
+
+            for doc in victims:
+                if size <= self.max_size:
+                    break
+
+                _log.info("Evicting '{}' from the stockholm cache".format(
+                    doc['_id']))
+                size -= self._remove(doc)
+                self._count('evictions')
+
+    def purge(self, id_=None):
+        """
+        Remove the entry with the given id, or all entries if no id is given.
+
+        :return: The number of removed entries.
+        """
+        selector = {} if id_ is None else {'_id': id_}
+        docs = storage.find(ENTRIES, selector)
+        for doc in docs:
+            self._remove(doc)
+
+        return len(docs)
+
+    def sync(self, databank_version):
+        """
+        Bring the entries in storage in line with the files on disk.
+
+        Files without an entry, for example those stored before entries were
+        tracked, are added with the given databank version. Otherwise they'd
+        be stale, and would all be refreshed at once. Entries without a file
+        are removed.
+        """
+        docs = {d['_id']: d for d in storage.find(ENTRIES, {})}
+
+        size = 0
+        filenames = set(os.listdir(self.root))
+        for filename in filenames:
+            if filename.endswith(HSSP_SUFFIX):
+                id_ = filename[:-len(HSSP_SUFFIX)]
+                path = os.path.join(self.root, filename)
+                if id_ + SUFFIX in filenames:
+                    size += os.path.getsize(path)
+                else:
+                    self._remove_file(path)
+                continue
+
+            if not filename.endswith(SUFFIX):
+                continue
+
+            id_ = filename[:-len(SUFFIX)]
+            st = os.stat(os.path.join(self.root, filename))
+            size += st.st_size
+
+            if docs.pop(id_, None) is None:
+                access = datetime.datetime.utcfromtimestamp(st.st_mtime)
+                storage.update_one(ENTRIES, {'_id': id_},
+                                   {'$set': {'size': st.st_size,
+                                             'last_access': access,
+                                             'created_on': access,
+                                             'databank_version':
+                                             databank_version},
+                                    '$setOnInsert': {'hits': 0}},
+                                   upsert=True)
+
+        for id_ in docs:
+            storage.delete_one(ENTRIES, {'_id': id_})
+
+        storage.update_one(STATS, {'_id': STATS_ID}, {'$set': {'size': size}},
+                           upsert=True)
+        self.evict()
+
+    def stats(self):
+        doc = storage.find_one(STATS, {'_id': STATS_ID}) or {}
+        return {'hits': doc.get('hits', 0),
+                'stale_hits': doc.get('stale_hits', 0),
+                'misses': doc.get('misses', 0),
+                'evictions': doc.get('evictions', 0),
+                'size': doc.get('size', 0),
+                'max_size': self.max_size,
+                'policy': self.policy}
+
+    def entries(self, limit=100):
+        """Get the entries, the first to be evicted first."""
+        return storage.find(ENTRIES, {}, sort=self._eviction_order(),
+                            limit=limit)
+
+    def _eviction_order(self):
+        if self.policy == 'lfu':
+            return [('hits', ASCENDING), ('last_access', ASCENDING)]
+        return [('last_access', ASCENDING)]
+
+    def _lookup(self, id_, databank_version, count):
+        doc = storage.find_one(ENTRIES, {'_id': id_})
+        stale = doc is None or doc.get('databank_version') != databank_version
+        if doc is None or (stale and not self.serve_stale):
+            self._miss(count)
+            return None, False
+
+        return doc, stale
+
+    def _hit(self, id_, stale, count):
+        update = {'$inc': {'hits': 1},
+                  '$set': {'last_access': datetime.datetime.utcnow()}}
+        if stale:
+            _log.info("Serving stale stockholm cache entry '{}'".format(id_))
+            update['$set']['stale'] = True
+            if count:
+                self._count('stale_hits')
+        storage.update_one(ENTRIES, {'_id': id_}, update)
+        if count:
+            self._count('hits')
+
+    def _miss(self, count):
+        if count:
+            self._count('misses')
+
+    def _write(self, path, write):
+        # Write to a temporary file first, so that readers never see a
+        # partially written file.
+        tmp_file, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        os.close(tmp_file)
+        try:
+            with bz2.open(tmp_path, 'wt') as f:
+                write(f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+        return size
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _remove(self, doc):
+        if not self._remove_file(self.path(doc['_id'])):
+            _log.warning("Stockholm cache file for '{}' is missing".format(
+                doc['_id']))
+        self._remove_file(self.hssp_path(doc['_id']))
+
+        storage.delete_one(ENTRIES, {'_id': doc['_id']})
+        size = doc.get('size', 0) + doc.get('hssp_size', 0)
+        self._count('size', -size)
+        return size
+
+    def _count(self, counter, n=1):
+        storage.update_one(STATS, {'_id': STATS_ID}, {'$inc': {counter: n}},
+                           upsert=True)
+
+
+def get_stockholm_cache():
+    return StockholmCache(app.config['HSSP_STO_CACHE'],
+                          app.config['HSSP_STO_CACHE_MAX_SIZE'],
+                          app.config['HSSP_STO_CACHE_POLICY'],
+                          app.config['HSSP_STO_CACHE_SERVE_STALE'],
+                          app.config['HSSP_STO_CACHE_REFRESH_TIMEOUT'])
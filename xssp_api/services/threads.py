@@ -0,0 +1,124 @@
+import logging
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import current_app as app
+
+from xssp_api.controllers.threads import choose_threads
+from xssp_api.services.lease import get_redis_client
+
+
+_log = logging.getLogger(__name__)
+
+
+# Reservations are kept in a sorted set, scored by when they expire, as
+# '<id>:<threads>'. Expired reservations, of workers that died, are dropped
+# before the free threads are counted. A job gets at least one thread, even
+# when none are free.
+_RESERVE_SCRIPT = """
+redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[1])
+local used = 0
+for _, member in ipairs(redis.call('zrange', KEYS[1], 0, -1)) do
+    used = used + tonumber(string.match(member, ':(%d+)$'))
+end
+local free = tonumber(ARGV[4]) - used
+local threads = tonumber(ARGV[5])
+if ARGV[6] == 'adaptive' then
+    threads = math.max(1, math.min(threads, free))
+end
+redis.call('zadd', KEYS[1], ARGV[2], ARGV[3] .. ':' .. threads)
+return threads
+"""
+
+
+class ThreadBudget(object):
+    """
+    Shares a fixed number of threads between the mkhssp jobs on a node.
+
+    A job reserves its threads for at most ttl seconds, so that the threads
+    of a worker that died are returned to the budget eventually.
+    """
+
+    def __init__(self, client, node, budget, ttl):
+        self.client = client
+        self.key = 'threads:' + node
+        self.budget = budget
+        self.ttl = ttl
+
+    def free(self):
+        now = time.time()
+        used = sum(int(m.decode().rsplit(':', 1)[1])
+                   for m in self.client.zrangebyscore(self.key, now, '+inf'))
+        return max(0, self.budget - used)
+
+    def reserve(self, threads, policy):
+        """
+        Reserve the given number of threads. Under the 'adaptive' policy
+        fewer are reserved if the budget doesn't allow for them, but never
+        less than one.
+
+        Jobs aren't held back when the budget is used up, so the budget is
+        only kept if it's at least the number of mkhssp worker processes on
+        the node.
+
+        :return: The id of the reservation and the number of threads.
+        """
+        id_ = uuid.uuid4().hex
+        now = time.time()
+        threads = self.client.eval(_RESERVE_SCRIPT, 1, self.key, now,
+                                   now + self.ttl, id_, self.budget, threads,
+                                   policy)
+        self.client.expire(self.key, int(self.ttl))
+        return id_, int(threads)
+
+    def release(self, id_, threads):
+        self.client.zrem(self.key, '{}:{}'.format(id_, threads))
+
+
+def get_queue_depth(celery_app, queue):
+    """
+    :return: The number of messages waiting in the given queue, or None if
+             the broker can't be asked.
+    """
+    try:
+        with celery_app.connection_or_acquire() as conn:
+            return conn.default_channel.queue_declare(
+                queue=queue, passive=True).message_count
+    except Exception as e:
+        _log.warning("Can't get the depth of queue '{}': {}".format(queue, e))
+        return None
+
+
+@contextmanager
+def mkhssp_threads(celery_app, ttl, queue='mkhssp'):
+    """
+    Reserve threads for a mkhssp job on this node, as many as the
+    MKHSSP_THREAD_POLICY chooses, for the duration of the block.
+
+    The jobs waiting in the given queue, the one the job came from, count as
+    competition for the threads.
+
+    :return: The number of threads to run mkhssp with.
+    """
+    policy = app.config['MKHSSP_THREAD_POLICY']
+    budget = ThreadBudget(get_redis_client(),
+                          app.config['MKHSSP_NODE'] or socket.gethostname(),
+                          app.config['MKHSSP_THREAD_BUDGET'], ttl)
+
+    wanted = 1
+    if policy != 'fixed':
+        # Assume a long queue if its depth is unknown.
+        depth = get_queue_depth(celery_app, queue)
+        if depth is None:
+            depth = budget.budget
+        wanted = choose_threads(policy, depth, budget.free(),
+                                app.config['MKHSSP_MAX_THREADS'])
+
+    id_, threads = budget.reserve(wanted, policy)
+    _log.info("Running mkhssp with {} threads".format(threads))
+    try:
+        yield threads
+    finally:
+        budget.release(id_, threads)
@@ -0,0 +1,171 @@
+import datetime
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import uuid
+
+from xssp_api.controllers.upload import save_structure
+from xssp_api.storage import storage
+
+
+_log = logging.getLogger(__name__)
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ConcatenatedFile(io.RawIOBase):
+    # Reads a list of files as if they were one.
+
+    def __init__(self, paths):
+        self._paths = list(paths)
+        self._f = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while True:
+            if self._f is None:
+                if len(self._paths) == 0:
+                    return 0
+                self._f = open(self._paths.pop(0), 'rb')
+
+            n = self._f.readinto(b)
+            if n > 0:
+                return n
+            self._f.close()
+            self._f = None
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        super(_ConcatenatedFile, self).close()
+
+
+class UploadRegistry(object):
+    """
+    Keeps track of chunked uploads in the 'uploads' collection.
+
+    The parts of an upload are streamed to the upload folder as they arrive
+    and hashed on the way. A part can be sent again, for example after a
+    dropped connection, and then replaces the earlier copy. When all parts
+    are in, they're joined into the structure file by save_structure.
+    """
+
+    def create(self, input_type, output_type, filename, size):
+        upload_id = uuid.uuid4().hex
+        now = datetime.datetime.utcnow()
+        storage.insert_one('uploads', {
+            '_id': upload_id,
+            'input_type': input_type,
+            'output_type': output_type,
+            'filename': filename,
+            'size': size,
+            'parts': {},
+            'created_on': now,
+            'updated_on': now})
+
+        _log.info("Created upload '{}' of {} bytes".format(upload_id, size))
+        return upload_id
+
+    def get(self, upload_id):
+        return storage.find_one('uploads', {'_id': upload_id})
+
+    def part_path(self, folder, upload_id, n):
+        return os.path.join(folder, '{}.part{:05d}'.format(upload_id, n))
+
+    def get_part_paths(self, folder):
+        """Get the paths of the parts received for the unfinished uploads."""
+        return frozenset(self.part_path(folder, doc['_id'], int(k))
+                         for doc in storage.find('uploads', {})
+                         for k in doc['parts'])
+
+    def put_part(self, upload, folder, n, stream, sha256=None):
+        """
+        Save a part of an upload.
+
+        :param sha256: The expected hash of the part, if known.
+        :return: The size and sha256 of the part.
+        :raises ValueError: If the part is larger than the remainder of the
+                            upload or doesn't match the expected hash.
+        """
+        received = sum(p['size'] for k, p in upload['parts'].items()
+                       if k != str(n))
+        max_size = upload['size'] - received
+
+        h = hashlib.sha256()
+        size = 0
+        tmp_file, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(tmp_file, 'wb') as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError("Part {} exceeds the upload size of "
+                                         "{} bytes".format(n, upload['size']))
+                    f.write(chunk)
+                    h.update(chunk)
+
+            if sha256 is not None and sha256.lower() != h.hexdigest():
+                raise ValueError("Part {} doesn't match its sha256".format(n))
+
+            os.replace(tmp_path, self.part_path(folder, upload['_id'], n))
+        finally:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+        storage.update_one('uploads', {'_id': upload['_id']},
+                           {'$set': {'parts.{}'.format(n):
+                                     {'size': size, 'sha256': h.hexdigest()},
+                                     'updated_on': datetime.datetime.utcnow()}})
+        return size, h.hexdigest()
+
+    def finalize(self, upload, folder):
+        """
+        Join the parts of an upload into the structure file, and forget the
+        upload.
+
+        :return: The path of the saved file and the sha256 of its content.
+        :raises ValueError: If parts are missing, or a compressed upload is
+                            corrupt.
+        """
+        ns = sorted(int(k) for k in upload['parts'])
+        received = sum(p['size'] for p in upload['parts'].values())
+        if ns != list(range(len(ns))) or received != upload['size']:
+            raise ValueError("Received {} of {} bytes in parts {}".format(
+                received, upload['size'], ns))
+
+        paths = [self.part_path(folder, upload['_id'], n) for n in ns]
+        stream = io.BufferedReader(_ConcatenatedFile(paths), CHUNK_SIZE)
+        path, file_hash = save_structure(stream, upload['filename'], folder)
+
+        self._remove(upload, folder)
+        return path, file_hash
+
+    def clean(self, folder, max_age):
+        """
+        Remove the uploads that haven't received a part for max_age.
+
+        :return: The number of removed uploads.
+        """
+        docs = storage.find('uploads', {'updated_on': {
+            '$lt': datetime.datetime.utcnow() - max_age}})
+        for doc in docs:
+            self._remove(doc, folder)
+
+        return len(docs)
+
+    def _remove(self, upload, folder):
+        for k in upload['parts']:
+            try:
+                os.remove(self.part_path(folder, upload['_id'], int(k)))
+            except FileNotFoundError:
+                pass
+        storage.delete_one('uploads', {'_id': upload['_id']})
+
+
+uploads = UploadRegistry()
@@ -1,17 +1,33 @@
 import logging
-import os
+import uuid
 
 from flask import current_app as app
 from werkzeug.utils import secure_filename
 
+from xssp_api.controllers.identify import (get_databank_version, get_file_hash,
+                                           get_input_hash, normalize_sequence)
+from xssp_api.controllers.cost import (get_sequence_cost, get_structure_size,
+                                       get_tier)
+from xssp_api.controllers.upload import save_structure
+from xssp_api.services.databanks import get_entry_path
+from xssp_api.services.groups import groups
+from xssp_api.services.jobs import jobs
+from xssp_api.services.lease import get_lease
+
 _log = logging.getLogger(__name__)
 
 
 def process_request(input_type, output_type, pdb_id=None, uploaded_files=None,
-                    sequence=None):
-    # Save the PDB file if necessary
-    file_path = None
-    if input_type == 'pdb_file':
+                    sequence=None, file_path=None, file_hash=None,
+                    subscriber=None):
+    # The subscriber is the token with which the request may cancel the job,
+    # see JobRegistry.unsubscribe. Without one, as for batches, the job keeps
+    # running for this request.
+    subscriber = subscriber or uuid.uuid4().hex
+
+    # Save the PDB file if necessary. A file that was already saved, for
+    # example by a chunked upload, is passed with its hash.
+    if input_type == 'pdb_file' and file_path is None:
         assert 'file_' in uploaded_files
         pdb_file = uploaded_files['file_']
         assert hasattr(pdb_file, 'filename')
@@ -20,8 +36,8 @@ def process_request(input_type, output_type, pdb_id=None, uploaded_files=None,
         if len(filename) == 0:
             raise RuntimeError("upload secure filename is an empty string")
 
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        pdb_file.save(file_path)
+        file_path, file_hash = save_structure(pdb_file.stream, filename,
+                                              app.config['UPLOAD_FOLDER'])
         _log.debug("User uploaded '{}'. File saved to {}".format(
             pdb_file.filename, file_path))
 
@@ -32,13 +48,112 @@ def process_request(input_type, output_type, pdb_id=None, uploaded_files=None,
 
     strategy = XsspStrategyFactory.create(input_type, output_type, pdb_id,
                                           file_path, sequence)
-    _log.debug("Using '{}'".format(strategy.__class__.__name__))
-    celery_id = strategy()
-    _log.info("Job has id '{}'".format(celery_id))
+
+    # Answer with a previous job's id if the same input has been processed
+    # before against the same version of the databanks, or is being
+    # processed right now. Submissions of the same input are serialized by a
+    # short lease, so that they can't both miss and queue a job.
+    input_hash = get_request_hash(input_type, output_type, pdb_id, file_path,
+                                  sequence, file_hash)
+    lease = get_lease('submit:' + input_hash, uuid.uuid4().hex,
+                      app.config['SUBMIT_LEASE_TTL'])
+    if not lease.acquire(timeout=app.config['SUBMIT_LEASE_TTL']):
+        _log.warning("Submitting '{}' without lease".format(input_hash))
+    try:
+        celery_id = jobs.find(input_type, output_type, input_hash, subscriber)
+        if celery_id is not None:
+            return celery_id
+
+        _log.debug("Using '{}'".format(strategy.__class__.__name__))
+        celery_id = strategy()
+        _log.info("Job has id '{}'".format(celery_id))
+
+        jobs.register(celery_id, input_type, output_type, input_hash,
+                      strategy.queue, strategy.features, subscriber)
+    finally:
+        lease.release()
 
     return celery_id
 
 
+def process_batch(input_type, output_type, entries):
+    """
+    Create a job for every distinct input of a batch, and a group of them.
+
+    Sequences are compared without their FASTA description, so members with
+    the same sequence share the job of the first of them, and its output.
+
+    :param entries: A list of tuples of a name and a pdb id or sequence.
+    :return: The id of the group.
+    """
+    task_ids = {}
+    members = []
+    for name, input_data in entries:
+        if input_type == 'sequence':
+            key = normalize_sequence(input_data).split('\n', 1)[1]
+            if key not in task_ids:
+                task_ids[key] = process_request(input_type, output_type,
+                                                sequence=input_data)
+        else:
+            key = input_data.lower()
+            if key not in task_ids:
+                task_ids[key] = process_request(input_type, output_type,
+                                                pdb_id=input_data)
+        members.append((name, task_ids[key]))
+
+    _log.info("Batch of {} has {} distinct inputs".format(len(entries),
+                                                          len(task_ids)))
+    return groups.create(input_type, output_type, members)
+
+
+def get_request_hash(input_type, output_type, pdb_id=None, file_path=None,
+                     sequence=None, file_hash=None):
+    """
+    Get the hash of the normalized input, the output type and the version of
+    the databanks the output is made from.
+
+    The hash of an uploaded file is computed from file_path unless it's
+    passed as file_hash.
+    """
+    if input_type in ['pdb_id', 'pdb_redo_id']:
+        input_data = pdb_id.lower()
+    elif input_type == 'pdb_file':
+        input_data = file_hash or get_file_hash(file_path)
+    elif input_type == 'sequence':
+        input_data = normalize_sequence(sequence)
+    else:
+        raise ValueError("Unexpected input type '{}'".format(input_type))
+
+    databank_paths = _get_databank_paths(input_type, output_type, input_data)
+    return get_input_hash(input_type, output_type, input_data,
+                          get_databank_version(databank_paths))
+
+
+def _get_databank_paths(input_type, output_type, input_data):
+    if input_type in ['pdb_id', 'pdb_redo_id']:
+        try:
+            return [get_entry_path(input_type, output_type, input_data)]
+        except ValueError:
+            return []
+    elif output_type == 'hg_hssp':
+        return [app.config['HG_HSSP_DATABANK'] + '.psq']
+    elif output_type in ['hssp_hssp', 'hssp_stockholm']:
+        return app.config['XSSP_DATABANKS']
+
+    return []
+
+
+def get_mkhssp_queue(cost):
+    """Get the mkhssp queue for a job of the given cost."""
+    tier = get_tier(cost, app.config['MKHSSP_COST_TIERS'])
+    _log.debug("Routing mkhssp job of cost {} to tier '{}'".format(cost, tier))
+    return 'mkhssp_' + tier
+
+
+def _get_queue(task):
+    return task.queue or app.config['CELERY_DEFAULT_QUEUE']
+
+
 class XsspStrategyFactory(object):
     @classmethod
     def create(cls, input_type, output_type, pdb_id, pdb_file_path, seq):
@@ -58,6 +173,8 @@ class PdbIdStrategy(object):
     def __init__(self, output_format, pdb_id):
         self.output_format = output_format
         self.pdb_id = pdb_id
+        self.queue = None
+        self.features = {}
 
     def __call__(self):
         from xssp_api.tasks import get_task
@@ -69,6 +186,7 @@ class PdbIdStrategy(object):
         else:
             result = task.delay(self.pdb_id)
 
+        self.queue = _get_queue(task)
         return result.id
 
 
@@ -76,6 +194,8 @@ class PdbRedoIdStrategy(object):
     def __init__(self, output_format, pdb_redo_id):
         self.output_format = output_format
         self.pdb_redo_id = pdb_redo_id
+        self.queue = None
+        self.features = {}
 
     def __call__(self):
         from xssp_api.tasks import get_task
@@ -84,6 +204,8 @@ class PdbRedoIdStrategy(object):
 
         if self.output_format == 'dssp':
             result = task.delay(self.pdb_redo_id)
+
+        self.queue = _get_queue(task)
         return result.id
 
 
@@ -91,16 +213,24 @@ class SequenceStrategy(object):
     def __init__(self, output_format, sequence):
         self.output_format = output_format
         self.sequence = sequence
+        self.queue = None
+        self.features = {}
 
     def __call__(self):
         from xssp_api.tasks import get_task
         task = get_task('sequence', self.output_format)
         _log.debug("Calling task '{}'".format(task.__name__))
 
+        self.features = {'residues': get_sequence_cost(self.sequence),
+                         'chains': 1}
+
         if 'hg_hssp' in self.output_format:
             result = task.delay(self.sequence)
+            self.queue = _get_queue(task)
         elif 'hssp' in self.output_format:
-            result = task.delay(self.sequence, self.output_format)
+            self.queue = get_mkhssp_queue(self.features['residues'])
+            result = task.apply_async((self.sequence, self.output_format),
+                                      queue=self.queue)
         return result.id
 
 
@@ -108,11 +238,22 @@ class PdbContentStrategy(object):
     def __init__(self, output_format, pdb_file_path):
         self.output_format = output_format
         self.pdb_file_path = pdb_file_path
+        self.queue = None
+        self.features = {}
 
     def __call__(self):
         from xssp_api.tasks import get_task
         task = get_task('pdb_file', self.output_format)
         _log.debug("Calling task '{}'".format(task.__name__))
 
-        result = task.delay(self.pdb_file_path, self.output_format)
+        residues, chains = get_structure_size(self.pdb_file_path)
+        self.features = {'residues': residues, 'chains': chains}
+
+        if 'hssp' in self.output_format:
+            self.queue = get_mkhssp_queue(self.features['residues'])
+            result = task.apply_async((self.pdb_file_path, self.output_format),
+                                      queue=self.queue)
+        else:
+            result = task.delay(self.pdb_file_path, self.output_format)
+            self.queue = _get_queue(task)
         return result.id
@@ -51,6 +51,9 @@ class Storage(object):
         assert self._db is not None
 
         self.db['tasks'].create_index([('task_id', ASCENDING)])
+        self.db['tasks'].create_index([('input_hash', ASCENDING)])
+        self.db['tasks'].create_index([('queue', ASCENDING),
+                                       ('created_on', ASCENDING)])
 
     def insert_one(self, collection, document):
         if self._db is None:
@@ -58,6 +61,18 @@ class Storage(object):
 
         self._db[collection].insert_one(document)
 
+    def update_one(self, collection, selector, update, upsert=False):
+        if self._db is None:
+            raise Exception("Not connected to storage. Did you call connect()?")
+
+        return self._db[collection].update_one(selector, update, upsert=upsert)
+
+    def delete_one(self, collection, selector):
+        if self._db is None:
+            raise Exception("Not connected to storage. Did you call connect()?")
+
+        return self._db[collection].delete_one(selector)
+
     def remove(self, collection, spec_or_id=None):
         if self._db is None:
             raise Exception("Not connected to storage. Did you call connect()?")
@@ -65,12 +80,12 @@ class Storage(object):
         _log.info("Removing documents from '{}'".format(collection))
         return self._db[collection].remove(spec_or_id)
 
-    def find(self, collection, selector):
+    def find(self, collection, selector, sort=None, limit=0):
         if self._db is None:
             raise Exception("Not connected to storage. Did you call connect()?")
 
         _log.info("Querying documents in '{}'".format(collection))
-        cursor = self._db[collection].find(selector)
+        cursor = self._db[collection].find(selector, sort=sort, limit=limit)
         return [d for d in cursor]
 
     def find_one(self, collection, selector):
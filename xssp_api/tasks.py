@@ -2,25 +2,40 @@ import bz2
 import logging
 import os
 import re
-import shutil
-import subprocess
+import signal
 import tempfile
 import textwrap
 import uuid
 import datetime
+from contextlib import contextmanager
 from typing import List
 
-from filelock import FileLock
-from celery import current_app as celery_app
-from celery.signals import setup_logging, task_prerun, task_failure
+from celery import current_app as celery_app, current_task
+from celery.signals import (setup_logging, task_prerun, task_postrun,
+                            task_failure)
+from celery.worker.control import control_command
 from flask import current_app as flask_app
 
 from xssp_api.frontend.validators import RE_FASTA_DESCRIPTION
 from xssp_api.storage import storage
 
-from xssp_api.controllers.identify import get_identifier
-from xssp_api.controllers.blast import blast_databank
+from xssp_api.controllers.identify import get_databank_version, get_identifier
+from xssp_api.controllers.blast import find_exact_sequence, iter_blast_hits
+from xssp_api.controllers.kmer import get_kmer_index
+from xssp_api.controllers.upload import clean_uploads, get_structure_id
 from xssp_api.domain.method import is_almost_same
+from xssp_api.services.blast_batch import get_blast_batcher
+from xssp_api.services.blobs import (get_blob_store, store_result,
+                                     store_result_file)
+from xssp_api.services.commands import (Command, get_task_limits,
+                                        update_task_doc)
+from xssp_api.services.databanks import get_entry_path
+from xssp_api.services.eta import get_runtime_models
+from xssp_api.services.lease import get_lease
+from xssp_api.services.results import get_file_version
+from xssp_api.services.stockholm_cache import get_stockholm_cache
+from xssp_api.services.threads import mkhssp_threads
+from xssp_api.services.uploads import uploads
 
 _log = logging.getLogger(__name__)
 
@@ -42,31 +57,105 @@ def task_failure_handler(task_id, exception, *args, **kwargs):
     _log.exception(f"on task id: {task_id}")
 
 
-tmp_dir_path = tempfile.gettempdir()
+@task_prerun.connect
+def task_prerun_handler(task_id, task, *args, **kwargs):
+    # The runtimes of jobs are recorded to predict those of later jobs.
+    storage.update_one('tasks', {'task_id': task_id},
+                       {'$set': {'started_on': datetime.datetime.utcnow(),
+                                 'hostname': task.request.hostname}},
+                       upsert=True)
 
-def _strip_remarks_(pdb_path: str):
 
-    if os.path.isfile(pdb_path):
+@task_postrun.connect
+def task_postrun_handler(task_id, task, *args, state=None, **kwargs):
+    if state == 'RETRY':
+        # The task is waiting in the queue again.
+        update = {'$unset': {'started_on': ''},
+                  '$set': {'retried_on': datetime.datetime.utcnow()}}
+    else:
+        update = {'$set': {'finished_on': datetime.datetime.utcnow(),
+                           'state': state}}
+    storage.update_one('tasks', {'task_id': task_id}, update, upsert=True)
+
+
+@control_command(args=[('pid', int)], signature='<pid>')
+def kill_subprocess(state, pid):
+    """
+    Kill a command started by Command on this worker, together with any
+    processes it started.
+    """
+    try:
+        # The command leads a session of its own.
+        if os.getsid(pid) != pid:
+            return {'error': 'process {} is not a session leader'.format(pid)}
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        return {'ok': 'process {} has already exited'.format(pid)}
+    return {'ok': 'killed process {}'.format(pid)}
+
+
+def cancel_task(task_id):
+    """
+    Revoke a task. If it's running a command, the command is killed, so that
+    the task fails fast and cleans up after itself.
+    """
+    storage.update_one('tasks', {'task_id': task_id},
+                       {'$set': {'cancelled': True}}, upsert=True)
+    celery_app.control.revoke(task_id)
+    celery_app.backend.mark_as_revoked(task_id, reason='cancelled')
+
+    # A command started after this is killed by Command itself.
+    doc = storage.find_one('tasks', {'task_id': task_id}) or {}
+    if doc.get('pid') is not None and doc.get('hostname') is not None:
+        _log.info("Killing process {} of task '{}' on '{}'".format(
+            doc['pid'], task_id, doc['hostname']))
+        celery_app.control.broadcast('kill_subprocess',
+                                     arguments={'pid': doc['pid']},
+                                     destination=[doc['hostname']])
 
-        tmp_path = os.path.join(tmp_dir_path, uuid.uuid4().hex + ".pdb")
-        with open(tmp_path, 'wt') as tmp_file:
-            with open(pdb_path, 'rt') as pdb_file:
-                for line in pdb_file:
-                    if not line.startswith("REMARK "):
-                        tmp_file.write(line)
 
-        shutil.move(tmp_path, pdb_path)
+# Size of the chunks in which subprocess output is streamed.
+CHUNK_SIZE = 64 * 1024
 
 
 def _execute_subprocess(args: List[str]):
+    """
+    Runs the command, see Command, and returns its stdout and stderr.
+    """
+
+    with Command(args) as command:
+        output = command.stdout.read()
+    return output, command.stderr
 
-    _log.info("Running command '{}'".format(args))
-    p = subprocess.run(args, capture_output=True, text=True)
 
-    if p.returncode != 0:
-        raise RuntimeError(f"{args} error:\n{p.stderr}")
+@contextmanager
+def _mkhssp_threads():
+    """
+    Reserves threads for mkhssp on this node for as long as the task may run
+    and records their number on the task document.
+    """
+
+    ttl = get_task_limits().get('timeout') or 24 * 3600
+    queue = 'mkhssp'
+    if current_task and current_task.request.delivery_info:
+        queue = current_task.request.delivery_info.get('routing_key', queue)
+    with mkhssp_threads(celery_app, ttl, queue) as threads:
+        update_task_doc({'$set': {'threads': threads}})
+        yield threads
+
+
+def _set_result_path(path: str):
+    """
+    Records that the output of the current task is also stored, bzip2
+    compressed, at the given path, so that downloads can be served from there.
+
+    The file may be replaced later, e.g. by a refresh of the stockholm cache,
+    so its version is recorded too. See get_stored_result.
+    """
 
-    return p.stdout, p.stderr
+    if current_task and current_task.request.id is not None:
+        update_task_doc({'$set': {'result_path': path,
+                                   'result_version': get_file_version(path)}})
 
 
 def should_log(exception):
@@ -79,51 +168,96 @@ def should_log(exception):
 
 @celery_app.task(bind=True)
 def mkdssp_from_pdb(self, pdb_file_path, output_format):
-    """Creates a DSSP file from the given pdb file path."""
+    """
+    Creates a DSSP file from the given pdb file path.
 
-    try:
-        _strip_remarks_(pdb_file_path)
+    The uploaded file is kept, so that later jobs for the same structure can
+    use it. Old uploads are removed by clean_uploads.
+    """
 
-        args = ['mkdssp', '--output-format', output_format, pdb_file_path]
-        output, error = _execute_subprocess(args)
-        if len(output.strip()) == 0:
-            raise RuntimeError(error)
-    finally:
-        _log.debug("Deleting PDB file '{}'".format(pdb_file_path))
-        os.remove(pdb_file_path)
+    args = ['mkdssp', '--output-format', output_format, pdb_file_path]
+    output, error = _execute_subprocess(args)
+    if len(output.strip()) == 0:
+        raise RuntimeError(error)
 
-    return output
+    return store_result(output)
+
+
+def _get_cached_output(stockholm_cache, id_, databank_version, output_format,
+                       count=True):
+    # The classic HSSP format is derived from the cached stockholm output when
+    # it's first asked for. It's returned as the path of the derived file,
+    # so that it's never loaded, see _store_cached_output.
+    if output_format == 'hssp_hssp':
+        return stockholm_cache.get_hssp_path(id_, databank_version,
+                                             _stream_stockholm_to_hssp, count)
+    return stockholm_cache.get(id_, databank_version, count)
+
+
+def _store_cached_output(output, output_format):
+    if output_format == 'hssp_hssp':
+        return store_result_file(output)
+    return store_result(output)
+
+
+def _set_served_from_cache():
+    # The runtime of the task says nothing about that of mkhssp, see
+    # xssp_api.services.eta.
+    update_task_doc({'$set': {'cached': True}})
+
+
+def _set_cached_result_path(stockholm_cache, id_, output_format):
+    if output_format == 'hssp_hssp':
+        _set_result_path(stockholm_cache.hssp_path(id_))
+    else:
+        _set_result_path(stockholm_cache.path(id_))
 
 
 @celery_app.task(bind=True, queue='mkhssp')
 def mkhssp_from_pdb(self, pdb_file_path, output_format):
-    """Creates a HSSP file from the given pdb file path."""
-
-    try:
-        _strip_remarks_(pdb_file_path)
+    """
+    Creates a HSSP file from the given pdb file path.
 
-        args = ['mkhssp', '-i', pdb_file_path, '-a', '1', '-m', '1000']
-        for d in flask_app.config['XSSP_DATABANKS']:
-            args.extend(['-d', d])
+    Uploads are named by the hash of their content, which also identifies
+    their stockholm output in the stockholm cache. A structure that was
+    uploaded before is served from the cache without running mkhssp, unless
+    its entry was made from older databanks.
+    """
 
-        output, error = _execute_subprocess(args)
-        if len(output.strip()) == 0:
+    structure_id = 'pdb_' + get_structure_id(pdb_file_path)
+    databank_version = get_databank_version(flask_app.config['XSSP_DATABANKS'])
+    stockholm_cache = get_stockholm_cache()
+
+    output, stale = _get_cached_output(stockholm_cache, structure_id,
+                                       databank_version, output_format)
+    if output is None or stale:
+        with _mkhssp_threads() as threads:
+            args = ['mkhssp', '-i', pdb_file_path, '-a', str(threads),
+                    '-m', '1000']
+            for d in flask_app.config['XSSP_DATABANKS']:
+                args.extend(['-d', d])
+
+            stockholm, error = _execute_subprocess(args)
+        if len(stockholm.strip()) == 0:
             raise RuntimeError(error)
+        stockholm_cache.put(structure_id, stockholm, databank_version)
+
+        output, _ = _get_cached_output(stockholm_cache, structure_id,
+                                       databank_version, output_format,
+                                       count=False)
+        if output is None:
+            raise RuntimeError("Stockholm cache entry '{}' disappeared".format(
+                structure_id))
+    else:
+        _set_served_from_cache()
 
-        if output_format == 'hssp_hssp':
-
-            return _stockholm_to_hssp(output)
-        else:
-            return output
-    finally:
-        _log.debug("Deleting PDB file '{}'".format(pdb_file_path))
-        os.remove(pdb_file_path)
+    _set_cached_result_path(stockholm_cache, structure_id, output_format)
+    return _store_cached_output(output, output_format)
 
 
-@celery_app.task(queue='mkhssp')
-def mkhssp_from_sequence(sequence, output_format):
+def _mkhssp_from_sequence(sequence):
     """
-    Creates a HSSP file from the given sequence.
+    Runs mkhssp on the given sequence and returns the stockholm output.
 
     mkhssp accepts a FASTA file as input. The given sequence is saved to a
     temporary file which is passed as the input argument.
@@ -133,56 +267,112 @@ def mkhssp_from_sequence(sequence, output_format):
 
     # The temporary file name must end in .fasta, otherwise mkhssp assumes it's
     # a PDB file.
+    tmp_file, tmp_path = tempfile.mkstemp(prefix='hssp_api_tmp', suffix='.fasta')
+    os.close(tmp_file)
 
-    sequence_id = get_identifier(sequence)
-    stockholm_cache_dir = flask_app.config["HSSP_STO_CACHE"]
-    stockholm_file_path = os.path.join(stockholm_cache_dir, sequence_id + ".sto.bz2")
+    with open(tmp_path, 'wt') as f:
+
+        _log.debug("Writing data to '{}'".format(tmp_path))
+        m = re.search(RE_FASTA_DESCRIPTION, sequence)
+        if not m:
+            f.write('>Input\n' + sequence)
+        else:
+            f.write(m.group())
+            sequence = re.sub(RE_FASTA_DESCRIPTION, '', sequence)
+        # The fasta format recommends that all lines be less than 80 chars.
+        f.write(textwrap.fill(sequence, 79))
 
     try:
-        lock_path = stockholm_file_path + ".lock"
-        with FileLock(lock_path):
-
-            if os.path.isfile(stockholm_file_path):
-                with bz2.open(stockholm_file_path, 'rt') as f:
-                    output = f.read()
-            else:
-                tmp_file, tmp_path = tempfile.mkstemp(prefix='hssp_api_tmp', suffix='.fasta')
-                os.close(tmp_file)
-
-                with open(tmp_path, 'wt') as f:
-
-                    _log.debug("Writing data to '{}'".format(tmp_path))
-                    m = re.search(RE_FASTA_DESCRIPTION, sequence)
-                    if not m:
-                        f.write('>Input\n' + sequence)
-                    else:
-                        f.write(m.group())
-                        sequence = re.sub(RE_FASTA_DESCRIPTION, '', sequence)
-                    # The fasta format recommends that all lines be less than 80 chars.
-                    f.write(textwrap.fill(sequence, 79))
-
-                args = ['mkhssp', '-a', '1', '-m', '1000', '-i', tmp_path]
-                for databank_path in flask_app.config['XSSP_DATABANKS']:
-                    args.extend(['-d', databank_path])
-
-                try:
-                    output, error = _execute_subprocess(args)
-
-                    # store in cache
-                    if len(output) > 0:
-                        with bz2.open(stockholm_file_path, 'wt') as f:
-                            f.write(output)
-                    else:
-                        raise RuntimeError(error)
-                finally:
-                    os.remove(tmp_path)
+        with _mkhssp_threads() as threads:
+            args = ['mkhssp', '-a', str(threads), '-m', '1000', '-i', tmp_path]
+            for databank_path in flask_app.config['XSSP_DATABANKS']:
+                args.extend(['-d', databank_path])
+
+            output, error = _execute_subprocess(args)
+        if len(output) == 0:
+            raise RuntimeError(error)
     finally:
-        os.remove(lock_path)
+        os.remove(tmp_path)
 
-    if output_format == 'hssp_hssp':
-        return _stockholm_to_hssp(output)
+    return output
+
+
+@celery_app.task(bind=True, queue='mkhssp', max_retries=None)
+def mkhssp_from_sequence(self, sequence, output_format):
+    """
+    Creates a HSSP file from the given sequence.
+
+    The stockholm output is cached per sequence. A cached stockholm file that
+    was made from older databanks may be served while a fresh one is made in
+    the background.
+
+    Only the task holding the lease on the sequence runs mkhssp. Other tasks
+    for the same sequence give up their worker slot and are retried until the
+    output is in the cache, or until the lease expires because its holder died.
+    """
+
+    sequence_id = get_identifier(sequence)
+    databank_version = get_databank_version(flask_app.config['XSSP_DATABANKS'])
+    stockholm_cache = get_stockholm_cache()
+
+    output, stale = _get_cached_output(stockholm_cache, sequence_id,
+                                       databank_version, output_format)
+    if output is None:
+        owner = self.request.id or uuid.uuid4().hex
+        lease = get_lease('mkhssp:' + sequence_id, owner)
+        if not lease.acquire():
+            _log.info("Waiting for '{}' to finish '{}'".format(lease.holder(),
+                                                              sequence_id))
+            raise self.retry(countdown=flask_app.config['LEASE_RETRY_INTERVAL'])
+
+        try:
+            with lease.heartbeat():
+                # The previous holder may have finished in the meantime.
+                if not stockholm_cache.contains(sequence_id, databank_version):
+                    stockholm = _mkhssp_from_sequence(sequence)
+                    stockholm_cache.put(sequence_id, stockholm,
+                                        databank_version)
+        finally:
+            lease.release()
+
+        output, stale = _get_cached_output(stockholm_cache, sequence_id,
+                                           databank_version, output_format,
+                                           count=False)
+        if output is None:
+            raise RuntimeError("Stockholm cache entry '{}' disappeared".format(
+                sequence_id))
     else:
-        return output
+        _set_served_from_cache()
+        if stale and stockholm_cache.start_refresh(sequence_id):
+            refresh_stockholm_cache.delay(sequence)
+
+    _set_cached_result_path(stockholm_cache, sequence_id, output_format)
+    return _store_cached_output(output, output_format)
+
+
+@celery_app.task(queue='mkhssp_refresh')
+def refresh_stockholm_cache(sequence):
+    """
+    Replaces a stale stockholm cache entry by one made from the current
+    databanks.
+
+    The entry is replaced atomically, so requests for the same sequence keep
+    being served the stale entry in the meantime.
+    """
+
+    sequence_id = get_identifier(sequence)
+    databank_version = get_databank_version(flask_app.config['XSSP_DATABANKS'])
+    stockholm_cache = get_stockholm_cache()
+
+    _log.info("Refreshing stockholm cache entry '{}'".format(sequence_id))
+    try:
+        output = _mkhssp_from_sequence(sequence)
+    except Exception:
+        stockholm_cache.end_refresh(sequence_id)
+        raise
+
+    stockholm_cache.put(sequence_id, output, databank_version)
+
 
 @celery_app.task
 def get_hssp(pdb_id, output_type):
@@ -191,14 +381,9 @@ def get_hssp(pdb_id, output_type):
                                                                  output_type))
 
     # Determine path to hssp file and check that it exists.
-    if output_type == 'hssp_hssp':
-        hssp_path = os.path.join(flask_app.config['HSSP_ROOT'],
-                                 pdb_id + '.hssp.bz2')
-    elif output_type == 'hssp_stockholm':
-        hssp_path = os.path.join(flask_app.config['HSSP_STO_ROOT'],
-                                 pdb_id + '.hssp.bz2')
-    else:
+    if output_type not in ['hssp_hssp', 'hssp_stockholm']:
         raise ValueError("Unexepected output type '{}'".format(output_type))
+    hssp_path = get_entry_path('pdb_id', output_type, pdb_id)
 
     if not os.path.exists(hssp_path):
         raise RuntimeError("File not found: '{}'".format(hssp_path))
@@ -207,18 +392,43 @@ def get_hssp(pdb_id, output_type):
     _log.info("Unzipping '{}'".format(hssp_path))
     with bz2.open(hssp_path, 'rt') as f:
         hssp_content = f.read()
-    return hssp_content
+    _set_result_path(hssp_path)
+    return store_result(hssp_content)
 
 
 @celery_app.task
 def get_hg_hssp(sequence):
+    """
+    Gets the HSSP file of a chain with exactly the given sequence from the
+    sequence index, or else of a chain that is almost the same as the given
+    sequence. Such chains are looked for among the candidates from the k-mer
+    index first, and then among the blastp hits. blastp is stopped as soon
+    as such a hit is found, unless it runs the queries of other tasks too,
+    see HG_HSSP_BATCH_WINDOW.
+    """
     _log.info("Getting hg-hssp data for '{}'".format(sequence))
 
-    hits = blast_databank(sequence, flask_app.config['HG_HSSP_DATABANK'])
-    for hitID in hits:
-        path, chain = hitID.split(':')
+    databank_path = flask_app.config['HG_HSSP_DATABANK']
+    for path, chain in find_exact_sequence(sequence, databank_path):
+        if os.path.exists(path):
+            _log.info("Exact match in '{}' chain {}".format(path, chain))
+            return _get_hg_hssp_file(path)
+
+    kmer_index = get_kmer_index(databank_path)
+    if kmer_index is not None:
+        for path, chain in kmer_index.find(sequence):
+            if os.path.exists(path):
+                _log.info("k-mer match in '{}' chain {}".format(path, chain))
+                return _get_hg_hssp_file(path)
+
+    if flask_app.config['HG_HSSP_BATCH_WINDOW'] > 0:
+        hits = get_blast_batcher(databank_path).search(sequence)
+    else:
+        hits = iter_blast_hits(sequence, databank_path)
+    try:
+        for hit_id, alignment in hits:
+            path, chain = hit_id.rsplit(':', 1)
 
-        for alignment in hits[hitID]:
             _log.debug("query:  {}".format(alignment.query_alignment))
             _log.debug("subject:{}".format(alignment.subj_alignment))
 
@@ -227,22 +437,29 @@ def get_hg_hssp(sequence):
                 if not os.path.exists(path):
                     continue
 
-                # Unzip the file and return the contents
-                _log.info("Unzipping '{}'".format(path))
-                with bz2.open(path, 'rt') as f:
-                    content = f.read()
-                return content
+                return _get_hg_hssp_file(path)
+    finally:
+        hits.close()
 
     raise RuntimeError("No hits")
 
 
+def _get_hg_hssp_file(path):
+    # Unzip the file and return the contents
+    _log.info("Unzipping '{}'".format(path))
+    with bz2.open(path, 'rt') as f:
+        content = f.read()
+    _set_result_path(path)
+    return store_result(content)
+
+
 @celery_app.task
 def get_dssp(pdb_id):
     pdb_id = pdb_id.lower()
     _log.info("Getting dssp data for '{}'".format(pdb_id))
 
     # Determine path to hssp file and check that it exists.
-    dssp_path = os.path.join(flask_app.config['DSSP_ROOT'], pdb_id + '.dssp')
+    dssp_path = get_entry_path('pdb_id', 'dssp', pdb_id)
     if not os.path.exists(dssp_path):
         raise RuntimeError("File not found: '{}'".format(dssp_path))
 
@@ -250,7 +467,7 @@ def get_dssp(pdb_id):
     _log.info("Reading '{}'".format(dssp_path))
     with open(dssp_path, 'rt') as f:
         dssp_content = f.read()
-    return dssp_content
+    return store_result(dssp_content)
 
 
 @celery_app.task
@@ -259,8 +476,7 @@ def get_dssp_redo(pdb_redo_id):
     _log.info("Getting dssp data for redo '{}'".format(pdb_redo_id))
 
     # Determine path to hssp file and check that it exists.
-    dssp_path = os.path.join(flask_app.config['DSSP_REDO_ROOT'],
-                             pdb_redo_id + '.dssp')
+    dssp_path = get_entry_path('pdb_redo_id', 'dssp', pdb_redo_id)
     if not os.path.exists(dssp_path):
         raise RuntimeError("File not found: '{}'".format(dssp_path))
 
@@ -268,7 +484,7 @@ def get_dssp_redo(pdb_redo_id):
     _log.info("Reading '{}'".format(dssp_path))
     with open(dssp_path, 'rt') as f:
         dssp_content = f.read()
-    return dssp_content
+    return store_result(dssp_content)
 
 
 def get_task(input_type, output_type):
@@ -310,26 +526,53 @@ def get_task(input_type, output_type):
     return task
 
 
-def _stockholm_to_hssp(stockholm_content):
-    _log.info("Converting stockholm to hssp")
+def _stream_stockholm_to_hssp(stockholm_path: str):
+    """
+    Converts the given stockholm file to the classic HSSP format, yielding
+    the output in chunks as hsspconv writes it.
 
-    tmp_file, tmp_path = tempfile.mkstemp(prefix='hssp_api_tmp', suffix='.hssp')
-    os.close(tmp_file)
+    hsspconv reads the (bzip2 compressed) file itself, so the stockholm
+    content doesn't need to be loaded or copied to a temporary file.
+    """
 
-    try:
-        with open(tmp_path, 'wt') as f:
-            f.write(stockholm_content)
+    args = ['hsspconv', '-i', stockholm_path]
+    length = 0
+    with Command(args) as command:
+        for chunk in iter(lambda: command.stdout.read(CHUNK_SIZE), ''):
+            length += len(chunk)
+            yield chunk
 
-        args = ['hsspconv', '-i', tmp_path]
+    if length == 0:
+        raise RuntimeError(f"{args} error:\n{command.stderr}")
 
-        output, error = _execute_subprocess(args)
 
-        if len(output) == 0:
-            raise RuntimeError(error)
-    finally:
-        os.remove(tmp_path)
+@celery_app.task
+def clean_stockholm_cache():
+    get_stockholm_cache().sync(
+        get_databank_version(flask_app.config['XSSP_DATABANKS']))
 
-    return output
+
+@celery_app.task
+def clean_uploads_folder():
+    n = uploads.clean(flask_app.config['UPLOAD_FOLDER'],
+                      flask_app.config['UPLOAD_MAX_AGE'])
+    _log.info("Removed {} unfinished chunked uploads".format(n))
+    # A paused upload may have parts older than UPLOAD_MAX_AGE, while it
+    # received a part since.
+    folder = flask_app.config['UPLOAD_FOLDER']
+    n = clean_uploads(folder, flask_app.config['UPLOAD_MAX_AGE'],
+                      uploads.get_part_paths(folder))
+    _log.info("Removed {} old uploads".format(n))
+
+
+@celery_app.task
+def clean_blobs():
+    get_blob_store().clean(flask_app.config['BLOB_MAX_AGE'])
+
+
+@celery_app.task
+def fit_runtime_models():
+    get_runtime_models().fit()
 
 
 @celery_app.task
@@ -338,3 +581,6 @@ def remove_old_tasks():
     storage.remove('tasks', {'created_on': {
         '$lt': datetime.datetime.utcnow() - datetime.timedelta(days=30)
     }})
+    storage.remove('groups', {'created_on': {
+        '$lt': datetime.datetime.utcnow() - datetime.timedelta(days=30)
+    }})